@@ -1,5 +1,5 @@
 import random
-import adafruit_ticks as ticks
+import timebase as ticks
 import midi
 from utils import next_or_previous_index
 from clock import clock
@@ -18,6 +18,7 @@ class Arpeggiator:
         arp_play_index (int): The index of the currently playing arpeggiated note.
         arp_prev_play_index (int): The index of the previously played arpeggiated note.
         arp_length (str): The length of the arpeggiator notes.
+        arp_length_idx (int): Index of arp_length in the clock duration tables.
         last_played_note (tuple): The last played arpeggiated note.
         encoder_step_counter (int): The counter for encoder steps.
         arp_direction (str): The type of arpeggiator.
@@ -38,6 +39,7 @@ class Arpeggiator:
         set_arp_octave(): Sets the octave of the arpeggiator.
         set_arp_length(): Sets the length of the arpeggiator notes.
         has_arp_notes(): Checks if the arpeggiator has any notes.
+        on_tempo_change(bpm_last, bpm): Rescales the pending note offs to a new tempo.
     """
 
     def __init__(self, arp_direction="up", arp_length="1/8"):
@@ -48,9 +50,11 @@ class Arpeggiator:
         self.arp_play_index = 0
         self.arp_prev_play_index = 0
         self.arp_length = arp_length
+        self.arp_length_idx = clock.get_note_division_idx(arp_length)
         self.last_played_note = None   # Tuple: (note, velocity, padidx)
         self.encoder_step_counter = 0  # Tracks how many encoder steps have been skipped
         self.arp_direction = arp_direction
+        clock.add_tempo_listener(self)
 
     def get_arp_notes(self):
         """
@@ -129,7 +133,7 @@ class Arpeggiator:
                 idx = random.randint(0, len(self.arp_notes) - 1)
             note = self.arp_notes[idx]
 
-        note_off_time = ticks.ticks_add(ticks.ticks_ms(), int(clock.get_note_duration_seconds(self.arp_length) * 1000))
+        note_off_time = ticks.ticks_add(ticks.ticks_ms(), clock.duration_ms[self.arp_length_idx])
         self.arp_note_off_queue.append((note, note_off_time))
         self.last_played_note = note
         self.arp_prev_play_index = self.arp_play_index
@@ -169,7 +173,7 @@ class Arpeggiator:
             str or float: The length of the arpeggiator notes.
         """
         if seconds:
-            return clock.get_note_duration_seconds(self.arp_length)
+            return clock.duration_seconds[self.arp_length_idx]
         return self.arp_length
 
     def add_arp_note(self, note):
@@ -223,6 +227,7 @@ class Arpeggiator:
         """
         if arp_length in constants.VALID_ARP_LENGTHS:
             self.arp_length = arp_length
+            self.arp_length_idx = clock.get_note_division_idx(arp_length)
 
     def has_arp_notes(self):
         """
@@ -233,5 +238,21 @@ class Arpeggiator:
         """
         return bool(self.arp_notes)
 
+    def on_tempo_change(self, bpm_last, bpm):
+        """
+        Called by the clock when the tempo changes. Notes already playing keep
+        the part of their length that is left, scaled to the new tempo.
+
+        Args:
+            bpm_last (float): The previous tempo.
+            bpm (float): The new tempo.
+        """
+        if bpm == bpm_last or not self.arp_note_off_queue:
+            return
+        timenow = ticks.ticks_ms()
+        for idx, (note, offtime) in enumerate(self.arp_note_off_queue):
+            remaining_ms = int(ticks.ticks_diff(offtime, timenow) * bpm_last / bpm)
+            self.arp_note_off_queue[idx] = (note, ticks.ticks_add(timenow, remaining_ms))
+
 # Instantiate the arpeggiator with settings
 arpeggiator = Arpeggiator(arp_direction=s.arpeggiator_type, arp_length=s.arpeggiator_length)
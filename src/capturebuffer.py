@@ -0,0 +1,103 @@
+from array import array
+import timebase as ticks
+import constants
+
+class CaptureBuffer:
+    """
+    Ring buffer that silently records every played note, so the last few bars
+    can be turned into a loop after the fact without arming record first.
+
+    The columns are allocated once at boot. Adding an event only writes into
+    them, so leaving capture on never allocates and never triggers a GC pause.
+    Once full, the oldest events are overwritten.
+
+    Attributes:
+        capacity (int): Max number of events kept.
+        count (int): Number of events currently stored.
+        write_idx (int): Column index the next event is written to.
+        times (array): ticks_ms timestamp of each event.
+        notes (bytearray): MIDI note numbers.
+        velocities (bytearray): MIDI velocities.
+        pads (bytearray): Pad index that played the note.
+        is_on (bytearray): 1 for note ON, 0 for note OFF.
+
+    Methods:
+        add_event(note, velocity, padidx, is_on): Stores an event at the current time.
+        get_column_idx(idx): Returns the column index of the idx-th oldest event.
+        find_first_on_since(since_ms): Returns the index of the first note ON at or after a timestamp.
+        clear(): Removes all events.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.write_idx = 0
+        self.times = array('l', (0 for _ in range(capacity)))
+        self.notes = bytearray(capacity)
+        self.velocities = bytearray(capacity)
+        self.pads = bytearray(capacity)
+        self.is_on = bytearray(capacity)
+
+    def add_event(self, note, velocity, padidx, is_on):
+        """
+        Stores a note event at the current time, overwriting the oldest event when full.
+
+        Args:
+            note (int): MIDI note number.
+            velocity (int): MIDI velocity.
+            padidx (int): Pad index.
+            is_on (bool): True for note ON, False for note OFF.
+        """
+        idx = self.write_idx
+        self.times[idx] = ticks.ticks_ms()
+        self.notes[idx] = note
+        self.velocities[idx] = velocity
+        self.pads[idx] = padidx
+        self.is_on[idx] = 1 if is_on else 0
+
+        idx += 1
+        if idx == self.capacity:
+            idx = 0
+        self.write_idx = idx
+        if self.count < self.capacity:
+            self.count += 1
+
+    def get_column_idx(self, idx):
+        """
+        Returns the column index of an event.
+
+        Args:
+            idx (int): 0 for the oldest stored event, count - 1 for the newest.
+
+        Returns:
+            int: Index into the columns.
+        """
+        return (self.write_idx - self.count + idx) % self.capacity
+
+    def find_first_on_since(self, since_ms):
+        """
+        Finds the first note ON played at or after a timestamp.
+
+        Args:
+            since_ms (int): ticks_ms timestamp.
+
+        Returns:
+            int: Event index (0 = oldest), or -1 if no note ON was played since then.
+        """
+        first_idx = -1
+        for idx in range(self.count - 1, -1, -1):
+            col = self.get_column_idx(idx)
+            if ticks.ticks_diff(self.times[col], since_ms) < 0:
+                break
+            if self.is_on[col]:
+                first_idx = idx
+        return first_idx
+
+    def clear(self):
+        """
+        Removes all events. The columns stay allocated.
+        """
+        self.count = 0
+        self.write_idx = 0
+
+capture_buffer = CaptureBuffer(constants.CAPTURE_EVENTS_LIMIT)
@@ -11,6 +11,20 @@ class ChordManager:
         self.is_playing_global = False
         self.recording_pad_idx = ""
         self.is_recording = False
+        clock.add_tempo_listener(self)
+
+    def on_tempo_change(self, bpm_last, bpm):
+        """
+        Called by the clock when the tempo changes. Passes the change on to
+        every recorded chord loop.
+
+        Args:
+            bpm_last (float): The previous tempo.
+            bpm (float): The new tempo.
+        """
+        for chord in self.pad_chords:
+            if chord != "":
+                chord.on_tempo_change(bpm_last, bpm)
 
     def add_remove_chord(self, pad_idx):
         """
@@ -53,7 +67,6 @@ class ChordManager:
         if action_type == "press" and self.is_recording:
             self.pad_chords[self.recording_pad_idx].toggle_record_state(False)
             self.pad_chords[self.recording_pad_idx].trim_silence()
-            self.pad_chords[self.recording_pad_idx].quantize_notes()
             self.pad_chords[self.recording_pad_idx].quantize_loop()
             if self.pad_chords[self.recording_pad_idx].loop_is_playing:
                 pixels_set_default_color(self.recording_pad_idx, constants.PIXEL_LOOP_PLAYING_COLOR)
@@ -62,6 +75,15 @@ class ChordManager:
             self.is_recording = False
             print("Chord recording stopped")
 
+    def requantize_chords(self):
+        """
+        Re-applies the quantize settings to all recorded chords. Called when the
+        quantize grid or strength changes.
+        """
+        for idx in range(16):
+            if self.pad_chords[idx] != "" and idx != self.recording_pad_idx:
+                self.pad_chords[idx].quantize_notes()
+
     def change_chord_loop_mode(self, button_idx):
         """
         Toggles between 1 shot mode and loop mode for the chord at the given index.
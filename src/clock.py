@@ -1,5 +1,339 @@
-import adafruit_ticks as ticks
-from debug import print_debug
+from array import array
+import timebase as ticks
+import constants
+
+class Transport:
+    """
+    The song position, counted in MIDI clock ticks (24 per quarter note) since
+    the start of the song. Follows Start, Stop, Continue and Song Position Pointer,
+    so looper, chords and quantizing can ask where in the bar they are instead
+    of working it out from elapsed time.
+
+    After Start or Continue the next clock tick is the current position itself,
+    every tick after that moves the position on by one.
+
+    Attributes:
+        is_running (bool): True between Start / Continue and Stop.
+        song_ticks (int): Position in clock ticks since the start of the song.
+        tick_pending (bool): True until the first clock tick after Start or Continue.
+        last_tick_time (int): ticks_ms time of the last clock tick.
+        beats_per_bar (int): Quarter notes per bar.
+        ticks_per_bar (int): Clock ticks per bar.
+
+    Methods:
+        start(timenow): Starts from the beginning of the song.
+        stop(): Stops, keeping the position.
+        continue_play(timenow): Starts from the current position.
+        set_song_position(sixteenths): Moves to a Song Position Pointer position.
+        tick(timenow): Advances the position by one clock tick.
+        get_bar(): Returns the bar number, 0 based.
+        get_beat(): Returns the beat in the bar, 0 based.
+        get_tick(): Returns the clock tick in the beat, 0 based.
+        get_division_ticks(division): Returns the clock ticks in a note division.
+        get_ticks_to_boundary(division_ticks): Returns the clock ticks until the next boundary of a division.
+        get_next_boundary_tick(division_ticks): Returns the song position of the next boundary of a division.
+        get_next_boundary_ms(division_ticks, bpm_centi): Returns the ticks_ms time of the next boundary of a division.
+        get_song_position_ms(bpm_centi): Returns the song position in ms at a tempo.
+    """
+
+    TICKS_PER_QUARTER_NOTE = 24
+    TICKS_PER_SIXTEENTH = 6
+
+    # Clock ticks per note division, 1/64 is not a whole tick
+    DIVISION_TICKS = {
+        "whole": 96,
+        "1": 96,
+        "half": 48,
+        "1/2": 48,
+        "quarter": 24,
+        "1/4": 24,
+        "eighth": 12,
+        "1/8": 12,
+        "sixteenth": 6,
+        "1/16": 6,
+        "thirtysecond": 3,
+        "1/32": 3,
+    }
+
+    def __init__(self, beats_per_bar=4):
+        self.is_running = False
+        self.song_ticks = 0
+        self.tick_pending = False
+        self.last_tick_time = ticks.ticks_ms()
+        self.beats_per_bar = beats_per_bar
+        self.ticks_per_bar = beats_per_bar * self.TICKS_PER_QUARTER_NOTE
+
+    def start(self, timenow):
+        """
+        Starts from the beginning of the song (MIDI Start).
+
+        Args:
+            timenow (int): ticks_ms time of the Start.
+        """
+        self.song_ticks = 0
+        self.continue_play(timenow)
+
+    def stop(self):
+        """
+        Stops, keeping the position for a Continue (MIDI Stop).
+        """
+        self.is_running = False
+
+    def continue_play(self, timenow):
+        """
+        Starts from the current position (MIDI Continue).
+
+        Args:
+            timenow (int): ticks_ms time of the Continue.
+        """
+        self.is_running = True
+        self.tick_pending = True
+        self.last_tick_time = timenow
+
+    def set_song_position(self, sixteenths):
+        """
+        Moves to a position (MIDI Song Position Pointer). Only sent while stopped.
+
+        Args:
+            sixteenths (int): Position in sixteenth notes since the start of the song.
+        """
+        self.song_ticks = sixteenths * self.TICKS_PER_SIXTEENTH
+
+    def tick(self, timenow):
+        """
+        Advances the position by one clock tick. Ignored while stopped.
+
+        Args:
+            timenow (int): ticks_ms time of the tick.
+        """
+        if not self.is_running:
+            return
+        if self.tick_pending:
+            self.tick_pending = False
+        else:
+            self.song_ticks += 1
+        self.last_tick_time = timenow
+
+    def get_bar(self):
+        """
+        Returns:
+            int: The bar number, 0 based.
+        """
+        return self.song_ticks // self.ticks_per_bar
+
+    def get_beat(self):
+        """
+        Returns:
+            int: The beat in the bar, 0 based.
+        """
+        return (self.song_ticks % self.ticks_per_bar) // self.TICKS_PER_QUARTER_NOTE
+
+    def get_tick(self):
+        """
+        Returns:
+            int: The clock tick in the beat, 0 based.
+        """
+        return self.song_ticks % self.TICKS_PER_QUARTER_NOTE
+
+    def get_division_ticks(self, division):
+        """
+        Returns the clock ticks in a note division.
+
+        Args:
+            division (str): Note division, e.g. "1/8", or "bar".
+
+        Returns:
+            int: Clock ticks per division. A quarter note for unknown divisions.
+        """
+        if division == "bar":
+            return self.ticks_per_bar
+        return self.DIVISION_TICKS.get(division, self.TICKS_PER_QUARTER_NOTE)
+
+    def get_ticks_to_boundary(self, division_ticks):
+        """
+        Returns the clock ticks until the next boundary of a division.
+
+        Args:
+            division_ticks (int): Clock ticks per division, see get_division_ticks().
+
+        Returns:
+            int: Clock ticks to the next boundary, 0 when the position is on one.
+        """
+        remainder = self.song_ticks % division_ticks
+        return division_ticks - remainder if remainder else 0
+
+    def get_next_boundary_tick(self, division_ticks):
+        """
+        Returns the song position of the next boundary of a division.
+
+        Args:
+            division_ticks (int): Clock ticks per division, see get_division_ticks().
+
+        Returns:
+            int: Song position in clock ticks, the current position when it is on a boundary.
+        """
+        return self.song_ticks + self.get_ticks_to_boundary(division_ticks)
+
+    def get_next_boundary_ms(self, division_ticks, bpm_centi):
+        """
+        Returns when the next boundary of a division is due, counted from the
+        last clock tick at the given tempo.
+
+        Args:
+            division_ticks (int): Clock ticks per division, see get_division_ticks().
+            bpm_centi (int): Tempo in hundredths of a BPM, see Clock.get_bpm_centi().
+
+        Returns:
+            int: ticks_ms time of the next boundary.
+        """
+        # 60000 ms * 100 / 24 ticks per quarter note
+        boundary_ms = self.get_ticks_to_boundary(division_ticks) * 250000 // bpm_centi
+        return ticks.ticks_add(self.last_tick_time, boundary_ms)
+
+    def get_song_position_ms(self, bpm_centi):
+        """
+        Returns the song position at the last clock tick as a time at a tempo.
+
+        Args:
+            bpm_centi (int): Tempo in hundredths of a BPM, see Clock.get_bpm_centi().
+
+        Returns:
+            int: ms from the start of the song.
+        """
+        return self.song_ticks * 250000 // bpm_centi
+
+class TempoTracker:
+    """
+    Follows the tempo of an incoming MIDI clock, updated on every tick.
+
+    An alpha-beta filter (a software PLL) predicts when the next tick is due
+    from the estimated tick time and period, and corrects both by a share of
+    how far off the prediction was. Until lock_ticks ticks are in, the shares
+    are the ones of a least squares line through all the ticks so far. After
+    that a third share follows how fast the period is changing, with fixed
+    fading memory gains, so older ticks fade out and tempo ramps are followed
+    without lagging behind. Tick times are ticks_us, so the estimate is not
+    limited by ms rounding.
+
+    A tick more than half a period away from its prediction is an outlier and
+    only corrects the estimate by half a period, so one late tick (USB jitter)
+    keeps the lock. MAX_OUTLIER_TICKS outliers in a row (clock stopped,
+    restarted or jumped in tempo) start a new lock.
+
+    Attributes:
+        lock_ticks (int): Ticks averaged over. Sets how fast it locks and follows changes.
+        tick_count (int): Ticks since the last lock started, up to lock_ticks.
+        outlier_count (int): Outlier ticks in a row.
+        last_tick_us (int): ticks_us time of the last tick.
+        tick_offset_us (float): Estimated time of the last tick, relative to last_tick_us.
+        period_us (float): Estimated microseconds per tick.
+        period_change_us (float): Estimated change of period_us per tick.
+        alpha (float): Share of the error added to the tick time once locked.
+        beta (float): Share of the error added to the period once locked.
+        gamma (float): Share of the error added to the period change once locked.
+
+    Methods:
+        reset(): Starts a new lock on the next tick.
+        set_lock_ticks(lock_ticks): Sets the ticks averaged over.
+        add_tick(timenow_us): Updates the estimate with a tick.
+        get_bpm(): Returns the estimated BPM.
+    """
+
+    MIN_PERIOD_US = 2500000 / 300  # 300 BPM
+    MAX_PERIOD_US = 2500000 / 20  # 20 BPM
+    MIN_LOCK_TICKS = 24  # Ticks before a BPM is reported. With 1 ms jitter about 0.1 BPM at 120 BPM, up to 48 ticks at 175 BPM
+    MAX_OUTLIER_TICKS = 3  # Outliers in a row that start a new lock
+
+    def __init__(self, lock_ticks=constants.CLOCK_LOCK_TICKS):
+        self.tick_count = 0
+        self.outlier_count = 0
+        self.last_tick_us = 0
+        self.tick_offset_us = 0.0
+        self.period_us = 0.0
+        self.period_change_us = 0.0
+        self.set_lock_ticks(lock_ticks)
+
+    def reset(self):
+        """
+        Starts a new lock on the next tick.
+        """
+        self.tick_count = 0
+
+    def set_lock_ticks(self, lock_ticks):
+        """
+        Sets the ticks averaged over. The estimate is kept.
+
+        Args:
+            lock_ticks (int): Ticks, at least 2.
+        """
+        self.lock_ticks = max(lock_ticks, 2)
+        self.tick_count = min(self.tick_count, self.lock_ticks)
+        # Fading memory gains, ticks fade by theta per tick
+        theta = 1 - 2 / self.lock_ticks
+        self.alpha = 1 - theta ** 3
+        self.beta = 1.5 * (1 - theta) ** 2 * (1 + theta)
+        self.gamma = 2 * (1 - theta) ** 3
+
+    def add_tick(self, timenow_us):
+        """
+        Updates the estimate with a tick.
+
+        Args:
+            timenow_us (int): ticks_us time of the tick.
+
+        Returns:
+            bool: True when enough ticks are in for get_bpm() to be reported.
+        """
+        elapsed_us = ticks.ticks_us_diff(timenow_us, self.last_tick_us)
+        self.last_tick_us = timenow_us
+        count = self.tick_count
+
+        if count:
+            # Predicted time of this tick, relative to the last one
+            predicted_us = self.tick_offset_us + self.period_us + self.period_change_us / 2
+            error_us = elapsed_us - predicted_us
+            max_error_us = self.period_us / 2
+            if count > 1 and abs(error_us) > max_error_us:
+                self.outlier_count += 1
+                if self.outlier_count >= self.MAX_OUTLIER_TICKS:
+                    count = 0
+                error_us = max_error_us if error_us > 0 else -max_error_us
+            else:
+                self.outlier_count = 0
+        if not count:
+            self.tick_count = 1
+            self.outlier_count = 0
+            self.tick_offset_us = 0.0
+            self.period_us = 0.0
+            self.period_change_us = 0.0
+            return False
+
+        if count < self.lock_ticks:
+            count += 1
+            self.tick_count = count
+            # Least squares line fit shares for count ticks
+            alpha = 2 * (2 * count - 1) / (count * (count + 1))
+            beta = 6 / (count * (count + 1))
+            gamma = 0.0
+        else:
+            alpha, beta, gamma = self.alpha, self.beta, self.gamma
+        self.period_us += self.period_change_us + beta * error_us
+        self.period_change_us += gamma * error_us
+        self.tick_offset_us = predicted_us + alpha * error_us - elapsed_us
+
+        if not self.MIN_PERIOD_US <= self.period_us <= self.MAX_PERIOD_US:
+            if count > 2:
+                self.tick_count = 0
+            return False
+        return count >= min(self.MIN_LOCK_TICKS, self.lock_ticks)
+
+    def get_bpm(self):
+        """
+        Returns:
+            float: The estimated BPM. Only valid after add_tick() returned True.
+        """
+        # 60000000 us per minute / 24 ticks per quarter note
+        return 2500000 / self.period_us
 
 class Clock:
     """
@@ -7,8 +341,7 @@ class Clock:
 
     Attributes:
         testing (bool): Flag indicating if the class is in testing mode.
-        last_clock_time (int): The time of the last clock update in milliseconds.
-        midi_tick_count (int): The number of MIDI ticks.
+        midi_tick_count (int): MIDI clock ticks into the current quarter note.
         last_tick_time (int): The time of the last tick in milliseconds.
         last_tick_duration (float): The duration of the last tick in seconds.
         bpm_current (float): The current BPM (beats per minute).
@@ -18,37 +351,69 @@ class Clock:
         quarternote_duration (float): The time duration of a quarter note.
         eighthnote_duration (float): The time duration of an eighth note.
         sixteenthnote_duration (float): The time duration of a sixteenth note.
+        duration_seconds (list): Length of each note division in seconds, indexed like NOTE_DIVISIONS.
+        duration_ms (array): Length of each note division in ms.
+        duration_us (array): Length of each note division in microseconds.
+        tempo_listeners (list): Objects told about tempo changes through on_tempo_change(bpm_last, bpm).
         play_state (bool): The play state of the clock.
+        tempo_tracker (TempoTracker): Follows the tempo of the incoming MIDI clock.
+        tempo_change_ticks (int): Ticks in a row the tracked tempo has been BPM_UPDATE_STEP or more off bpm_current.
+        transport (Transport): The song position in bars, beats and clock ticks.
 
     Methods:
         update_bpm(bpm): Updates the BPM value.
-        update_all_timings(bpm): Updates all note timings based on the given BPM.
-        update_clock(): Updates the clock and handles outliers.
+        update_all_timings(bpm): Updates all note timings based on the given BPM and tells the tempo listeners.
+        add_tempo_listener(listener): Calls listener.on_tempo_change() on every tempo change.
+        remove_tempo_listener(listener): Stops telling a listener about tempo changes.
+        get_note_division_idx(note_type): Returns the duration table index of a note type.
+        update_clock(timenow=None, timenow_us=None): Updates the clock and the tempo from a MIDI clock tick.
         get_note_duration_seconds(note_type): Returns the time duration of a given note type.
+        get_note_duration_ms(note_type): Returns the duration of a given note type in ms.
+        get_note_duration_us(note_type): Returns the duration of a given note type in microseconds.
+        get_bpm_centi(): Returns the current BPM in hundredths of a BPM.
         set_play_state(state): Sets the play state of the clock.
         get_playstate(): Returns the play state of the clock.
     """
 
     MILLISECONDS_TO_SECONDS = 1000.0
-    BPM_OUTLIER_THRESHOLD = 3
-    TICK_DURATION_THRESHOLD = 0.02
     TICKS_PER_QUARTER_NOTE = 24
+    BPM_UPDATE_STEP = 0.1  # Smallest tempo change passed on, so clock jitter doesn't re-time the listeners
+
+    # Note divisions the duration tables hold, by name. Lookups are one dict get
+    # and one index, the tables are only rebuilt when the tempo changes.
+    NOTE_DIVISIONS = {
+        "whole": 0, "1": 0,
+        "half": 1, "1/2": 1,
+        "quarter": 2, "1/4": 2,
+        "eighth": 3, "1/8": 3,
+        "sixteenth": 4, "1/16": 4,
+        "thirtysecond": 5, "1/32": 5,
+        "sixtyfourth": 6, "1/64": 6,
+    }
+    NOTE_DIVISION_64THS = (64, 32, 16, 8, 4, 2, 1)
+    QUARTER_NOTE_IDX = 2  # Used for unknown note types
 
     def __init__(self):
         self.testing = False
-        self.last_clock_time = ticks.ticks_ms()
         self.midi_tick_count = 0
         self.last_tick_time = ticks.ticks_ms()
         self.last_tick_duration = 0.0
         self.bpm_current = 120.0
         self.bpm_last = 120.0
+        self.duration_seconds = [0.0] * len(self.NOTE_DIVISION_64THS)
+        self.duration_ms = array('l', (0 for _ in self.NOTE_DIVISION_64THS))
+        self.duration_us = array('l', (0 for _ in self.NOTE_DIVISION_64THS))
+        self.tempo_listeners = []
         self.update_all_timings(self.bpm_current)
-        self.last_4_BPMs = [120.0] * 4
         self.is_playing = False
+        self.tempo_tracker = TempoTracker()
+        self.tempo_change_ticks = 0
+        self.transport = Transport()
 
     def update_all_timings(self, bpm):
         """
-        Updates all note timings based on the given BPM.
+        Updates all note timings based on the given BPM, rebuilds the duration
+        tables and tells the tempo listeners.
 
         Args:
             bpm (float): The new BPM (beats per minute) value.
@@ -61,50 +426,68 @@ class Clock:
         self.wholetime_duration = quarternote_duration * 4
         self.eighthnote_duration = quarternote_duration / 2
         self.sixteenthnote_duration = quarternote_duration / 4
-        print_debug(f"Updated timings: quarter={self.quarternote_duration}, half={self.halfnote_duration}, whole={self.wholetime_duration}")
 
-    def update_clock(self):
-        """
-        Updates the clock and handles outliers.
-        """
-        self.midi_tick_count += 1
-        timenow = ticks.ticks_ms()
-        tick_duration = ticks.ticks_diff(timenow, self.last_tick_time) / self.MILLISECONDS_TO_SECONDS
-        self.last_tick_time = timenow
+        sixtyfourth_us = 15000000 / bpm
+        for idx, num_64ths in enumerate(self.NOTE_DIVISION_64THS):
+            duration_us = int(sixtyfourth_us * num_64ths)
+            self.duration_seconds[idx] = duration_us / 1000000
+            self.duration_us[idx] = duration_us
+            self.duration_ms[idx] = (duration_us + 500) // 1000
 
-        if abs(self.last_tick_duration - tick_duration) > self.TICK_DURATION_THRESHOLD:
-            self.midi_tick_count = 0
-            self.last_clock_time = timenow
-            self.last_tick_duration = tick_duration
-            return
+        for listener in self.tempo_listeners:
+            listener.on_tempo_change(self.bpm_last, bpm)
+
+    def add_tempo_listener(self, listener):
+        """
+        Calls listener.on_tempo_change(bpm_last, bpm) every time the tempo changes,
+        so the listener can rescale its cached times instead of polling bpm_current.
 
-        self.last_tick_duration = tick_duration
+        Args:
+            listener (object): Object with an on_tempo_change(bpm_last, bpm) method.
+        """
+        if listener not in self.tempo_listeners:
+            self.tempo_listeners.append(listener)
 
-        if self.midi_tick_count % self.TICKS_PER_QUARTER_NOTE == 0:
-            self.midi_tick_count = 0
-            if self.last_clock_time != 0:
-                self.update_bpm_from_clock(timenow)
+    def remove_tempo_listener(self, listener):
+        """
+        Stops telling a listener about tempo changes.
 
-            self.last_clock_time = timenow
+        Args:
+            listener (object): Listener added with add_tempo_listener.
+        """
+        if listener in self.tempo_listeners:
+            self.tempo_listeners.remove(listener)
 
-    def update_bpm_from_clock(self, timenow):
+    def update_clock(self, timenow=None, timenow_us=None):
         """
-        Updates the BPM from the clock ticks.
+        Updates the clock and the tempo from a MIDI clock tick. A tracked tempo
+        change is passed on once it is at least BPM_UPDATE_STEP and has held for
+        a quarter note, so the tempo listeners run at most once per beat.
 
         Args:
-            timenow (int): The current time in milliseconds.
+            timenow (int, optional): ticks_ms time the tick arrived. Default is now.
+            timenow_us (int, optional): ticks_us time the tick arrived. Default is now.
         """
-        quarter_note_time = ticks.ticks_diff(timenow, self.last_clock_time) / self.MILLISECONDS_TO_SECONDS
-        new_bpm = round(60 / quarter_note_time)
-        self.last_4_BPMs.pop(0)
-        self.last_4_BPMs.append(new_bpm)
+        if timenow is None:
+            timenow = ticks.ticks_ms()
+        if timenow_us is None:
+            timenow_us = ticks.ticks_us()
+        self.midi_tick_count = (self.midi_tick_count + 1) % self.TICKS_PER_QUARTER_NOTE
+        self.last_tick_duration = ticks.ticks_diff(timenow, self.last_tick_time) / self.MILLISECONDS_TO_SECONDS
+        self.last_tick_time = timenow
+        self.transport.tick(timenow)
 
-        if self.last_4_BPMs.count(new_bpm) >= 3:
-            outlier_amt = max(abs(bpm - (sum(self.last_4_BPMs) / 4)) for bpm in self.last_4_BPMs)
-            if outlier_amt <= self.BPM_OUTLIER_THRESHOLD:
-                average_bpm = round(sum(self.last_4_BPMs) / 4)
-                self.update_all_timings(average_bpm)
-                print_debug(f"Updated BPM: {self.bpm_current}")
+        if not self.tempo_tracker.add_tick(timenow_us):
+            self.tempo_change_ticks = 0
+            return
+        bpm = self.tempo_tracker.get_bpm()
+        if abs(bpm - self.bpm_current) < self.BPM_UPDATE_STEP:
+            self.tempo_change_ticks = 0
+            return
+        self.tempo_change_ticks += 1
+        if self.tempo_change_ticks >= self.TICKS_PER_QUARTER_NOTE:
+            self.tempo_change_ticks = 0
+            self.update_all_timings(round(bpm, 2))
 
     def get_note_duration_seconds(self, note_type):
         """
@@ -119,24 +502,55 @@ class Clock:
         Returns:
             float: The time duration of the note in seconds.
         """
-        note_times_seconds = {
-            "whole": self.wholetime_duration,
-            "1": self.wholetime_duration,
-            "half": self.halfnote_duration,
-            "1/2": self.halfnote_duration,
-            "quarter": self.quarternote_duration,
-            "1/4": self.quarternote_duration,
-            "eighth": self.eighthnote_duration,
-            "1/8": self.eighthnote_duration,
-            "sixteenth": self.sixteenthnote_duration,
-            "1/16": self.sixteenthnote_duration,
-            "thirtysecond": self.sixteenthnote_duration / 2,
-            "1/32": self.sixteenthnote_duration / 2,
-            "sixtyfourth": self.sixteenthnote_duration / 4,
-            "1/64": self.sixteenthnote_duration / 4,
-        }
-
-        return note_times_seconds.get(note_type, self.quarternote_duration)
+        return self.duration_seconds[self.NOTE_DIVISIONS.get(note_type, self.QUARTER_NOTE_IDX)]
+
+    def get_note_division_idx(self, note_type):
+        """
+        Returns the index of a note type in the duration tables. Callers that
+        look up the same note type often can keep the index.
+
+        Args:
+            note_type (str): The type of note. See get_note_duration_seconds.
+
+        Returns:
+            int: Index into duration_seconds, duration_ms and duration_us.
+        """
+        return self.NOTE_DIVISIONS.get(note_type, self.QUARTER_NOTE_IDX)
+
+    def get_note_duration_ms(self, note_type):
+        """
+        Returns the time duration of a given note type in whole ms.
+
+        Args:
+            note_type (str): The type of note. See get_note_duration_seconds.
+
+        Returns:
+            int: The time duration of the note in ms.
+        """
+        return self.duration_ms[self.NOTE_DIVISIONS.get(note_type, self.QUARTER_NOTE_IDX)]
+
+    def get_note_duration_us(self, note_type):
+        """
+        Returns the time duration of a given note type in whole microseconds,
+        for integer quantizing of loop times.
+
+        Args:
+            note_type (str): The type of note. See get_note_duration_seconds.
+
+        Returns:
+            int: The time duration of the note in microseconds.
+        """
+        return self.duration_us[self.NOTE_DIVISIONS.get(note_type, self.QUARTER_NOTE_IDX)]
+
+    def get_bpm_centi(self):
+        """
+        Returns the current BPM as an integer number of hundredths of a BPM,
+        for integer tempo scaling of loop playback.
+
+        Returns:
+            int: BPM * 100.
+        """
+        return int(self.bpm_current * 100 + 0.5)
 
     def set_play_state(self, state):
         """
@@ -1,16 +1,22 @@
-import adafruit_ticks as ticks
+import timebase as ticks
 from settings import settings
 import inputs 
 import constants
-from looper import setup_midi_loops, MidiLoop
+from looper import setup_midi_loops, MidiLoop, loop_scheduler
 from chordmanager import chord_manager
+from capturebuffer import capture_buffer
 from menus import Menu
 from debug import debug, print_debug
 from playmenu import get_midi_note_name_text
 from clock import clock
-from midi import setup_midi, send_midi_note_on, send_midi_note_off, get_midi_messages_in
+from midi import (
+    setup_midi, send_midi_note_on, send_midi_note_off, get_midi_messages_in, poll_midi_in, flush_midi_out,
+    update_midi_clock, update_midi_clock_out, get_ms_to_midi_clock_tick,
+    report_stuck_notes, SOURCE_LIVE, SOURCE_ARP, SOURCE_LOOPER, SOURCE_CHORD,
+    MIDI_IN_NOTE_ON, MIDI_IN_NOTE_OFF,
+)
 from display import (
-    check_show_display,pixels_process_blinks,
+    check_show_display,display_flush_page,pixels_process_blinks,
     pixel_set_note_on,pixel_set_note_off,
     pixel_set_encoder_button_on, pixel_set_encoder_button_off,
     clear_pixels,display_startup_screen,
@@ -22,32 +28,38 @@ setup_midi()
 setup_midi_loops()
 display_startup_screen()
 Menu.initialize()
+update_midi_clock_out()
 
 # Timing
 polling_time_prev = ticks.ticks_ms()
 if debug.DEBUG_MODE:
     debug_time_prev = ticks.ticks_ms()
 
-def process_midi_messages(midi_messages):
-    for idx, msg in enumerate(midi_messages):
-        if not msg or len(msg) < 3:
+def process_midi_messages(midi_in_queue):
+    kinds = midi_in_queue.kinds
+    for idx in range(midi_in_queue.count):
+        kind = kinds[idx]
+        if kind not in (MIDI_IN_NOTE_ON, MIDI_IN_NOTE_OFF):
             continue
-        note_val, velocity, padidx = msg
-        print_debug(f"MIDI IN: {get_midi_note_name_text(note_val)} ({note_val}) vel: {velocity} padidx: {padidx}")
-        if idx == 0:  # ON
+        note_val = midi_in_queue.notes[idx]
+        velocity = midi_in_queue.velocities[idx]
+        print_debug(f"MIDI IN: {get_midi_note_name_text(note_val)} ({note_val}) vel: {velocity}")
+        timestamp = midi_in_queue.times[idx]
+        if kind == MIDI_IN_NOTE_ON:
             pixel_set_encoder_button_on()
-            record_midi_event(note_val, velocity, padidx, True)
-        else:  # OFF
+            record_midi_event(note_val, velocity, 0, True, "all", timestamp)
+        else:
             pixel_set_encoder_button_off()
-            record_midi_event(note_val, velocity, padidx, False)
+            record_midi_event(note_val, velocity, 0, False, "all", timestamp)
 
-def record_midi_event(note_val, velocity, padidx, is_on, record):
-    if MidiLoop.current_loop.is_recording and record in ["loop", "all"]:
-        MidiLoop.current_loop.add_loop_note(note_val, velocity, padidx, is_on)
+def record_midi_event(note_val, velocity, padidx, is_on, record, timestamp=None):
+    if record in ["loop", "all"]:
+        for loop in MidiLoop.recording_loops:
+            loop.add_loop_note(note_val, velocity, padidx, is_on, timestamp)
     if chord_manager.is_recording and record in ["chord", "all"]:
-        chord_manager.pad_chords[chord_manager.recording_pad_idx].add_loop_note(note_val, velocity, padidx, is_on)
+        chord_manager.pad_chords[chord_manager.recording_pad_idx].add_loop_note(note_val, velocity, padidx, is_on, timestamp)
 
-def process_notes(notes, is_on, record="all"): # record = "loop", "chord", "all", False
+def process_notes(notes, is_on, record="all", source=SOURCE_LIVE): # record = "loop", "chord", "all", False
     for note in notes:
         note_val, velocity, padidx = note
         if is_on:
@@ -55,52 +67,64 @@ def process_notes(notes, is_on, record="all"): # record = "loop", "chord", "all"
             shifted_note = useraddons.handle_new_notes_on(note_val, velocity, padidx)
             if shifted_note:
                 note_val,velocity,padidx = shifted_note
-            send_midi_note_on(note_val, velocity)
+            send_midi_note_on(note_val, velocity, source)
             pixel_set_note_on(padidx, velocity)
         else:
             print_debug(f"NOTE OFF: {get_midi_note_name_text(note_val)} ({note_val}) vel: {velocity}")
-            send_midi_note_off(note_val)
+            send_midi_note_off(note_val, source)
             pixel_set_note_off(padidx)
             useraddons.handle_new_notes_off(note_val, velocity, padidx)
         if record:
+            capture_buffer.add_event(note_val, velocity, padidx, is_on)
             record_midi_event(note_val, velocity, padidx, is_on, record)
 
 # -------------------- Main loop --------------------
 while True:
-    # Slower input processing
+    # Read MIDI in before the slow work, so notes keep the time they arrived
+    poll_midi_in()
+    update_midi_clock()
+
+    # Slower input processing, after the next MIDI clock tick if it is close
     timenow = ticks.ticks_ms()
-    if ticks.ticks_diff(timenow, polling_time_prev) > constants.NAV_BUTTONS_POLL_S * 1000:  # Convert seconds to milliseconds
+    if (ticks.ticks_diff(timenow, polling_time_prev) > constants.NAV_BUTTONS_POLL_S * 1000  # Convert seconds to milliseconds
+            and get_ms_to_midi_clock_tick() > constants.MIDI_CLOCK_GUARD_MS):
         inputs.process_inputs_slow()
         check_show_display()
         Menu.display_clear_notifications()
         pixels_process_blinks()
+        report_stuck_notes()
         debug.check_display_debug()
         polling_time_prev = timenow
         useraddons.check_addons_slow()
 
     # Fast input processing
+    update_midi_clock()
     inputs.process_inputs_fast()
 
     # Send MIDI notes off
     process_notes(inputs.new_notes_off, is_on=False)
+    process_notes(inputs.new_arp_notes_off, is_on=False, source=SOURCE_ARP)
 
     # Record MIDI In to loops and chords
-    midi_messages = get_midi_messages_in()
-    if (MidiLoop.current_loop.is_recording or chord_manager.is_recording) and midi_messages:
-        process_midi_messages(midi_messages)
+    midi_in_queue = get_midi_messages_in()
+    if (MidiLoop.recording_loops or chord_manager.is_recording) and midi_in_queue.count:
+        process_midi_messages(midi_in_queue)
+    midi_in_queue.clear()
 
     # Send MIDI notes on
     process_notes(inputs.new_notes_on, is_on=True)
+    process_notes(inputs.new_arp_notes_on, is_on=True, source=SOURCE_ARP)
 
     # Loop Notes
-    if MidiLoop.current_loop.loop_is_playing:
-        new_notes = MidiLoop.current_loop.get_new_notes()
+    for loop in loop_scheduler.get_due_loops():
+        new_notes = loop.get_new_notes()
         if new_notes:
             loop_notes_on, loop_notes_off = new_notes
-            process_notes(loop_notes_on, is_on=True, record=False)
-            process_notes(loop_notes_off, is_on=False, record=False)
+            process_notes(loop_notes_on, is_on=True, record=False, source=SOURCE_LOOPER)
+            process_notes(loop_notes_off, is_on=False, record=False, source=SOURCE_LOOPER)
 
     # Chord Mode Notes
+    update_midi_clock()
     if settings.midi_sync:
         if clock.is_playing:
             chord_manager.process_chord_on_queue()
@@ -113,5 +137,14 @@ while True:
         new_notes = chord.get_new_notes()  # chord is a loop object
         if new_notes:
             loop_notes_on, loop_notes_off = new_notes
-            process_notes(loop_notes_on, is_on=True, record="loop")
-            process_notes(loop_notes_off, is_on=False, record="loop")
\ No newline at end of file
+            process_notes(loop_notes_on, is_on=True, record="loop", source=SOURCE_CHORD)
+            process_notes(loop_notes_off, is_on=False, record="loop", source=SOURCE_CHORD)
+
+    # One write per port for everything sent this iteration
+    update_midi_clock()
+    flush_midi_out()
+
+    # One display page per iteration, after the next MIDI clock tick if it is close
+    if get_ms_to_midi_clock_tick() > constants.MIDI_CLOCK_GUARD_MS:
+        display_flush_page()
+        update_midi_clock()
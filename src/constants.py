@@ -18,7 +18,20 @@ ENCODER_DT = board.GP13
 # MIDI Pins and Settings
 UART_MIDI_TX = board.GP16
 UART_MIDI_RX = board.GP17
-LOOP_NOTES_LIMIT = 500  # Max MIDI notes limit, fails at ~129 without memory clean
+NUM_LOOP_TRACKS = 8  # Looper tracks that play and record together
+LOOP_NOTES_LIMIT = 500  # Max MIDI notes per looper track. Packed buffers, 16 bytes per note
+CHORD_NOTES_LIMIT = 128  # Max MIDI notes per chord loop
+LOOP_MAX_ACTIVE_NOTES = 32  # Max notes one loop holds on at once
+LOOP_UNDO_LAYERS = 8  # Overdub passes per loop that can be undone separately
+CAPTURE_EVENTS_LIMIT = 512  # Notes ON + OFF kept by the always on capture buffer
+CAPTURE_BARS = 4  # Bars turned into a loop by a capture
+MIDI_OUT_BATCH_BYTES = 192  # MIDI bytes per priority sent in one write per main loop iteration
+MIDI_DIN_QUEUE_BYTES = 384  # MIDI bytes per priority waiting for the DIN port
+MIDI_DIN_BURST_BYTES = 32  # DIN bytes written at once, the UART TX FIFO size on the RP2040
+STUCK_NOTE_MS = 10000  # Notes held longer than this are reported as stuck in debug mode
+MIDI_IN_BUDGET_PER_PORT = 32  # Max MIDI messages (3 bytes each) read from each port per main loop iteration
+CLOCK_LOCK_TICKS = 96  # MIDI clock ticks the tempo tracker averages over. Longer is steadier, shorter follows ramps faster
+MIDI_CLOCK_GUARD_MS = 4  # Slow work (display page, menus) waits when the next MIDI clock tick is closer than this
 
 # Default velocities for single note mode
 DEFAULT_SINGLENOTE_MODE_VELOCITIES = [
@@ -1,4 +1,5 @@
 import time
+import timebase as ticks
 import digitalio
 from collections import OrderedDict
 from settings import settings
@@ -13,7 +14,7 @@ class Debug():
     Attributes:
         debug_header (str): Header text for the debug information.
         debug_dict (OrderedDict): Ordered dictionary to store debug data.
-        debug_timer (float): Timer for managing debug printing intervals.
+        debug_timer (int): ticks_ms time the debug info was last printed.
     """
 
     def __init__(self):
@@ -22,7 +23,7 @@ class Debug():
         """
         self.debug_header = "Debug".center(50)
         self.debug_dict = OrderedDict()  # Stores everything to print
-        self.debug_timer = time.monotonic()
+        self.debug_timer = ticks.ticks_ms()
         self.debug_timer_dict = {}
         self.DEBUG_MODE = False
 
@@ -55,7 +56,7 @@ class Debug():
         if not self.DEBUG_MODE:
             return
         
-        if time.monotonic() - self.debug_timer > DEBUG_INTERVAL_S:
+        if ticks.ticks_diff(ticks.ticks_ms(), self.debug_timer) > DEBUG_INTERVAL_S * 1000:
             # Bail if nothing to display
             if not self.debug_dict:
                 return
@@ -66,7 +67,7 @@ class Debug():
             for key, item in self.debug_dict.items():
                 print(f"{key}:  {item}")
             self.debug_dict = {}
-            self.debug_timer = time.monotonic()
+            self.debug_timer = ticks.ticks_ms()
 
     def add_debug_line(self, title, data, instant=False):
         """
@@ -94,7 +95,7 @@ class Debug():
         if not self.DEBUG_MODE:
             return
         
-        time_now = time.monotonic()
+        time_now = ticks.ticks_us()
 
         # Start timer
         if key not in self.debug_timer_dict:
@@ -102,9 +103,9 @@ class Debug():
         
         # End timer
         else:
-            elapsed = time_now - self.debug_timer_dict[key]
+            elapsed_us = ticks.ticks_us_diff(time_now, self.debug_timer_dict[key])
             self.debug_timer_dict.pop(key, None)  # Remove it for the next use
-            ms = round(1000 * elapsed, 1)
+            ms = round(elapsed_us / 1000, 1)
             if ms > 25:
                 print(f"{key}: {ms} ms !!!!!!!!!!!!!!!!!!!!")
             else:
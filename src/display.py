@@ -1,4 +1,5 @@
 import time
+import timebase as ticks
 import board
 import busio
 import neopixel
@@ -24,13 +25,15 @@ DOT_HEIGHT = 3
 
 # TRACKING VARIABLES
 display_needs_update = True  # If true, show the display
+display_flush_page_idx = -1  # Next page of the frame buffer to write, -1 when not flushing
+display_page_cmds = bytearray([0x00, 0x21, 0, 127, 0x22, 0, 0])  # Control byte, column and page address
 notification_text_title = None
-notification_on_time = 0
+notification_on_time = None  # ticks_ms time the notification was shown, None when there is none
 current_top_text = None
 previous_top_text = None
-display_notification_FPS_timer = 0
+display_notification_FPS_timer = None
 display_notification_most_recent = ""
-pixel_blink_timer = 0
+pixel_blink_timer = ticks.ticks_ms()
 pixel_blink_states = [False] * 18
 pixel_status = [False] * 18
 pixels_blink_colors = [constants.RED] * 18
@@ -365,11 +368,40 @@ def update_playmode_icon(playmode):
 
 def check_show_display():
     """
-    Checks if the display needs to be updated and shows it if necessary.
+    Checks if the display needs to be updated and starts writing it if necessary.
+    The pages are written by display_flush_page().
     """
-    if display_needs_update:
-        display.show()
+    global display_flush_page_idx
+    if display_needs_update and display_flush_page_idx < 0:
         display_set_update_flag(False)
+        display_flush_page_idx = 0
+
+def display_flush_page():
+    """
+    Writes the next page (8 rows, 128 bytes) of the frame buffer to the display.
+    Called every main loop iteration while a flush is in progress. The whole
+    screen takes about 25 ms over I2C at 400 kHz, one page about 3 ms, so
+    MIDI clock and notes are never held up by a full screen write.
+    """
+    global display_flush_page_idx
+    page = display_flush_page_idx
+    if page < 0:
+        return
+
+    # buffer[0] is the data control byte, put one in front of this page for the write
+    display_page_cmds[5] = page
+    display_page_cmds[6] = page
+    buf = display.buffer
+    start = page * display.width
+    saved = buf[start]
+    buf[start] = 0x40
+    with display.i2c_device:
+        display.i2c_device.write(display_page_cmds)
+        display.i2c_device.write(buf, start=start, end=start + display.width + 1)
+    buf[start] = saved
+
+    page += 1
+    display_flush_page_idx = page if page < display.pages else -1
     
 def display_notification(msg=None):
     """
@@ -392,18 +424,20 @@ def display_notification(msg=None):
     if not msg:
         return
 
-    if (time.monotonic() - display_notification_FPS_timer) > constants.DISPLAY_NOTIFICATION_METERING_THRESH:
+    timenow = ticks.ticks_ms()
+    if (display_notification_FPS_timer is None
+            or ticks.ticks_diff(timenow, display_notification_FPS_timer) > constants.DISPLAY_NOTIFICATION_METERING_THRESH * 1000):
         notification_text_title = msg
 
-        if notification_on_time > 0:
+        if notification_on_time is not None:
             previous_top_text = current_top_text
 
         current_top_text = msg
         display_text_top(msg, True)
 
-        notification_on_time = time.monotonic()
+        notification_on_time = timenow
 
-        display_notification_FPS_timer = time.monotonic()
+        display_notification_FPS_timer = timenow
 
 def display_clear_notifications(replace_text=None):
     """
@@ -423,8 +457,8 @@ def display_clear_notifications(replace_text=None):
     if notification_text_title == replace_text:
         return
 
-    if time.monotonic() - notification_on_time > constants.NOTIFICATION_THRESH_S:
-        notification_on_time = -1
+    if ticks.ticks_diff(ticks.ticks_ms(), notification_on_time) > constants.NOTIFICATION_THRESH_S * 1000:
+        notification_on_time = None
         notification_text_title = None
         display_text_top(replace_text)
 
@@ -584,8 +618,8 @@ def pixels_process_blinks():
     global pixel_blink_states
     global pixel_status
 
-    current_time = time.monotonic()
-    if True in pixel_blink_states and current_time - pixel_blink_timer > constants.PIXEL_BLINK_TIME:
+    current_time = ticks.ticks_ms()
+    if True in pixel_blink_states and ticks.ticks_diff(current_time, pixel_blink_timer) > constants.PIXEL_BLINK_TIME * 1000:
         for i in range(18):
             if pixel_blink_states[i]:
                 pixel_status[i] = not pixel_status[i]
@@ -1,5 +1,5 @@
 from utils import free_memory
-import time
+import timebase as ticks
 import constants
 import board
 import digitalio
@@ -52,25 +52,25 @@ class Inputs:
         encoder_delta (int): The change in encoder position.
         encoder_mode_ontimes (list): List of on-times for the encoder mode.
 
-        fn_button_starttime (float): The start time of the fn button.
+        fn_button_starttime (int): ticks_ms time the fn button was pressed.
         fn_button_holdtime_s (float): The hold time of the fn button.
         fn_button_held (bool): Flag indicating if the fn button is being held.
         fn_button_dbl_press (bool): Flag indicating if the fn button is double-pressed.
-        fn_button_dbl_press_time (float): The time of the double press of the fn button.
+        fn_button_dbl_press_time (int): ticks_ms time the fn button was released for a double press, 0 for none.
         fn_button_state (bool): The state of the fn button.
 
         encoder_button_state (bool): The state of the encoder button.
-        encoder_button_starttime (float): The start time of the encoder button.
+        encoder_button_starttime (int): ticks_ms time the encoder button was pressed.
         encoder_button_holdtime_s (float): The hold time of the encoder button.
         encoder_button_held (bool): Flag indicating if the encoder button is being held.
         encoder_button_dbl_press (bool): Flag indicating if the encoder button is double-pressed.
-        encoder_button_dbl_press_time (float): The time of the double press of the encoder button.
+        encoder_button_dbl_press_time (int): ticks_ms time the encoder button was released for a double press, 0 for none.
 
         velocity_map_mode_midi_val (Optional[int]): The MIDI value of the single hit velocity button.
 
         is_any_pad_held (bool): Flag indicating if any pad is being held.
         button_states (list of bool): List of states for each button.
-        button_press_start_times (list of Optional[float]): List of start times for button presses.
+        button_press_start_times (list of Optional[int]): ticks_ms times the buttons were pressed.
         button_held (list of bool): List indicating if each button is being held.
         new_press (list of bool): List indicating if a button is newly pressed.
         new_release (list of bool): List indicating if a button is newly released.
@@ -113,6 +113,8 @@ inputs = Inputs()
 note_states = [False] * 16
 new_notes_on = []  # list of tuples: (note, velocity)
 new_notes_off = []
+new_arp_notes_on = []  # Arp notes are kept apart so they get their own note owner
+new_arp_notes_off = []
 
 def handle_velocity_mode(button_index):
     """Handles the logic for velocity play mode.
@@ -151,15 +153,16 @@ def process_nav_buttons():
     global fn_button, encoder_button, last_nav_check_time
 
     # Check for extreme latency. Just reset everything if it's too high
-    time_since_last_check = time.monotonic() - last_nav_check_time
-    last_nav_check_time = time.monotonic()
+    timenow = ticks.ticks_ms()
+    time_since_last_check = ticks.ticks_diff(timenow, last_nav_check_time)
+    last_nav_check_time = timenow
 
     # Handle fn button release
     if fn_button.value and inputs.fn_button_state:
         if inputs.fn_button_held:
             inputs.fn_button_dbl_press_time = 0
         else:
-            inputs.fn_button_dbl_press_time = time.monotonic()
+            inputs.fn_button_dbl_press_time = timenow
 
         if inputs.fn_button_held:
             fn_button_held_fn = Menu.current_menu.actions.get('fn_button_held_function')
@@ -187,15 +190,16 @@ def process_nav_buttons():
     # Handle fn button press
     if not inputs.fn_button_state and not fn_button.value:
         inputs.fn_button_state = True
-        inputs.fn_button_starttime = time.monotonic()
+        inputs.fn_button_starttime = timenow
         inputs.fn_button_held = False
         inputs.fn_button_dbl_press = False
         if not Menu.current_menu_idx == 2:
             pixel_set_fn_button_on(color=constants.FN_BUTTON_COLOR)
 
         # Select button double press
-        if (inputs.fn_button_starttime - inputs.fn_button_dbl_press_time
-            < constants.DBL_PRESS_THRESH_S) and not inputs.fn_button_dbl_press:
+        if (inputs.fn_button_dbl_press_time
+            and ticks.ticks_diff(inputs.fn_button_starttime, inputs.fn_button_dbl_press_time) < constants.DBL_PRESS_THRESH_S * 1000
+            and not inputs.fn_button_dbl_press):
             inputs.fn_button_dbl_press = True
             inputs.fn_button_dbl_press_time = 0
             fn_button_dbl_press_fn = Menu.current_menu.actions.get('fn_button_dbl_press_function')
@@ -205,7 +209,7 @@ def process_nav_buttons():
                     Menu.toggle_lock_mode(True)
                 else:
                     Menu.toggle_lock_mode(False)
-            inputs.fn_button_starttime = time.monotonic()  # Avoid erroneous button holds
+            inputs.fn_button_starttime = ticks.ticks_ms()  # Avoid erroneous button holds
             print_debug("Select Button Double Press")
 
         # Select button single press
@@ -219,9 +223,9 @@ def process_nav_buttons():
 
     # Handle fn button held
     if (inputs.fn_button_state and
-        (time.monotonic() - inputs.fn_button_starttime) > constants.BUTTON_HOLD_THRESH_S and
+        ticks.ticks_diff(ticks.ticks_ms(), inputs.fn_button_starttime) > constants.BUTTON_HOLD_THRESH_S * 1000 and
         not inputs.fn_button_held):
-        if time_since_last_check <= 0.5:
+        if time_since_last_check <= 500:
             inputs.fn_button_held = True
             inputs.fn_button_dbl_press = False
             Menu.toggle_fn_button_icon(True)
@@ -234,18 +238,19 @@ def process_nav_buttons():
     # Handle encoder button press
     if not inputs.encoder_button_state and not encoder_button.value:
         inputs.encoder_button_state = True
-        inputs.encoder_button_starttime = time.monotonic()
+        inputs.encoder_button_starttime = timenow
         inputs.encoder_button_held = False
         inputs.encoder_button_dbl_press = False
         
         # Encoder button double press
-        if (inputs.encoder_button_starttime - inputs.encoder_button_dbl_press_time
-            < constants.DBL_PRESS_THRESH_S) and not inputs.encoder_button_dbl_press:
+        if (inputs.encoder_button_dbl_press_time
+            and ticks.ticks_diff(inputs.encoder_button_starttime, inputs.encoder_button_dbl_press_time) < constants.DBL_PRESS_THRESH_S * 1000
+            and not inputs.encoder_button_dbl_press):
             inputs.encoder_button_dbl_press_time = 0
             inputs.encoder_button_dbl_press = True
             Menu.toggle_nav_mode()  # Account for first click changing this
             Menu.toggle_lock_mode()
-            inputs.encoder_button_starttime = time.monotonic()  # Avoid erroneous button holds
+            inputs.encoder_button_starttime = ticks.ticks_ms()  # Avoid erroneous button holds
             print_debug("Encoder Button Double Press")
         
         # Encoder button single press
@@ -256,7 +261,7 @@ def process_nav_buttons():
 
     # Handle encoder button held
     if (inputs.encoder_button_state and
-        (time.monotonic() - inputs.encoder_button_starttime) > constants.BUTTON_HOLD_THRESH_S and
+        ticks.ticks_diff(ticks.ticks_ms(), inputs.encoder_button_starttime) > constants.BUTTON_HOLD_THRESH_S * 1000 and
         not inputs.encoder_button_held):
         inputs.encoder_button_held = True
         encoder_button_held_fn = Menu.current_menu.actions.get('encoder_button_held_function')
@@ -269,7 +274,7 @@ def process_nav_buttons():
         if inputs.encoder_button_held:
             inputs.encoder_button_dbl_press_time = 0
         else:
-            inputs.encoder_button_dbl_press_time = time.monotonic()
+            inputs.encoder_button_dbl_press_time = ticks.ticks_ms()
         
         inputs.encoder_button_state = False
         inputs.encoder_button_starttime = 0
@@ -308,10 +313,11 @@ def process_inputs_slow():
     encoder.position = 0
 
     # Process each button (drum pad)
+    timenow = ticks.ticks_ms()
     for button_index in range(16):
         if inputs.button_states[button_index]:
             inputs.button_holdtimes_s[button_index] = (
-                time.monotonic() - inputs.button_press_start_times[button_index]
+                ticks.ticks_diff(timenow, inputs.button_press_start_times[button_index]) / 1000
             )
             if (inputs.button_holdtimes_s[button_index] > constants.BUTTON_HOLD_THRESH_S
                 and not inputs.button_held[button_index]):
@@ -397,7 +403,7 @@ def process_inputs_fast():
         process_inputs_fast()
     """
 
-    global new_notes_on, new_notes_off
+    global new_notes_on, new_notes_off, new_arp_notes_on, new_arp_notes_off
 
     # Reset new press and release states for all buttons
     for button_index in range(16):
@@ -411,7 +417,7 @@ def process_inputs_fast():
         pad = event.key_number
         if event.pressed and not inputs.button_states[pad]:
             inputs.new_press[pad] = True
-            inputs.button_press_start_times[pad] = time.monotonic()
+            inputs.button_press_start_times[pad] = ticks.ticks_ms()
             inputs.button_states[pad] = True
 
         elif not event.pressed and inputs.button_states[pad]:
@@ -421,12 +427,14 @@ def process_inputs_fast():
 
     new_notes_on = []
     new_notes_off = []
+    new_arp_notes_on = []
+    new_arp_notes_off = []
 
     # Clear any OFF arp notes
     new_arp_off_notes = arpeggiator.get_off_notes()
     if new_arp_off_notes:
         for note in new_arp_off_notes:
-            new_notes_off.append(note)
+            new_arp_notes_off.append(note)
 
     # Handle fn button held
     if inputs.fn_button_held:
@@ -475,7 +483,7 @@ def process_inputs_fast():
                     if inputs.velocity_map_mode_midi_val:
                         note = inputs.velocity_map_mode_midi_val
                     for note in get_current_midi_notes():
-                        new_notes_off.append((note, 0, button_index))
+                        new_arp_notes_off.append((note, 0, button_index))
 
                 # Turn on notes - encoder cw
                 if inputs.encoder_delta > 0:
@@ -501,9 +509,9 @@ def process_inputs_fast():
             if not settings.arp_is_polyphonic:
                 last_note = arpeggiator.get_previous_arp_note()
                 if last_note is not None:
-                    new_notes_off.append(last_note)
+                    new_arp_notes_off.append(last_note)
             note = arpeggiator.get_next_arp_note()
-            new_notes_on.append(note)
+            new_arp_notes_on.append(note)
             print(f"new note on {note}")
         
         if get_play_mode() == "encoder":
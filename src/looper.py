@@ -1,45 +1,92 @@
-import adafruit_ticks as ticks
+import timebase as ticks
 import random
 import constants
 from debug import debug, print_debug
 import display
-from midi import send_midi_note_off
+from midi import send_midi_note_off, SOURCE_LOOPER, SOURCE_CHORD
 from clock import clock
 from utils import next_or_previous_index
 from settings import settings
 import settingsmenu
 from display import set_blink_pixel
+from array import array
+from notebuffer import NoteBuffer, NO_EVENT_MS, OPEN_DURATION
+from capturebuffer import capture_buffer
 
 class MidiLoop:
     """
     A class representing a MIDI loop.
 
     Attributes:
-        current_loop_idx (int): Index of the currently playing loop.
-        loops (list): List to store all MidiLoop instances.
-        current_loop (MidiLoop): Reference to the current MidiLoop instance.
-        start_timestamp (int): Time in milliseconds when the loop started playing.
-        total_time_seconds (float): Total duration of the loop in seconds.
-        current_loop_time (float): Current time position within the loop in seconds.
-        notes_on_list (list): List to store tuples of (note, velocity, time) for notes played ON.
-        notes_off_list (list): List to store tuples of (note, velocity, time) for notes played OFF.
-        notes_on_queue (list): Temporary list for notes to be played ON each loop.
-        notes_off_queue (list): Temporary list for notes to be played OFF each loop.
+        current_loop_idx (int): Index of the selected looper track.
+        loops (list): List to store all looper track MidiLoop instances.
+        current_loop (MidiLoop): Reference to the selected looper track.
+        recording_loops (list): Looper tracks that are currently recording.
+        schedule_changed (bool): Set when a loop changes in a way the loop scheduler needs to see.
+        start_timestamp (int): Time in milliseconds when the current lap started playing.
+        loop_length_ms (int): Total duration of the loop in milliseconds, at the tempo it was recorded at.
+        loop_start_ms (int): Note time a lap starts at. Moved by trim_silence instead of shifting every note.
+        last_note_ms (int): Latest note ON or OFF time recorded, for trim_silence.
+        quantize_grid_us (int): Grid notes are quantized to as they are recorded, 0 for none.
+        quantize_strength (int): 0-100, how far recorded notes are moved toward the grid.
+        quantize_origin_ms (int): Note time the grid starts at, where trimming will put the loop start.
+        first_note_ms (int): Played time of the first note when trimming keeps it in place, else NO_EVENT_MS.
+        current_loop_time_ms (int): Current time position within the loop in milliseconds.
+        tempo_den (int): Tempo the loop was recorded at, in hundredths of a BPM.
+        tempo_num (int): Tempo the loop plays at, in hundredths of a BPM.
+        anchor_timestamp (int): ticks_ms time the play position was last pinned.
+        anchor_loop_ms (int): Loop position at anchor_timestamp.
+        anchor_remainder (int): Sub ms part of that position, in units of 1 / tempo_den ms.
+        lap_start_error_ms (int): How late the last lap wrap was noticed, in milliseconds.
+        notes (NoteBuffer): Recorded notes with their durations, sorted by ON time in ms.
+        notes_capacity (int): Max notes in the buffer, allocated when recording starts.
+        on_cursor (int): Index of the next note to play in notes.
+        open_count (int): Number of recorded notes still waiting for their note OFF.
+        active_count (int): Number of loop notes currently sounding.
+        layer_count (int): Overdub passes kept, including undone ones that can be redone.
+        visible_layers (int): Overdub passes that play. Undo and redo only move this.
+        recording_layer (int): Layer new notes are recorded into.
+        layer_note_count (int): Notes recorded in the current pass.
         loop_is_playing (bool): Flag to indicate if the loop is currently playing.
         is_recording (bool): Flag to indicate if the loop is currently recording.
         has_loop (bool): Flag indicating if the loop has recorded notes.
 
     Methods:
+        allocate_note_buffers(): Preallocates the note buffers before recording.
         reset_loop(): Resets the loop to start from the beginning.
+        set_recording_tempo(): Makes the current tempo the tempo the loop is recorded at.
+        set_anchor(timestamp, loop_time_ms, remainder=0): Pins the loop position to a point in time.
+        rebase_anchor(timenow): Moves the anchor to timenow, keeping the exact position.
+        follow_tempo(timenow): Switches playback to the current clock tempo.
+        on_tempo_change(bpm_last, bpm): Called by the clock when the tempo changes.
+        get_loop_time_ms(timenow): Returns the loop position at timenow.
+        restart_lap(loop_time_ms, timenow): Starts the next lap exactly one loop length after the last.
+        update_play_cache(): Recomputes the cached next note due times.
+        get_next_due_ms(): Returns the ticks_ms time the loop next has notes or a lap start due.
+        sync_play_cursors(): Moves the play cursor to the current loop position.
+        add_active_note(note, padidx, off_ms): Remembers a sounding note and when to turn it off.
+        get_next_active_off(): Returns the index of the sounding note that ends first.
+        open_note(note, time_ms, timestamp): Remembers a recorded note ON until its note OFF arrives.
+        close_open_note(note, timestamp): Sets the duration of a recorded note when its note OFF arrives.
+        close_open_notes(timestamp): Ends all recorded notes still waiting for a note OFF.
+        start_layer(): Starts a new overdub layer, dropping undone layers.
+        end_layer(): Finishes the current overdub layer, dropping it if nothing was played.
+        undo_layer(): Hides the last overdub layer.
+        redo_layer(): Shows the last undone overdub layer again.
         clear_loop(): Clears all recorded notes and resets loop attributes.
         toggle_playstate(on_or_off=None): Toggles loop play state on or off.
         toggle_record_state(on_or_off=None): Toggles loop recording state on or off.
         add_loop_note(midi, velocity, padidx, add_or_remove): Adds a note to the loop record.
+        load_from_capture(first_idx, start_ms, quantize_amount): Builds the loop from notes in the capture buffer.
         remove_loop_note(idx): Removes a note from the loop record at the specified index.
         trim_silence(trim_mode=settings.trim_silence_mode): Trims silence at the beginning and end of the loop.
         get_new_notes(): Checks for new notes to be played based on loop position.
-        quantize_loop(): Quantizes the loop length based on the current quantization setting.
-        quantize_notes(): Quantizes the note timings based on the specified quantization amount.
+        get_grid_us(note_type): Returns a note length at the tempo the loop was recorded at.
+        quantize_loop(amount=None): Quantizes the loop length based on the current quantization setting.
+        quantize_notes(): Re-applies the quantize settings to all notes from their played timing.
+        quantize_time(time_ms): Quantizes a note time to the recording grid.
+        quantize_note(note_idx, played_time_ms, played_duration_ms, keep_order=True): Quantizes one note.
+        update_quantize_settings(): Reads the quantize settings used while recording.
         change_chord_loop_mode(): Changes the chord mode setting to the next value in the list.
         get_all_notes_list(): Returns all notes in the loop.
     """
@@ -47,6 +94,8 @@ class MidiLoop:
     current_loop_idx = 0
     loops = []
     current_loop = None
+    recording_loops = []
+    schedule_changed = True
 
     def __init__(self, loop_type="loop", assigned_pad_idx=-1):
         """
@@ -57,12 +106,51 @@ class MidiLoop:
         """
         self.loop_type = loop_type
         self.start_timestamp = 0
-        self.total_time_seconds = 0
-        self.current_loop_time = 0
-        self.notes_on_list = []
-        self.notes_off_list = []
-        self.notes_on_queue = []
-        self.notes_off_queue = []
+        self.loop_length_ms = 0
+        self.loop_start_ms = 0
+        self.last_note_ms = 0
+        self.current_loop_time_ms = 0
+        self.lap_start_error_ms = 0
+        self.quantize_grid_us = 0
+        self.quantize_strength = 100
+        self.quantize_origin_ms = 0
+        self.first_note_ms = NO_EVENT_MS
+
+        # Note times are positions at the recording tempo, scaled to the clock tempo when played
+        self.tempo_den = clock.get_bpm_centi()
+        self.tempo_num = self.tempo_den
+        self.play_bpm = clock.bpm_current
+        self.anchor_timestamp = 0
+        self.anchor_loop_ms = 0
+        self.anchor_remainder = 0
+
+        self.notes_capacity = constants.LOOP_NOTES_LIMIT if loop_type == "loop" else constants.CHORD_NOTES_LIMIT
+        self.notes = EMPTY_NOTE_BUFFER   # Real buffer is allocated when recording starts
+        self.on_cursor = 0
+        self.next_on_ms = NO_EVENT_MS    # Cached due times so the idle check is an int compare
+        self.next_off_ms = NO_EVENT_MS
+
+        # Recorded notes waiting for their note OFF, matched by note number.
+        # Allocated with the note buffer.
+        self.open_count = 0
+        self.open_notes = None
+        self.open_times_ms = None
+        self.open_timestamps = None
+
+        # Loop notes sounding right now and the loop time their note OFF is due
+        self.active_count = 0
+        self.active_notes = None
+        self.active_pads = None
+        self.active_off_ms = None
+
+        # Overdub passes, see start_layer()
+        self.layer_count = 0
+        self.visible_layers = 0
+        self.recording_layer = 0
+        self.layer_note_count = 0
+
+        self.new_notes_on = []          # Reused every call to get_new_notes
+        self.new_notes_off = []
         self.loop_is_playing = False
         self.is_recording = False
         self.has_loop = False
@@ -70,42 +158,330 @@ class MidiLoop:
 
         if self.loop_type == "loop":
             MidiLoop.loops.append(self)
+            clock.add_tempo_listener(self)  # Chord loops come and go, the chord manager passes changes on
+
+    def allocate_note_buffers(self):
+        """
+        Preallocates the note buffer and the open / sounding note columns so
+        recording and playback never allocate. Done once per loop, everything
+        is reused after clear_loop().
+        """
+        if self.notes is EMPTY_NOTE_BUFFER:
+            self.notes = NoteBuffer(self.notes_capacity)
+            self.open_notes = bytearray(constants.LOOP_MAX_ACTIVE_NOTES)
+            self.open_times_ms = array('l', (0 for _ in range(constants.LOOP_MAX_ACTIVE_NOTES)))
+            self.open_timestamps = array('l', (0 for _ in range(constants.LOOP_MAX_ACTIVE_NOTES)))
+            self.active_notes = bytearray(constants.LOOP_MAX_ACTIVE_NOTES)
+            self.active_pads = bytearray(constants.LOOP_MAX_ACTIVE_NOTES)
+            self.active_off_ms = array('l', (0 for _ in range(constants.LOOP_MAX_ACTIVE_NOTES)))
+            print_debug(f"Loop note buffer: {self.notes.get_bytes_used()} bytes")
 
     def reset_loop(self):
         """
-        Resets the loop to start from the beginning.
+        Resets the loop to start from the beginning. While following a running
+        MIDI clock the loop starts at the song position instead, so a loop
+        started after a Song Position Pointer and Continue plays in phase.
         """
-        self.start_timestamp = ticks.ticks_ms()
-        self.notes_on_queue = self.notes_on_list[:]
-        self.notes_off_queue = self.notes_off_list[:]
+        transport = clock.transport
+        if settings.midi_sync and transport.is_running and self.loop_length_ms > 0:
+            # Loop times are ms at the recording tempo
+            song_ms = transport.get_song_position_ms(self.tempo_den)
+            loop_time_ms = self.loop_start_ms + song_ms % self.loop_length_ms
+            self.set_anchor(transport.last_tick_time, loop_time_ms)
+            self.on_cursor = self.notes.find_index(loop_time_ms)
+        else:
+            self.set_anchor(ticks.ticks_ms(), self.loop_start_ms)
+            self.on_cursor = 0
         self.clear_loop_notes_and_pixels()
+        self.update_play_cache()
+
+    def set_recording_tempo(self):
+        """
+        Makes the current clock tempo the tempo the loop is recorded at.
+        Called when a new loop starts recording.
+        """
+        self.tempo_den = clock.get_bpm_centi()
+        self.tempo_num = self.tempo_den
+        self.play_bpm = clock.bpm_current
+
+    def set_anchor(self, timestamp, loop_time_ms, remainder=0):
+        """
+        Pins the loop position to a point in time. The position after that is
+        measured from here at the current tempo.
+
+        Args:
+            timestamp (int): ticks_ms time.
+            loop_time_ms (int): Loop position at that time.
+            remainder (int, optional): Sub ms part of the position, in units of 1 / tempo_den ms. Default is 0.
+        """
+        self.anchor_timestamp = timestamp
+        self.anchor_loop_ms = loop_time_ms
+        self.anchor_remainder = remainder
+        self.start_timestamp = ticks.ticks_add(timestamp, -(loop_time_ms * self.tempo_den // self.tempo_num))
+
+    def rebase_anchor(self, timenow):
+        """
+        Moves the anchor to timenow. The sub ms part of the position is carried
+        over, so rebasing any number of times never drifts.
+
+        Args:
+            timenow (int): ticks_ms time.
+        """
+        elapsed_ms = ticks.ticks_diff(timenow, self.anchor_timestamp)
+        total = self.anchor_remainder + elapsed_ms * self.tempo_num
+        self.set_anchor(timenow, self.anchor_loop_ms + total // self.tempo_den, total % self.tempo_den)
+
+    def follow_tempo(self, timenow):
+        """
+        Switches playback to the current clock tempo. The loop keeps its position
+        and the notes are not touched, so a tempo change is O(1).
+
+        Args:
+            timenow (int): ticks_ms time of the change.
+        """
+        self.rebase_anchor(timenow)
+        self.play_bpm = clock.bpm_current
+        self.tempo_num = clock.get_bpm_centi()
+        self.set_anchor(timenow, self.anchor_loop_ms, self.anchor_remainder)
+        MidiLoop.schedule_changed = True
+
+    def on_tempo_change(self, bpm_last, bpm):
+        """
+        Called by the clock when the tempo changes. A running loop keeps its
+        position and plays on at the new tempo, a stopped loop only takes the
+        new tempo for when it starts.
+
+        Args:
+            bpm_last (float): The previous tempo.
+            bpm (float): The new tempo.
+        """
+        if bpm == self.play_bpm:
+            return
+        if self.loop_is_playing or self.is_recording:
+            self.follow_tempo(ticks.ticks_ms())
+        else:
+            self.play_bpm = bpm
+            self.tempo_num = clock.get_bpm_centi()
+
+    def get_loop_time_ms(self, timenow):
+        """
+        Returns the loop position at timenow, in ms at the tempo the loop was recorded at.
+
+        Args:
+            timenow (int): ticks_ms time.
+
+        Returns:
+            int: Loop position in ms.
+        """
+        elapsed_ms = ticks.ticks_diff(timenow, self.anchor_timestamp)
+        if self.tempo_num == self.tempo_den:
+            return self.anchor_loop_ms + elapsed_ms
+        return self.anchor_loop_ms + (self.anchor_remainder + elapsed_ms * self.tempo_num) // self.tempo_den
+
+    def restart_lap(self, loop_time_ms, timenow):
+        """
+        Starts the next lap exactly one loop length after the previous lap started.
+        However late the main loop noticed the wrap, that lateness is not carried
+        into the next lap, so phase error never accumulates. Notes held across the
+        loop end keep sounding and end on time in the new lap.
+
+        Args:
+            loop_time_ms (int): Loop position at the end of the lap that just ended.
+            timenow (int): ticks_ms time loop_time_ms was measured at.
+
+        Returns:
+            int: Loop position in the new lap.
+        """
+        laps = (loop_time_ms - self.loop_start_ms) // self.loop_length_ms
+        laps_ms = laps * self.loop_length_ms
+        self.rebase_anchor(timenow)
+        self.set_anchor(timenow, self.anchor_loop_ms - laps_ms, self.anchor_remainder)
+        self.lap_start_error_ms = loop_time_ms - laps_ms - self.loop_start_ms
+        self.on_cursor = 0
+        active_off_ms = self.active_off_ms
+        for idx in range(self.active_count):
+            active_off_ms[idx] -= laps_ms
+        self.update_play_cache()
+        debug.add_debug_line("Loop lap start error (ms)", self.lap_start_error_ms)
+        return loop_time_ms - laps_ms
+
+    def update_play_cache(self):
+        """
+        Recomputes the cached next note due times (ms from loop start).
+        Call after anything changes note times.
+        """
+        self.next_on_ms = self.notes.get_time(self.on_cursor)
+        idx = self.get_next_active_off()
+        self.next_off_ms = self.active_off_ms[idx] if idx > -1 else NO_EVENT_MS
+        MidiLoop.schedule_changed = True
+
+    def get_next_due_ms(self):
+        """
+        Returns when get_new_notes() next has something to do: play a note or start a new lap.
+
+        Returns:
+            int: ticks_ms timestamp, or None if the loop is not playing.
+        """
+        if not self.loop_is_playing or self.loop_length_ms <= 0 or self.start_timestamp == 0:
+            return None
+
+        # Notes are played once the loop time has passed them
+        due_ms = min(self.next_on_ms, self.next_off_ms) + 1
+        loop_end_ms = self.loop_start_ms + self.loop_length_ms
+        if due_ms > loop_end_ms:
+            due_ms = loop_end_ms
+
+        # Inverse of get_loop_time_ms, rounded up
+        wait_ms = due_ms - self.anchor_loop_ms
+        if self.tempo_num != self.tempo_den:
+            wait_ms = -((self.anchor_remainder - wait_ms * self.tempo_den) // self.tempo_num)
+        return ticks.ticks_add(self.anchor_timestamp, wait_ms)
+
+    def sync_play_cursors(self):
+        """
+        Moves the play cursor to the current loop position so notes behind the
+        playhead are not replayed after note times are edited. Notes already
+        sounding still end on time.
+        """
+        if self.start_timestamp == 0:
+            self.on_cursor = 0
+        else:
+            loop_time_ms = self.get_loop_time_ms(ticks.ticks_ms())
+            self.on_cursor = self.notes.find_index(loop_time_ms)
+        self.update_play_cache()
+
+    def add_active_note(self, note, padidx, off_ms):
+        """
+        Remembers a sounding loop note and when to turn it off.
+
+        Args:
+            note (int): MIDI note number.
+            padidx (int): Pad index.
+            off_ms (int): Loop time in ms the note OFF is due.
+
+        Returns:
+            bool: False if too many loop notes are already sounding.
+        """
+        idx = self.active_count
+        if idx >= constants.LOOP_MAX_ACTIVE_NOTES:
+            return False
+        self.active_notes[idx] = note
+        self.active_pads[idx] = padidx
+        self.active_off_ms[idx] = off_ms
+        self.active_count = idx + 1
+        if off_ms < self.next_off_ms:
+            self.next_off_ms = off_ms
+        return True
+
+    def get_next_active_off(self):
+        """
+        Returns the index of the sounding note whose note OFF is due first.
+
+        Returns:
+            int: Index into the active note columns, or -1 if no note is sounding.
+        """
+        next_idx = -1
+        next_off_ms = NO_EVENT_MS
+        active_off_ms = self.active_off_ms
+        for idx in range(self.active_count):
+            if active_off_ms[idx] < next_off_ms:
+                next_off_ms = active_off_ms[idx]
+                next_idx = idx
+        return next_idx
 
     def clear_loop_notes_and_pixels(self):
         """
         Turns off all notes and pixels in the loop.
         """
-        note_list_reset = set(note[0] for note in self.notes_on_list)
-        pixel_list_reset = set(note[3] for note in self.notes_on_list)
+        source = SOURCE_LOOPER if self.loop_type == "loop" else SOURCE_CHORD
+        for idx in range(self.active_count):
+            send_midi_note_off(self.active_notes[idx], source)
+            display.pixel_set_note_off(self.active_pads[idx])
+        self.active_count = 0
+        self.next_off_ms = NO_EVENT_MS
+
+    def open_note(self, note, time_ms, timestamp):
+        """
+        Remembers a recorded note ON until its note OFF arrives.
+
+        Args:
+            note (int): MIDI note number.
+            time_ms (int): Loop time in ms the note was stored with.
+            timestamp (int): ticks_ms time of the note ON.
+        """
+        idx = self.open_count
+        if idx >= constants.LOOP_MAX_ACTIVE_NOTES:
+            # No room to wait for the OFF, end it now rather than leave it open
+            note_idx = self.notes.find_open_note(note, time_ms)
+            if note_idx > -1:
+                self.notes.set_duration(note_idx, 0)
+            return
+        self.open_notes[idx] = note
+        self.open_times_ms[idx] = time_ms
+        self.open_timestamps[idx] = timestamp
+        self.open_count = idx + 1
+
+    def close_open_note(self, note, timestamp):
+        """
+        Sets the duration of the oldest open recorded note with this note number.
+
+        Args:
+            note (int): MIDI note number.
+            timestamp (int): ticks_ms time of the note OFF.
+        """
+        open_notes = self.open_notes
+        for idx in range(self.open_count):
+            if open_notes[idx] != note:
+                continue
+            notes = self.notes
+            note_idx = notes.find_open_note(note, self.open_times_ms[idx])
+            if note_idx > -1:
+                held_ms = max(ticks.ticks_diff(timestamp, self.open_timestamps[idx]), 0)
+                duration_ms = held_ms * self.tempo_num // self.tempo_den
+                if self.quantize_grid_us:
+                    note_idx = self.quantize_note(note_idx, notes.times[note_idx] - notes.on_shifts[note_idx], duration_ms)
+                else:
+                    notes.set_duration(note_idx, duration_ms)
+                note_off_ms = notes.times[note_idx] + notes.durations[note_idx]
+                if note_off_ms > self.last_note_ms:
+                    self.last_note_ms = note_off_ms
+
+            last = self.open_count - 1
+            for shift_idx in range(idx, last):
+                open_notes[shift_idx] = open_notes[shift_idx + 1]
+                self.open_times_ms[shift_idx] = self.open_times_ms[shift_idx + 1]
+                self.open_timestamps[shift_idx] = self.open_timestamps[shift_idx + 1]
+            self.open_count = last
+            return
+
+    def close_open_notes(self, timestamp):
+        """
+        Ends all recorded notes still waiting for their note OFF, e.g. when recording stops.
 
-        for note in note_list_reset:
-            send_midi_note_off(note)
-        for pixel in pixel_list_reset:
-            display.pixel_set_note_off(pixel)
+        Args:
+            timestamp (int): ticks_ms time the notes end.
+        """
+        while self.open_count:
+            self.close_open_note(self.open_notes[0], timestamp)
 
     def clear_loop(self):
         """
         Clears all recorded notes and resets loop attributes.
         """
         self.clear_loop_notes_and_pixels()
-        self.notes_on_list.clear()
-        self.notes_off_list.clear()
-        self.notes_on_queue.clear()
-        self.notes_off_queue.clear()
-        self.total_time_seconds = 0
+        self.notes.clear()
+        self.open_count = 0
+        self.layer_count = 0
+        self.visible_layers = 0
+        self.on_cursor = 0
+        self.loop_start_ms = 0
+        self.last_note_ms = 0
+        self.loop_length_ms = 0
         self.start_timestamp = 0
+        self.update_play_cache()
         self.toggle_playstate(False)
         self.toggle_record_state(False)
-        self.current_loop_time = 0
+        self.current_loop_time_ms = 0
         self.has_loop = False
 
         display.display_notification("Loop Cleared")
@@ -118,7 +494,8 @@ class MidiLoop:
             on_or_off (bool, optional): True to turn on, False to turn off. Default is None.
         """
         self.loop_is_playing = on_or_off if on_or_off is not None else not self.loop_is_playing
-        self.current_loop_time = 0
+        self.current_loop_time_ms = 0
+        MidiLoop.schedule_changed = True
         assigned_pad_idx = self.assigned_pad_idx
 
         if self.loop_type not in ["loop"]:
@@ -140,7 +517,8 @@ class MidiLoop:
             else:
                 self.clear_loop_notes_and_pixels()
                 self.start_timestamp = 0
-            display.toggle_play_icon(self.loop_is_playing)
+            if self is MidiLoop.current_loop:
+                display.toggle_play_icon(self.loop_is_playing)
 
         debug.add_debug_line("Loop Playstate", self.loop_is_playing)
 
@@ -151,25 +529,109 @@ class MidiLoop:
         Args:
             on_or_off (bool, optional): True to turn on, False to turn off. Default is None.
         """
+        was_recording = self.is_recording
         self.is_recording = on_or_off if on_or_off is not None else not self.is_recording
-        display.toggle_recording_icon(self.is_recording)
+        if self.loop_type != "loop" or self is MidiLoop.current_loop:
+            display.toggle_recording_icon(self.is_recording)
+
+        if self.loop_type == "loop":
+            if self.is_recording and self not in MidiLoop.recording_loops:
+                MidiLoop.recording_loops.append(self)
+            elif not self.is_recording and self in MidiLoop.recording_loops:
+                MidiLoop.recording_loops.remove(self)
+
+        if self.is_recording:
+            self.allocate_note_buffers()
+            if not was_recording:
+                self.update_quantize_settings()
+                self.start_layer()
+        elif was_recording:
+            self.close_open_notes(ticks.ticks_ms())
+            self.end_layer()
 
         # Recording a new loop
         if self.is_recording and not self.has_loop:
-            self.start_timestamp = ticks.ticks_ms()
+            self.set_recording_tempo()
+            self.set_anchor(ticks.ticks_ms(), 0)
             self.toggle_playstate(True)
 
         # Record mode off and we have notes
         elif not self.is_recording and ((self.has_loop and on_or_off is not False) or self.loop_type in ["chord", "chordloop"]):
-            print(f"time total: {self.total_time_seconds}")
-            if self.total_time_seconds < 0.1:
-                self.total_time_seconds = ticks.ticks_diff(ticks.ticks_ms(), self.start_timestamp) / 1000.0  # Convert to seconds
+            print(f"time total: {self.loop_length_ms} ms")
+            if self.loop_length_ms < 100:
+                self.loop_length_ms = self.get_loop_time_ms(ticks.ticks_ms())
+            self.update_play_cache()
             if settings.midi_sync and not clock.get_playstate() and self.loop_type in ["chord", "chordloop"]:
                 self.toggle_playstate(False)
 
         debug.add_debug_line("Loop Record State", self.is_recording, True)
 
-    def add_loop_note(self, midi, velocity, padidx, add_or_remove):
+    def start_layer(self):
+        """
+        Starts a new overdub layer for the notes about to be recorded.
+
+        Undone layers are dropped, like redo history in an editor. Only
+        constants.LOOP_UNDO_LAYERS passes are kept apart, older ones are merged
+        into the first take so the history never grows past that.
+        """
+        notes = self.notes
+        if self.visible_layers < self.layer_count:
+            notes.delete_layers_from(self.visible_layers)
+            notes.compact()
+            self.sync_play_cursors()
+            self.layer_count = self.visible_layers
+
+        if self.layer_count >= constants.LOOP_UNDO_LAYERS:
+            notes.merge_first_layers()
+            self.layer_count -= 1
+
+        self.recording_layer = self.layer_count
+        self.layer_count += 1
+        self.visible_layers = self.layer_count
+        self.layer_note_count = 0
+
+    def end_layer(self):
+        """
+        Finishes the current overdub layer. A pass where nothing was played is
+        dropped so it does not take an undo step.
+        """
+        if self.layer_note_count == 0 and self.layer_count and self.recording_layer == self.layer_count - 1:
+            self.layer_count -= 1
+            self.visible_layers = self.layer_count
+        self.layer_note_count = 0
+
+    def undo_layer(self):
+        """
+        Hides the last overdub layer. The notes stay in the buffer until the next
+        overdub, so this is O(1) and redo_layer() can bring them back.
+
+        Returns:
+            bool: False if only the first take is left.
+        """
+        if self.is_recording:
+            self.toggle_record_state(False)
+        if self.visible_layers <= 1:
+            display.display_notification("Nothing to undo")
+            return False
+        self.visible_layers -= 1
+        display.display_notification(f"Undo: {self.visible_layers}/{self.layer_count}")
+        return True
+
+    def redo_layer(self):
+        """
+        Shows the last undone overdub layer again.
+
+        Returns:
+            bool: False if there is nothing to redo.
+        """
+        if self.is_recording or self.visible_layers >= self.layer_count:
+            display.display_notification("Nothing to redo")
+            return False
+        self.visible_layers += 1
+        display.display_notification(f"Redo: {self.visible_layers}/{self.layer_count}")
+        return True
+
+    def add_loop_note(self, midi, velocity, padidx, add_or_remove, timestamp=None):
         """
         Adds a note to the loop.
 
@@ -178,6 +640,7 @@ class MidiLoop:
             velocity (int): Velocity of the note.
             padidx (int): Index of the pad.
             add_or_remove (bool): True to add note to the ON queue, False to add note to the OFF queue.
+            timestamp (int, optional): ticks_ms time the note was played or received. Default is now.
         """
         if not self.is_recording:
             print_debug("Not in record mode.. can't add new notes")
@@ -189,39 +652,123 @@ class MidiLoop:
             self.toggle_record_state(False)
             return
 
-        note_time_offset = ticks.ticks_diff(ticks.ticks_ms(), self.start_timestamp) / 1000.0  # Convert to seconds
-        note_data = (midi, velocity, note_time_offset, padidx)
+        timenow = ticks.ticks_ms() if timestamp is None else timestamp
+        note_time_ms = self.get_loop_time_ms(timenow)
+        if note_time_ms < self.loop_start_ms:
+            # Received before this lap started, it belongs at the end of the last one
+            if self.loop_length_ms:
+                note_time_ms += self.loop_length_ms
+            else:
+                note_time_ms = self.loop_start_ms
+
+        # The OFF completes the note recorded with its ON
+        if not add_or_remove:
+            self.close_open_note(midi, timenow)
+            return
 
-        if len(self.notes_on_list) > constants.LOOP_NOTES_LIMIT:
+        notes = self.notes
+        if notes.is_full() and notes.deleted_count:
+            notes.compact()
+            self.sync_play_cursors()
+        if notes.is_full():
             display.display_notification("MAX NOTES REACHED")
             self.toggle_record_state(False)
             return
 
-        if add_or_remove:
-            if not self.has_loop:
-                self.has_loop = True
-            self.notes_on_list.append(note_data)
-            print(f"num notes in looper: {len(self.notes_on_list)}")
-        else:
-            self.notes_off_list.append(note_data)
+        # Overdubs land between notes from earlier passes. The new note is already
+        # sounding, so step the cursor past it instead of replaying it this lap.
+        # Chord notes are quantized here, so stopping the recording has nothing left to do.
+        # The first note stays put when trimming the start, the grid counts from it.
+        is_first_note = not self.has_loop
+        if not self.has_loop:
+            self.has_loop = True
+        note_idx = notes.insert(midi, velocity, note_time_ms, padidx, layer=self.recording_layer)
+        if is_first_note and settings.trim_silence_mode in ["start", "both"]:
+            self.quantize_origin_ms = note_time_ms - 75
+            self.first_note_ms = note_time_ms
+        if self.quantize_grid_us:
+            note_idx = self.quantize_note(note_idx, note_time_ms, OPEN_DURATION)
+        if note_idx <= self.on_cursor:
+            self.on_cursor += 1
+        self.layer_note_count += 1
+        note_time_ms = notes.times[note_idx]
+        if note_time_ms > self.last_note_ms:
+            self.last_note_ms = note_time_ms
+        self.open_note(midi, note_time_ms, timenow)
+        self.update_play_cache()
+
+        debug.add_debug_line("Num Midi notes in looper", len(notes))
+
+    def load_from_capture(self, first_idx, start_ms, quantize_amount):
+        """
+        Builds the loop from the notes in the capture buffer and starts it playing in
+        phase, as if record had been pressed at start_ms. Notes still held are ended
+        with the loop.
 
-        debug.add_debug_line("Num Midi notes in looper", len(self.notes_on_list))
+        Args:
+            first_idx (int): Capture buffer index of the first note ON to keep.
+            start_ms (int): ticks_ms time the loop starts, the time of that first note.
+            quantize_amount (str): Grid the loop length is snapped up to, see quantize_loop().
+        """
+        self.allocate_note_buffers()
+        self.notes.clear()
+        self.set_recording_tempo()
+        self.quantize_grid_us = 0
+        self.loop_start_ms = 0
+        self.last_note_ms = 0
+        self.open_count = 0
+        self.layer_count = 1
+        self.visible_layers = 1
+        self.recording_layer = 0
+
+        self.loop_length_ms = max(ticks.ticks_diff(ticks.ticks_ms(), start_ms), 1)
+        self.quantize_loop(quantize_amount)
+
+        # OFFs of notes that started before the loop find no open note and are skipped
+        for idx in range(first_idx, capture_buffer.count):
+            col = capture_buffer.get_column_idx(idx)
+            note = capture_buffer.notes[col]
+            timestamp = capture_buffer.times[col]
+            if not capture_buffer.is_on[col]:
+                self.close_open_note(note, timestamp)
+                continue
+            time_ms = ticks.ticks_diff(timestamp, start_ms)
+            if self.notes.insert(note, capture_buffer.velocities[col], time_ms, capture_buffer.pads[col]) > -1:
+                self.open_note(note, time_ms, timestamp)
+
+        self.close_open_notes(ticks.ticks_add(start_ms, self.loop_length_ms - 1))
+
+        self.has_loop = True
+        self.loop_is_playing = True
+        self.set_anchor(start_ms, 0)
+        self.current_loop_time_ms = 0
+        self.sync_play_cursors()  # Captured notes were just played live
+        if self is MidiLoop.current_loop:
+            display.toggle_play_icon(True)
+        debug.add_debug_line("Num Midi notes in looper", len(self.notes))
 
     def remove_loop_note(self, idx):
         """
         Removes a note from the loop record at the specified index.
+        The note is only marked deleted, so this is O(1). If it is sounding
+        it still gets its note OFF. Marked notes are dropped in one pass once
+        they make up half the buffer.
 
         Args:
             idx (int): Index of the note to be removed.
+
+        Returns:
+            bool: True if a note was removed.
         """
-        if 0 <= idx < len(self.notes_on_list):
-            try:
-                self.notes_on_list.pop(idx)
-                self.notes_off_list.pop(idx)
-            except IndexError:
-                print_debug("Couldn't remove note")
-        else:
+        notes = self.notes
+        if not 0 <= idx < notes.count or not notes.delete(idx):
             print_debug("Cannot remove loop note - invalid index")
+            return False
+
+        if notes.deleted_count * 2 > notes.count:
+            notes.compact()
+            self.sync_play_cursors()
+        return True
 
     def trim_silence(self):
         """
@@ -237,7 +784,8 @@ class MidiLoop:
         Returns:
             None
         """
-        if not self.notes_on_list:
+        notes = self.notes
+        if not len(notes):
             return
         
         trim_mode=settings.trim_silence_mode
@@ -246,135 +794,202 @@ class MidiLoop:
             print("No trimming")
             return
 
+        # Moving the loop start and end instead of the notes keeps this O(1)
+        first_note_on_time = self.first_note_ms
+        if first_note_on_time == NO_EVENT_MS:
+            first_note_on_time = notes.times[notes.find_live_index(0)]
         if trim_mode in ["start", "both"]:
-            first_note_on_time = self.notes_on_list[0][2]
-            for idx, (note, vel, hit_time, padidx) in enumerate(self.notes_on_list):
-                new_time = hit_time - first_note_on_time + 0.075
-                self.notes_on_list[idx] = (note, vel, new_time, padidx)
-
-            for idx, (note, vel, hit_time, padidx) in enumerate(self.notes_off_list):
-                new_time = hit_time - first_note_on_time + 0.075
-                self.notes_off_list[idx] = (note, vel, new_time, padidx)
-            
-            self.total_time_seconds -= first_note_on_time + 0.075
+            self.loop_start_ms = first_note_on_time - 75
+            self.loop_length_ms -= first_note_on_time + 75
 
         if trim_mode in ["end", "both"]:
-            first_note_on_time = self.notes_on_list[0][2]
-            last_note_off_time = self.notes_off_list[-1][2]
-            new_length = last_note_off_time - first_note_on_time + 0.01
-            self.total_time_seconds = new_length
-
-            if len(self.notes_on_list) != len(self.notes_off_list):
-                print("oops")
-                last_note = self.notes_on_list[-1][0]
-                self.notes_off_list.append(
-                    (last_note, 0, new_length - 0.05, self.notes_on_list[-1][3])
-                )
+            self.loop_length_ms = self.last_note_ms - first_note_on_time + 10
+
+        self.sync_play_cursors()
 
     def get_new_notes(self):
         """
         Checks for new notes to be played based on loop position.
 
+        Notes are stored sorted by ON time, so each call only compares the loop position
+        against the next note under the play cursor and the first sounding note to end.
+        Each played note schedules its own OFF from its duration. The returned lists are
+        reused between calls - consume them before calling again.
+
         Returns:
             tuple: Tuple in the form (on_array, off_array) containing new notes to play ON and OFF.
         """
-        new_notes_on = []
-        new_notes_off = []
-
-        if not self.total_time_seconds > 0 or self.start_timestamp == 0:
+        if self.loop_length_ms <= 0 or self.start_timestamp == 0:
             return None
 
-        now_time = ticks.ticks_ms()
-        if ticks.ticks_diff(now_time, self.start_timestamp) > self.total_time_seconds * 1000:  # Convert to milliseconds
-            print_debug(f"self.total_time_seconds: {self.total_time_seconds}")
-
-            if self.loop_type in ('loop', 'chordloop'):
-                self.reset_loop()
-
+        timenow = ticks.ticks_ms()
+        loop_time_ms = self.get_loop_time_ms(timenow)
+        if loop_time_ms >= self.loop_start_ms + self.loop_length_ms:
             if self.loop_type == "chord":
                 self.toggle_playstate(False)
+                return None
 
-            return None
+            # Notes due early in the new lap go out on this call
+            loop_time_ms = self.restart_lap(loop_time_ms, timenow)
 
-        self.current_loop_time = ticks.ticks_diff(now_time, self.start_timestamp) / 1000.0  # Convert to seconds
+        if self.next_on_ms >= loop_time_ms and self.next_off_ms >= loop_time_ms:
+            return None
 
-        for idx, (note, vel, hit_time, padidx) in enumerate(self.notes_on_queue):
-            if hit_time < self.current_loop_time:
-                new_notes_on.append((note, vel, padidx))
-                self.notes_on_queue.pop(idx)
-                display.pixel_set_note_on(padidx)
+        self.current_loop_time_ms = loop_time_ms
+        new_notes_on = self.new_notes_on
+        new_notes_off = self.new_notes_off
+        del new_notes_on[:]  # Keeps the list allocation, unlike clear()
+        del new_notes_off[:]
+
+        notes = self.notes
+        while self.next_on_ms < loop_time_ms:
+            idx = self.on_cursor
+            velocity = notes.velocities[idx]
+            duration_ms = notes.durations[idx]
+            # Skip deleted and undone notes, and notes still held while overdubbing
+            if velocity and duration_ms != OPEN_DURATION and notes.layers[idx] < self.visible_layers:
+                note = notes.notes[idx]
+                padidx = notes.pads[idx]
+                if self.add_active_note(note, padidx, notes.times[idx] + duration_ms):
+                    new_notes_on.append((note, velocity, padidx))
+                    display.pixel_set_note_on(padidx)
+            self.on_cursor = idx + 1
+            self.next_on_ms = notes.get_time(idx + 1)
+
+        while self.next_off_ms < loop_time_ms:
+            idx = self.get_next_active_off()
+            padidx = self.active_pads[idx]
+            new_notes_off.append((self.active_notes[idx], 0, padidx))
+            display.pixel_set_note_off(padidx)
+
+            last = self.active_count - 1
+            self.active_notes[idx] = self.active_notes[last]
+            self.active_pads[idx] = self.active_pads[last]
+            self.active_off_ms[idx] = self.active_off_ms[last]
+            self.active_count = last
+            idx = self.get_next_active_off()
+            self.next_off_ms = self.active_off_ms[idx] if idx > -1 else NO_EVENT_MS
+
+        return new_notes_on, new_notes_off
+
+    def get_grid_us(self, note_type):
+        """
+        Returns a note length at the tempo the loop was recorded at, for quantizing its note times.
 
-        for idx, (note, vel, hit_time, padidx) in enumerate(self.notes_off_queue):
-            if hit_time < self.current_loop_time:
-                new_notes_off.append((note, vel, padidx))
-                self.notes_off_queue.pop(idx)
-                display.pixel_set_note_off(padidx)
+        Args:
+            note_type (str): The type of note, see Clock.get_note_duration_seconds.
 
-        if new_notes_on or new_notes_off:
-            return new_notes_on, new_notes_off
+        Returns:
+            int: Note length in microseconds.
+        """
+        return clock.get_note_duration_us(note_type) * self.tempo_num // self.tempo_den
 
-    def quantize_loop(self):
+    def quantize_loop(self, amount=None):
         """
         Quantizes the loop length based on the current quantization setting.
 
+        Args:
+            amount (str, optional): Grid to use instead of the setting, e.g. "1" for a bar. Default is None.
+
         Returns:
             None
         """
-        amount = settings.quantize_loop
+        if amount is None:
+            amount = settings.quantize_loop
         if amount == "none":
             return
         
-        quantization_ms = clock.get_note_duration_seconds(amount)
-        remainder = self.total_time_seconds % quantization_ms
-        adjustment = quantization_ms - remainder
-        self.total_time_seconds += adjustment
+        # Grid in us so long loops don't pick up the rounding of a ms grid
+        grid_us = self.get_grid_us(amount)
+        remainder = (self.loop_length_ms * 1000) % grid_us
+        if remainder:
+            self.loop_length_ms = (self.loop_length_ms * 1000 + grid_us - remainder + 500) // 1000
 
-    def quantize_notes(self):
+    def update_quantize_settings(self):
         """
-        Quantizes the note timings based on the specified quantization amount.
+        Reads the quantize settings used for notes as they are recorded.
+        Only chord loops are quantized.
+        """
+        if self.loop_type == "loop" or settings.quantize_time == "none":
+            self.quantize_grid_us = 0
+        else:
+            self.quantize_grid_us = self.get_grid_us(settings.quantize_time)
+        self.quantize_strength = get_quantization_percent(True)
+        if not self.has_loop:
+            self.quantize_origin_ms = 0
+            self.first_note_ms = NO_EVENT_MS
 
-        Returns:
-            None
+    def quantize_time(self, time_ms):
         """
-        if settings.quantize_time == "none":
-            return
+        Quantizes a note time to the recording grid, counted from quantize_origin_ms.
 
-        note_time_ms = clock.get_note_duration_seconds(settings.quantize_time)
-        quantization_percent = get_quantization_percent()  # Assume this returns a value between 0 and 1
+        Args:
+            time_ms (int): Note time in ms.
 
-        def quantize_time(hit_time):
-            """
-            Quantizes a given hit time to the nearest quantization amount.
+        Returns:
+            int: The quantized time in ms, or time_ms if quantizing is off.
+        """
+        if not self.quantize_grid_us:
+            return time_ms
+        origin_ms = self.quantize_origin_ms
+        return origin_ms + quantize_time_ms(time_ms - origin_ms, self.quantize_grid_us, self.quantize_strength)
 
-            Args:
-                hit_time (float): The original hit time.
+    def quantize_note(self, note_idx, played_time_ms, played_duration_ms, keep_order=True):
+        """
+        Quantizes one note from its played timing and remembers how far it was moved.
+        The OFF is quantized on its own and moves with its note. A note is never
+        quantized shorter than one grid step.
 
-            Returns:
-                float: The quantized hit time.
-            """
-            remainder = hit_time % note_time_ms
-            if remainder > note_time_ms / 2:
-                update_amt = (note_time_ms - remainder) * quantization_percent
-                new_time = hit_time + update_amt
-            else:
-                update_amt = remainder * quantization_percent
-                new_time = hit_time - update_amt
-            return new_time
+        Args:
+            note_idx (int): Index of the note.
+            played_time_ms (int): ON time as played.
+            played_duration_ms (int): Duration as played, or OPEN_DURATION if the OFF is not in yet.
+            keep_order (bool, optional): Move the note back into time order. Default is True.
 
-        # Quantize note on times
-        for idx, (note, vel, hit_time, padidx) in enumerate(self.notes_on_list):
-            if idx == 0 and settings.trim_silence_mode in ["start", "both"]:
-                continue
+        Returns:
+            int: The index of the note after it moved.
+        """
+        notes = self.notes
+        time_ms = played_time_ms
+        if played_time_ms != self.first_note_ms:
+            time_ms = self.quantize_time(played_time_ms)
+
+        duration_shift_ms = 0
+        if played_duration_ms != OPEN_DURATION:
+            duration_ms = self.quantize_time(played_time_ms + played_duration_ms) - time_ms
+            if duration_ms <= 0:
+                # ON and OFF snapped to the same grid line, keep the note one grid step long
+                duration_ms = (self.quantize_grid_us + 500) // 1000
+            notes.set_duration(note_idx, duration_ms)
+            duration_shift_ms = duration_ms - played_duration_ms
+        notes.set_shifts(note_idx, time_ms - played_time_ms, duration_shift_ms)
+
+        if notes.times[note_idx] != time_ms:
+            notes.set_time(note_idx, time_ms)
+            if keep_order:
+                note_idx = notes.sort_one(note_idx)
+        return note_idx
 
-            new_time = quantize_time(hit_time)
-            print(f"Original On Hit Time: {hit_time}, Quantized On Hit Time: {new_time}")
-            self.notes_on_list[idx] = (note, vel, new_time, padidx)
+    def quantize_notes(self):
+        """
+        Re-applies the current quantize settings to every note, starting from the
+        timing as it was played. Notes are quantized as they are recorded, this is
+        only needed when the grid or strength changes afterwards.
 
-        # Quantize note off times
-        for idx, (note, vel, hit_time, padidx) in enumerate(self.notes_off_list):
-            new_time = quantize_time(hit_time)
-            print(f"Original Off Hit Time: {hit_time}, Quantized Off Hit Time: {new_time}")
-            self.notes_off_list[idx] = (note, vel, new_time, padidx)
+        Returns:
+            None
+        """
+        self.update_quantize_settings()
+        notes = self.notes
+        for idx in range(notes.count):
+            played_time_ms = notes.times[idx] - notes.on_shifts[idx]
+            duration_ms = notes.durations[idx]
+            if duration_ms != OPEN_DURATION:
+                duration_ms -= notes.duration_shifts[idx]
+            self.quantize_note(idx, played_time_ms, duration_ms, False)
+
+        notes.sort_by_time()
+        self.sync_play_cursors()
 
     def change_chord_loop_mode(self, mode=""):
         """
@@ -397,9 +1012,105 @@ class MidiLoop:
         Returns:
             list: A list of tuples containing note, velocity, and pad index.
         """
-        return [(note[0], note[1], note[3]) for note in self.notes_on_list]
+        notes = self.notes
+        return [(notes.notes[idx], notes.velocities[idx], notes.pads[idx]) for idx in range(notes.count)
+                if notes.velocities[idx] and notes.layers[idx] < self.visible_layers]
 
 
+EMPTY_NOTE_BUFFER = NoteBuffer(0)  # Placeholder until a loop starts recording
+
+class LoopScheduler:
+    """
+    Services every looper track from one shared due time.
+
+    Each track knows when it next has work (a note or a new lap). The scheduler keeps
+    the earliest of those, so an iteration where nothing is due is one ticks compare
+    no matter how many tracks or notes there are. The tracks are only looked at again
+    after one was serviced, a loop changed or the tempo changed.
+
+    Attributes:
+        tracks (list): The looper tracks to service.
+        next_due_ms (int): ticks_ms time the earliest track is due.
+        has_due_track (bool): False when no track is playing.
+        due_tracks (list): Reused list returned by get_due_loops.
+
+    Methods:
+        update_next_due(): Recomputes the earliest due time over all tracks.
+        get_due_loops(): Returns the tracks that have notes or a lap start due now.
+    """
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.next_due_ms = 0
+        self.has_due_track = False
+        self.due_tracks = []
+
+    def update_next_due(self):
+        """
+        Recomputes the earliest due time over all tracks.
+        """
+        MidiLoop.schedule_changed = False
+        self.has_due_track = False
+        for track in self.tracks:
+            due_ms = track.get_next_due_ms()
+            if due_ms is None:
+                continue
+            if not self.has_due_track or ticks.ticks_diff(due_ms, self.next_due_ms) < 0:
+                self.next_due_ms = due_ms
+                self.has_due_track = True
+
+    def get_due_loops(self):
+        """
+        Returns the tracks that have notes or a lap start due now.
+        Call get_new_notes() on each of them.
+
+        Returns:
+            list: Due MidiLoop tracks. The same list object is reused every call.
+        """
+        due_tracks = self.due_tracks
+        del due_tracks[:]
+
+        if MidiLoop.schedule_changed:   # Also set by tracks following a tempo change
+            self.update_next_due()
+        if not self.has_due_track:
+            return due_tracks
+
+        timenow = ticks.ticks_ms()
+        if ticks.ticks_diff(timenow, self.next_due_ms) < 0:
+            return due_tracks
+
+        for track in self.tracks:
+            due_ms = track.get_next_due_ms()
+            if due_ms is not None and ticks.ticks_diff(timenow, due_ms) >= 0:
+                due_tracks.append(track)
+
+        # Serviced tracks move their cursors, look again next call
+        MidiLoop.schedule_changed = True
+        return due_tracks
+
+loop_scheduler = LoopScheduler(MidiLoop.loops)
+undo_used_while_held = False  # fn button hold turned into undo / redo, don't clear on release
+
+def quantize_time_ms(time_ms, grid_us, strength):
+    """
+    Moves a time toward the nearest grid line, all in integer math.
+
+    Args:
+        time_ms (int): Time in ms from the loop start.
+        grid_us (int): Grid size in microseconds.
+        strength (int): 0-100, how far to move toward the grid line.
+
+    Returns:
+        int: The quantized time in ms.
+    """
+    time_us = time_ms * 1000
+    remainder = time_us % grid_us
+    if remainder > grid_us // 2:
+        time_us += (grid_us - remainder) * strength // 100
+    else:
+        time_us -= remainder * strength // 100
+    return (time_us + 500) // 1000
+
 def get_loopermode_display_text():
     """
     Returns the display text for the looper mode.
@@ -407,7 +1118,7 @@ def get_loopermode_display_text():
     Returns:
         list: The display text.
     """
-    return ["<- click = record ", "   dbl  = st/stop", "   hold = clear loop"]
+    return [f"<- click = record  T{MidiLoop.current_loop_idx + 1}", "   dbl  = st/stop", "   hold = clear loop"]
 
 def update_play_rec_icons():
     """
@@ -432,19 +1143,47 @@ def process_select_btn_press(action_type="press"):
     if action_type == "press":
         MidiLoop.current_loop.toggle_record_state()
 
-def clear_all_loops(onRelease=True):
+def clear_all_loops(trigger_on_release=False):
     """
-    Clears all playing loops.
+    Clears the current loop when the fn button is released after a hold.
+    Nothing is cleared if the hold was used to undo or redo overdubs.
 
     Args:
-        released (bool, optional): Not used. Default is False.
+        trigger_on_release (bool, optional): True when called on release. Default is False.
 
     Returns:
         None
     """
+    global undo_used_while_held
+    if not trigger_on_release:
+        undo_used_while_held = False
+        return
+
+    if undo_used_while_held:
+        undo_used_while_held = False
+        return
+
     print_debug("Clearing all loops")
     MidiLoop.current_loop.clear_loop()
 
+def undo_or_redo_layer(redo=False):
+    """
+    Undoes or redoes the last overdub pass on the current loop.
+    Used with the fn button held, so releasing it does not clear the loop.
+
+    Args:
+        redo (bool, optional): True to redo (encoder right), False to undo (encoder left). Default is False.
+
+    Returns:
+        None
+    """
+    global undo_used_while_held
+    undo_used_while_held = True
+    if redo:
+        MidiLoop.current_loop.redo_layer()
+    else:
+        MidiLoop.current_loop.undo_layer()
+
 def toggle_loops_playstate():
     """
     Stops all playing loops and turns off recording.
@@ -458,6 +1197,8 @@ def toggle_loops_playstate():
 def encoder_chg_function(direction):
     """
     Called when the encoder changes in the looper menu.
+    Turning right on an empty track captures the last few bars into it.
+    Turning left removes a random note.
 
     Args:
         direction (bool): True for clockwise, False for counterclockwise.
@@ -465,23 +1206,67 @@ def encoder_chg_function(direction):
     Returns:
         None
     """
-    notes_ary_length = len(MidiLoop.current_loop.notes_on_list)
-    if notes_ary_length < 1:
+    if direction and not MidiLoop.current_loop.has_loop and not MidiLoop.current_loop.is_recording:
+        capture_last_bars()
+        return
+
+    notes = MidiLoop.current_loop.notes
+    if len(notes) < 1:
         return
 
     if not direction:
-        remove_idx = random.randint(0, notes_ary_length - 1)
+        remove_idx = notes.find_live_index(random.randint(0, notes.count - 1))
         MidiLoop.current_loop.remove_loop_note(remove_idx)
         display.display_notification(f"Removed note: {remove_idx + 1}")
 
+def capture_last_bars(num_bars=constants.CAPTURE_BARS):
+    """
+    Turns the notes played in the last few bars into a loop on the current track,
+    without record having been armed. The loop starts at the first note and its
+    length is snapped up to the loop quantize setting (a bar if that is off).
+
+    Args:
+        num_bars (int, optional): How many bars back to look. Default is constants.CAPTURE_BARS.
+
+    Returns:
+        None
+    """
+    bar_ms = clock.get_note_duration_us("1") // 1000
+    since_ms = ticks.ticks_add(ticks.ticks_ms(), -num_bars * bar_ms)
+    first_idx = capture_buffer.find_first_on_since(since_ms)
+    if first_idx < 0:
+        display.display_notification("Nothing to capture")
+        return
+
+    start_ms = capture_buffer.times[capture_buffer.get_column_idx(first_idx)]
+    quantize_amount = settings.quantize_loop if settings.quantize_loop != "none" else "1"
+    MidiLoop.current_loop.load_from_capture(first_idx, start_ms, quantize_amount)
+    display.display_notification(f"Captured T{MidiLoop.current_loop_idx + 1}")
+
+def select_next_or_prev_track(up_or_down=True):
+    """
+    Selects the next or previous looper track. The other tracks keep playing and recording.
+
+    Args:
+        up_or_down (bool): True for the next track, False for the previous track.
+
+    Returns:
+        None
+    """
+    MidiLoop.current_loop_idx = next_or_previous_index(MidiLoop.current_loop_idx, len(MidiLoop.loops), up_or_down)
+    MidiLoop.current_loop = MidiLoop.loops[MidiLoop.current_loop_idx]
+    update_play_rec_icons()
+    display.display_notification(f"Track {MidiLoop.current_loop_idx + 1}")
+
 def setup_midi_loops():
     """
-    Initializes a MIDI loop and sets it as the current loop object.
+    Initializes the looper tracks and sets the first one as the current loop object.
 
     Returns:
         None
     """
-    _ = MidiLoop()
+    for _ in range(constants.NUM_LOOP_TRACKS):
+        MidiLoop()
     MidiLoop.current_loop = MidiLoop.loops[MidiLoop.current_loop_idx]
 
 def set_next_or_prev_quantization(up_or_down=True):
@@ -164,6 +164,8 @@ looper_menu = Menu(
         'fn_button_press_function': looper.process_select_btn_press,
         'fn_button_dbl_press_function': looper.toggle_loops_playstate,
         'fn_button_held_function': looper.clear_all_loops,
+        'fn_button_held_and_encoder_change_function': looper.undo_or_redo_layer,
+        'encoder_button_press_and_turn_function': looper.select_next_or_prev_track,
     }
 )
 
@@ -1,17 +1,12 @@
+from array import array
+import timebase as ticks
 from clock import clock
 
-import adafruit_midi
-from adafruit_midi.control_change import ControlChange
-from adafruit_midi.note_off import NoteOff
-from adafruit_midi.note_on import NoteOn
-from adafruit_midi.pitch_bend import PitchBend
-from adafruit_midi.start import Start
-from adafruit_midi.stop import Stop
-from adafruit_midi.timing_clock import TimingClock
 import busio
 from debug import debug, print_debug
 from display import display_text_middle, display_selected_dot,pixel_set_note_on
 import usb_midi
+from notebuffer import NO_EVENT_MS
 from utils import next_or_previous_index
 from midiscales import get_all_scales_list, get_midi_banks_chromatic, get_scale_display_text, NUM_ROOTS
 from globalstates import global_states
@@ -23,28 +18,1187 @@ NUM_PADS = 16
 ENC_BUTTON_IDX = 17
 
 uart = busio.UART(constants.UART_MIDI_TX, constants.UART_MIDI_RX, baudrate=31250,timeout=0.001)
+usb_port_in = usb_midi.ports[0]
+usb_port_out = usb_midi.ports[1]
+
+# Outgoing messages are encoded straight into midi_out_batch and written to the ports once per
+# main loop iteration. Building a NoteOn / NoteOff object per note and port allocates on every note.
+NOTE_ON_STATUS = 0x90
+NOTE_OFF_STATUS = 0x80
+CONTROL_CHANGE_STATUS = 0xB0
+CHANNEL_PRESSURE_STATUS = 0xD0
+ALL_NOTES_OFF_CC = 123
+MIDI_DIN_BYTES_PER_S = 3125  # 31250 baud, 10 bits per byte
+TIMING_CLOCK_BYTE = 0xF8
+START_BYTE = 0xFA
+CONTINUE_BYTE = 0xFB
+STOP_BYTE = 0xFC
+SONG_POSITION_BYTE = 0xF2
+
+class MidiRouting:
+    """
+    Which ports MIDI is sent to and received from, worked out from the
+    midi_type, midi_usb_io and midi_aux_io settings. Rebuilt only when one of
+    those settings changes, so sending and receiving notes does no string work.
+
+    Attributes:
+        send_usb (bool): Send MIDI over USB.
+        send_aux (bool): Send MIDI over the DIN / TRS port.
+        receive_usb (bool): Receive MIDI over USB.
+        receive_aux (bool): Receive MIDI over the DIN / TRS port.
+        usb_out: USB port outgoing messages are written to, or None.
+        aux_out: UART outgoing messages are written to, or None.
+
+    Methods:
+        update(): Rebuilds the table from the settings.
+    """
+
+    def __init__(self):
+        self.update()
+
+    def update(self):
+        """
+        Rebuilds the table from the settings. Call after midi_type, midi_usb_io or midi_aux_io change.
+        """
+        midi_type = s.midi_type.upper()
+        use_usb = midi_type in ('USB', 'ALL')
+        use_aux = midi_type in ('AUX', 'ALL')
+        self.send_usb = use_usb and s.midi_usb_io in ('both', 'out')
+        self.send_aux = use_aux and s.midi_aux_io in ('both', 'out')
+        self.receive_usb = use_usb and s.midi_usb_io in ('both', 'in')
+        self.receive_aux = use_aux and s.midi_aux_io in ('both', 'in')
+
+        self.usb_out = usb_port_out if self.send_usb else None
+        self.aux_out = uart if self.send_aux else None
+
+midi_routing = MidiRouting()
+
+class ActiveNoteTracker:
+    """
+    Which notes are sounding on each MIDI channel, as they went out on the wire.
+    One bit per note, 16 bytes per channel.
+
+    Attributes:
+        bits (bytearray): 128 bits per channel, channel * 16 + note // 8.
+        channel_counts (bytearray): Sounding notes per channel.
+        on_times (array): ticks_ms time of the last note ON per note number, any channel.
+
+    Methods:
+        is_on(channel, note): Returns True if the note is sounding.
+        note_on(channel, note, timenow): Marks a note as sounding.
+        note_off(channel, note): Marks a note as not sounding.
+        clear_channel(channel): Marks every note on a channel as not sounding.
+        get_channel_notes(channel): Returns the notes sounding on a channel.
+        get_stuck_notes(min_age_ms, timenow): Returns the notes sounding for longer than min_age_ms.
+    """
+
+    def __init__(self):
+        self.bits = bytearray(16 * 16)
+        self.channel_counts = bytearray(16)
+        self.on_times = array('l', (0 for _ in range(128)))
+
+    def is_on(self, channel, note):
+        """
+        Returns True if the note is sounding on the channel.
+        """
+        return bool(self.bits[(channel << 4) | (note >> 3)] & (1 << (note & 7)))
+
+    def note_on(self, channel, note, timenow):
+        """
+        Marks a note as sounding.
+
+        Args:
+            channel (int): MIDI channel (0-15).
+            note (int): MIDI note number.
+            timenow (int): ticks_ms time of the note ON.
+
+        Returns:
+            bool: False if the note was already sounding.
+        """
+        idx = (channel << 4) | (note >> 3)
+        mask = 1 << (note & 7)
+        if self.bits[idx] & mask:
+            return False
+        self.bits[idx] |= mask
+        self.channel_counts[channel] += 1
+        self.on_times[note] = timenow
+        return True
+
+    def note_off(self, channel, note):
+        """
+        Marks a note as not sounding.
+
+        Args:
+            channel (int): MIDI channel (0-15).
+            note (int): MIDI note number.
+
+        Returns:
+            bool: False if the note was not sounding.
+        """
+        idx = (channel << 4) | (note >> 3)
+        mask = 1 << (note & 7)
+        if not self.bits[idx] & mask:
+            return False
+        self.bits[idx] &= ~mask
+        self.channel_counts[channel] -= 1
+        return True
+
+    def clear_channel(self, channel):
+        """
+        Marks every note on a channel as not sounding.
+
+        Args:
+            channel (int): MIDI channel (0-15).
+        """
+        start = channel << 4
+        for idx in range(start, start + 16):
+            self.bits[idx] = 0
+        self.channel_counts[channel] = 0
+
+    def get_channel_notes(self, channel):
+        """
+        Returns the notes sounding on a channel.
+
+        Args:
+            channel (int): MIDI channel (0-15).
+
+        Returns:
+            list: MIDI note numbers, lowest first.
+        """
+        notes = []
+        if not self.channel_counts[channel]:
+            return notes
+        start = channel << 4
+        for byte_idx in range(16):
+            byte = self.bits[start + byte_idx]
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    notes.append(byte_idx * 8 + bit)
+        return notes
+
+    def get_stuck_notes(self, min_age_ms, timenow):
+        """
+        Returns the notes that have been sounding for longer than min_age_ms.
+
+        Args:
+            min_age_ms (int): Age in ms a note counts as stuck from.
+            timenow (int): Current ticks_ms time.
+
+        Returns:
+            list: (channel, note, age_ms) tuples.
+        """
+        stuck = []
+        for channel in range(16):
+            for note in self.get_channel_notes(channel):
+                age_ms = ticks.ticks_diff(timenow, self.on_times[note])
+                if age_ms >= min_age_ms:
+                    stuck.append((channel, note, age_ms))
+        return stuck
+
+active_notes = ActiveNoteTracker()
+
+# Output priorities, drained in this order
+PRIORITY_REALTIME = 0
+PRIORITY_NOTE_OFF = 1
+PRIORITY_NOTE_ON = 2
+PRIORITY_OTHER = 3
+NUM_PRIORITIES = 4
+
+class MidiOutputBatch:
+    """
+    Collects the raw MIDI bytes sent during one main loop iteration and writes
+    them out once at the end of the iteration, so notes meant to be
+    simultaneous leave the device together.
+
+    Messages are sorted into priorities: real-time bytes, then note OFFs, then
+    note ONs, then CCs and everything else. A note OFF is sent before the ONs of
+    the same iteration, so a loop retriggering a pitch ends the old note instead
+    of the new one. Only when the OFF belongs to an ON queued in the same
+    iteration (a zero length note) does it stay behind that ON.
+
+    On flush the messages update active_notes in the order they go out. A note
+    ON for a note already sounding or a note OFF for a note not sounding is
+    dropped, so the receiver never sees duplicates.
+
+    USB gets everything in one write. DIN MIDI only moves about 3 bytes per ms,
+    so the UART has its own queue per priority, drained against a byte budget
+    that refills at the wire rate. Whatever does not fit waits for a later
+    iteration, and newer clock ticks and note OFFs still go out ahead of older
+    note ONs. The UART bytes are re-encoded with running status: a repeated
+    status byte is left out, and a note OFF without release velocity becomes
+    a note ON with velocity 0 so it shares the note ON status.
+
+    Attributes:
+        capacity (int): Max bytes per priority per iteration. A full priority flushes early.
+        section_bytes (list): One bytearray per priority with this iteration's messages.
+        section_counts (list): Bytes queued per priority this iteration.
+        data (bytearray): This iteration's messages in the order they go out.
+        data_view (memoryview): View of data, sliced to the bytes to write.
+        queued_on (bytearray): 1 for note numbers with an ON in the current batch.
+        duplicates_dropped (int): Note ONs and OFFs dropped as duplicates since boot.
+        aux_queues (list): One bytearray per priority with the bytes waiting for the UART.
+        aux_queue_counts (list): Bytes waiting per priority.
+        aux_waiting_on (bytearray): Note ONs waiting for the UART per channel and note, channel * 128 + note.
+        aux_waiting_since (list): ticks_ms time the oldest waiting message per priority was queued.
+        aux_credit (int): UART budget in thousandths of a byte.
+        aux_credit_time (int): ticks_ms time the budget was last refilled.
+        aux_data (bytearray): Running status encoded bytes of the last UART write.
+        aux_running_status (int): Last status byte sent on the UART, 0 for none.
+        aux_max_depth (int): Most bytes waiting for the UART after a flush since boot.
+        aux_max_wait_ms (int): Longest a message waited for the UART since boot.
+        aux_queue_overflows (int): UART queues written without a budget because they were full.
+        usb_bytes_written (int): Bytes written to USB since boot.
+        aux_bytes_written (int): Bytes written to the UART since boot.
+        aux_bytes_last_flush (int): UART bytes of the last flush.
+        aux_bytes_max_flush (int): Most UART bytes written by one flush since boot.
+
+    Methods:
+        queue_bytes(status, data1, data2, priority=PRIORITY_OTHER): Queues a 3 byte message with its channel in status.
+        add_message(status, data1, data2, priority=PRIORITY_OTHER): Queues a 3 byte channel message.
+        add_note_on(note, velocity): Queues a note ON.
+        add_note_off(note, velocity=1, channel=None): Queues a note OFF.
+        add_short_message(status, data1): Queues a 2 byte channel message.
+        add_realtime(status): Queues a single byte real-time message.
+        all_notes_off(use_cc=False): Ends every sounding note.
+        track_messages(src, start, end, dest): Copies messages into data, updating active_notes.
+        flush(): Writes the queued bytes to the enabled ports.
+        queue_aux(start, end, priority, timenow): Adds tracked bytes to the UART priority queues.
+        append_aux(start, num_bytes, priority, timenow): Copies whole messages to one UART priority queue.
+        drain_aux(port, timenow, force=False): Writes the waiting UART bytes that fit the budget.
+        write_aux_queue(port, priority): Writes one UART priority queue without a budget.
+        encode_running_status(src, num_bytes, out): Encodes messages into aux_data with running status.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.section_bytes = [bytearray(capacity) for _ in range(NUM_PRIORITIES)]
+        self.section_counts = [0] * NUM_PRIORITIES
+        self.data = bytearray(NUM_PRIORITIES * capacity)
+        self.data_view = memoryview(self.data)
+        self.queued_on = bytearray(128)
+        self.duplicates_dropped = 0
+        self.aux_queues = [bytearray(constants.MIDI_DIN_QUEUE_BYTES) for _ in range(NUM_PRIORITIES)]
+        self.aux_queue_counts = [0] * NUM_PRIORITIES
+        self.aux_waiting_on = bytearray(16 * 128)
+        self.aux_waiting_since = [0] * NUM_PRIORITIES
+        self.aux_credit = 0
+        self.aux_credit_time = ticks.ticks_ms()
+        self.aux_data = bytearray(constants.MIDI_DIN_QUEUE_BYTES)
+        self.aux_view = memoryview(self.aux_data)
+        self.aux_running_status = 0
+        self.aux_max_depth = 0
+        self.aux_max_wait_ms = 0
+        self.aux_queue_overflows = 0
+        self.usb_bytes_written = 0
+        self.aux_bytes_written = 0
+        self.aux_bytes_last_flush = 0
+        self.aux_bytes_max_flush = 0
+
+    def add_message(self, status, data1, data2, priority=PRIORITY_OTHER):
+        """
+        Queues a 3 byte channel message on the output channel.
+
+        Args:
+            status (int): Status byte without the channel, e.g. CONTROL_CHANGE_STATUS.
+            data1 (int): First data byte (0-127).
+            data2 (int): Second data byte (0-127).
+            priority (int, optional): One of the PRIORITY_ values. Default is PRIORITY_OTHER.
+        """
+        self.queue_bytes(status | (s.midi_channel_out & 0x0F), data1, data2, priority)
+
+    def queue_bytes(self, status, data1, data2, priority=PRIORITY_OTHER):
+        """
+        Queues a 3 byte message.
+
+        Args:
+            status (int): Status byte including the channel.
+            data1 (int): First data byte (0-127).
+            data2 (int): Second data byte (0-127).
+            priority (int, optional): One of the PRIORITY_ values. Default is PRIORITY_OTHER.
+        """
+        if self.section_counts[priority] + 3 > self.capacity:
+            self.flush()
+        buf = self.section_bytes[priority]
+        idx = self.section_counts[priority]
+        buf[idx] = status
+        buf[idx + 1] = data1 & 0x7F
+        buf[idx + 2] = data2 & 0x7F
+        self.section_counts[priority] = idx + 3
+
+    def add_note_on(self, note, velocity):
+        """
+        Queues a note ON.
+
+        Args:
+            note (int): MIDI note value (0-127).
+            velocity (int): MIDI velocity value (0-127).
+        """
+        note &= 0x7F
+        self.add_message(NOTE_ON_STATUS, note, velocity, PRIORITY_NOTE_ON)
+        self.queued_on[note] = 1
+
+    def add_note_off(self, note, velocity=1, channel=None):
+        """
+        Queues a note OFF, ahead of the note ONs unless the note has an ON queued
+        in this batch. Then it goes after that ON, even when the note is already
+        sounding, so a retriggered note released in the same batch still ends.
+
+        Args:
+            note (int): MIDI note value (0-127).
+            velocity (int, optional): MIDI release velocity. Default is 1.
+            channel (int, optional): MIDI channel (0-15). Default is the output channel.
+        """
+        note &= 0x7F
+        if channel is None:
+            channel = s.midi_channel_out & 0x0F
+        priority = PRIORITY_NOTE_ON if self.queued_on[note] else PRIORITY_NOTE_OFF
+        self.queue_bytes(NOTE_OFF_STATUS | channel, note, velocity, priority)
+
+    def add_short_message(self, status, data1):
+        """
+        Queues a 2 byte channel message on the output channel, e.g. channel pressure.
+
+        Args:
+            status (int): Status byte without the channel.
+            data1 (int): Data byte (0-127).
+        """
+        if self.section_counts[PRIORITY_OTHER] + 2 > self.capacity:
+            self.flush()
+        buf = self.section_bytes[PRIORITY_OTHER]
+        idx = self.section_counts[PRIORITY_OTHER]
+        buf[idx] = status | (s.midi_channel_out & 0x0F)
+        buf[idx + 1] = data1 & 0x7F
+        self.section_counts[PRIORITY_OTHER] = idx + 2
+
+    def add_realtime(self, status):
+        """
+        Queues a single byte real-time message ahead of the channel messages.
+
+        Args:
+            status (int): The real-time status byte, e.g. TIMING_CLOCK_BYTE.
+        """
+        if self.section_counts[PRIORITY_REALTIME] >= self.capacity:
+            self.flush()
+        idx = self.section_counts[PRIORITY_REALTIME]
+        self.section_bytes[PRIORITY_REALTIME][idx] = status
+        self.section_counts[PRIORITY_REALTIME] = idx + 1
+
+    def all_notes_off(self, use_cc=False):
+        """
+        Ends every sounding note on every channel. Only notes that are sounding
+        get a note OFF, instead of all 128 on the output channel.
+
+        Args:
+            use_cc (bool, optional): Send CC 123 (All Notes Off) per channel instead of note OFFs. Default is False.
+        """
+        self.flush()
+        for channel in range(16):
+            if not active_notes.channel_counts[channel]:
+                continue
+            if use_cc:
+                self.queue_bytes(CONTROL_CHANGE_STATUS | channel, ALL_NOTES_OFF_CC, 0, PRIORITY_NOTE_OFF)
+                continue
+            for note in active_notes.get_channel_notes(channel):
+                self.queue_bytes(NOTE_OFF_STATUS | channel, note, 1, PRIORITY_NOTE_OFF)
+        self.flush()
+
+    def track_messages(self, src, start, end, dest):
+        """
+        Copies the messages in src[start:end] to data at dest, updating
+        active_notes and dropping duplicate note ONs and OFFs.
+
+        Args:
+            src (bytearray): Buffer holding the messages.
+            start (int): Index of the first message.
+            end (int): Index past the last message.
+            dest (int): Index in data to copy to.
+
+        Returns:
+            int: Index in data past the last message copied.
+        """
+        data = self.data
+        queued_on = self.queued_on
+        timenow = ticks.ticks_ms()
+        idx = start
+        while idx < end:
+            status = src[idx]
+            if status >= 0xF8:
+                data[dest] = status
+                dest += 1
+                idx += 1
+                continue
+
+            message_type = status & 0xF0
+            num_bytes = 2 if message_type == CHANNEL_PRESSURE_STATUS else 3
+            keep = True
+            if message_type == NOTE_ON_STATUS and src[idx + 2]:
+                queued_on[src[idx + 1]] = 0
+                keep = active_notes.note_on(status & 0x0F, src[idx + 1], timenow)
+            elif message_type == NOTE_ON_STATUS or message_type == NOTE_OFF_STATUS:
+                keep = active_notes.note_off(status & 0x0F, src[idx + 1])
+            elif message_type == CONTROL_CHANGE_STATUS and src[idx + 1] == ALL_NOTES_OFF_CC:
+                active_notes.clear_channel(status & 0x0F)
+
+            if keep:
+                for offset in range(num_bytes):
+                    data[dest + offset] = src[idx + offset]
+                dest += num_bytes
+            else:
+                self.duplicates_dropped += 1
+            idx += num_bytes
+        return dest
+
+    def flush(self):
+        """
+        Writes the queued bytes to the enabled ports. Called once at the end of
+        every main loop iteration. USB gets one write with everything, the UART
+        gets what fits its byte budget, highest priority first.
+        """
+        timenow = ticks.ticks_ms()
+        aux_port = midi_routing.aux_out
+        section_counts = self.section_counts
+        total = 0
+        for priority in range(NUM_PRIORITIES):
+            if not section_counts[priority]:
+                continue
+            start = total
+            total = self.track_messages(self.section_bytes[priority], 0, section_counts[priority], total)
+            section_counts[priority] = 0
+            if aux_port and total > start:
+                self.queue_aux(start, total, priority, timenow)
+
+        port = midi_routing.usb_out
+        if port and total:
+            port.write(self.data_view[:total])
+            self.usb_bytes_written += total
+
+        if aux_port:
+            self.drain_aux(aux_port, timenow)
+
+    def queue_aux(self, start, end, priority, timenow):
+        """
+        Adds the tracked bytes data[start:end] to the UART queue of a priority.
+        A note OFF whose own note ON is still waiting goes behind that ON in
+        the note ON queue, every other note OFF keeps its priority.
+
+        Args:
+            start (int): Index in data of the first byte.
+            end (int): Index in data past the last byte.
+            priority (int): One of the PRIORITY_ values.
+            timenow (int): Current ticks_ms time.
+        """
+        if priority != PRIORITY_NOTE_ON and priority != PRIORITY_NOTE_OFF:
+            self.append_aux(start, end - start, priority, timenow)
+            return
+
+        data = self.data
+        waiting_on = self.aux_waiting_on
+        idx = start
+        while idx < end:
+            status = data[idx]
+            if status >= 0xF8:
+                self.append_aux(idx, 1, priority, timenow)
+                idx += 1
+                continue
+            message_type = status & 0xF0
+            num_bytes = 2 if message_type == CHANNEL_PRESSURE_STATUS else 3
+            message_priority = priority
+            if message_type == NOTE_ON_STATUS or message_type == NOTE_OFF_STATUS:
+                key = ((status & 0x0F) << 7) | data[idx + 1]
+                if message_type == NOTE_ON_STATUS and data[idx + 2]:
+                    if waiting_on[key] < 255:
+                        waiting_on[key] += 1
+                elif waiting_on[key]:
+                    # Must not pass its own note ON still waiting for the wire
+                    message_priority = PRIORITY_NOTE_ON
+            self.append_aux(idx, num_bytes, message_priority, timenow)
+            idx += num_bytes
+
+    def append_aux(self, start, num_bytes, priority, timenow):
+        """
+        Copies num_bytes of data from start to the end of the UART queue of a priority.
+        When the queue is full the UART is written without a budget to make room.
+
+        Args:
+            start (int): Index in data of the first byte.
+            num_bytes (int): Bytes to copy, whole messages.
+            priority (int): One of the PRIORITY_ values.
+            timenow (int): Current ticks_ms time.
+        """
+        queue = self.aux_queues[priority]
+        if self.aux_queue_counts[priority] + num_bytes > len(queue):
+            port = midi_routing.aux_out
+            self.drain_aux(port, timenow, True)
+            if self.aux_queue_counts[priority] + num_bytes > len(queue):
+                # Higher priorities took the whole forced write
+                self.write_aux_queue(port, priority)
+        count = self.aux_queue_counts[priority]
+        if not count:
+            self.aux_waiting_since[priority] = timenow
+        data = self.data
+        for idx in range(num_bytes):
+            queue[count + idx] = data[start + idx]
+        self.aux_queue_counts[priority] = count + num_bytes
+
+    def drain_aux(self, port, timenow, force=False):
+        """
+        Writes the waiting UART bytes that fit the byte budget in one write,
+        highest priority first, whole messages only.
+
+        The budget refills at the wire rate (31250 baud, 10 bits per byte) and
+        holds at most constants.MIDI_DIN_BURST_BYTES, what the UART can take
+        without write() blocking the main loop. While the internal MIDI clock
+        runs, only what goes out before the next tick is written.
+
+        Args:
+            port: The UART to write to.
+            timenow (int): Current ticks_ms time.
+            force (bool, optional): Write everything waiting, ignoring the budget. Default is False.
+        """
+        elapsed_ms = ticks.ticks_diff(timenow, self.aux_credit_time)
+        self.aux_credit_time = timenow
+        max_credit = constants.MIDI_DIN_BURST_BYTES * 1000
+        credit = self.aux_credit + elapsed_ms * MIDI_DIN_BYTES_PER_S
+        if credit > max_credit or elapsed_ms < 0:
+            credit = max_credit
+        budget = len(self.aux_data) if force else credit // 1000
+        if midi_clock_out.is_running and not force:
+            # Leave the wire free when the next clock tick is due
+            ms_to_tick = get_ms_to_midi_clock_tick() - 1
+            budget = min(budget, max(ms_to_tick, 0) * MIDI_DIN_BYTES_PER_S // 1000)
+
+        aux_count = 0
+        for priority in range(NUM_PRIORITIES):
+            count = self.aux_queue_counts[priority]
+            if not count:
+                continue
+            queue = self.aux_queues[priority]
+
+            # Whole messages that fit, running status only makes them shorter
+            sent = 0
+            while sent < count:
+                status = queue[sent]
+                num_bytes = 1 if status >= 0xF8 else (2 if status & 0xF0 == CHANNEL_PRESSURE_STATUS else 3)
+                if num_bytes > budget:
+                    break
+                budget -= num_bytes
+                sent += num_bytes
+            if not sent:
+                break
+
+            aux_count = self.encode_running_status(queue, sent, aux_count)
+            remaining = count - sent
+            for idx in range(remaining):
+                queue[idx] = queue[sent + idx]
+            self.aux_queue_counts[priority] = remaining
+
+            waited_ms = ticks.ticks_diff(timenow, self.aux_waiting_since[priority])
+            if waited_ms > self.aux_max_wait_ms:
+                self.aux_max_wait_ms = waited_ms
+                if debug.DEBUG_MODE:
+                    debug.add_debug_line("MIDI DIN worst wait (ms)", waited_ms)
+            if remaining:
+                # The rest has waited since this iteration at the most
+                self.aux_waiting_since[priority] = timenow
+                break
+
+        if not force:
+            self.aux_credit = max(credit - aux_count * 1000, 0)
+        depth = sum(self.aux_queue_counts)
+        if depth > self.aux_max_depth:
+            self.aux_max_depth = depth
+            if debug.DEBUG_MODE:
+                debug.add_debug_line("MIDI DIN max queue depth (bytes)", depth)
+        if not aux_count:
+            return
+
+        port.write(self.aux_view[:aux_count])
+        self.aux_bytes_written += aux_count
+        self.aux_bytes_last_flush = aux_count
+        if aux_count > self.aux_bytes_max_flush:
+            self.aux_bytes_max_flush = aux_count
+            if debug.DEBUG_MODE:
+                # 31250 baud, 10 bits per byte: 0.32 ms per byte on the wire
+                debug.add_debug_line("MIDI DIN max burst (bytes / ms)", f"{aux_count} / {aux_count * 32 // 100}")
+
+    def write_aux_queue(self, port, priority):
+        """
+        Writes everything waiting in one UART priority queue, ignoring the byte budget.
+
+        Args:
+            port: The UART to write to.
+            priority (int): One of the PRIORITY_ values.
+        """
+        count = self.aux_queue_counts[priority]
+        if not count:
+            return
+        aux_count = self.encode_running_status(self.aux_queues[priority], count, 0)
+        self.aux_queue_counts[priority] = 0
+        port.write(self.aux_view[:aux_count])
+        self.aux_bytes_written += aux_count
+        self.aux_bytes_last_flush = aux_count
+        self.aux_queue_overflows += 1
+        if debug.DEBUG_MODE:
+            debug.add_debug_line("MIDI DIN queue overflows", self.aux_queue_overflows)
+
+    def encode_running_status(self, src, num_bytes, out):
+        """
+        Encodes the first num_bytes of src into aux_data at out with running status.
+        Real-time bytes can sit between messages without breaking running status.
+
+        Args:
+            src (bytearray): Buffer holding whole messages.
+            num_bytes (int): Bytes of src to encode.
+            out (int): Index in aux_data to write to.
+
+        Returns:
+            int: Index in aux_data past the last byte written.
+        """
+        aux_data = self.aux_data
+        waiting_on = self.aux_waiting_on
+        running_status = self.aux_running_status
+        idx = 0
+        while idx < num_bytes:
+            status = src[idx]
+            if status >= 0xF8:
+                aux_data[out] = status
+                out += 1
+                idx += 1
+                continue
+
+            message_type = status & 0xF0
+            if message_type == NOTE_OFF_STATUS and src[idx + 2] <= 1:
+                status = NOTE_ON_STATUS | (status & 0x0F)
+                velocity = 0
+            else:
+                velocity = src[idx + 2] if message_type != CHANNEL_PRESSURE_STATUS else 0
+                if message_type == NOTE_ON_STATUS and velocity:
+                    key = ((status & 0x0F) << 7) | src[idx + 1]
+                    if waiting_on[key]:
+                        waiting_on[key] -= 1
+
+            if status != running_status:
+                aux_data[out] = status
+                out += 1
+                running_status = status
+            aux_data[out] = src[idx + 1]
+            out += 1
+            if message_type == CHANNEL_PRESSURE_STATUS:
+                idx += 2
+                continue
+            aux_data[out] = velocity
+            out += 1
+            idx += 3
+
+        self.aux_running_status = running_status
+        return out
+
+midi_out_batch = MidiOutputBatch(constants.MIDI_OUT_BATCH_BYTES)
+
+# Note sources, each one owns the notes it turns on
+SOURCE_LIVE = 0
+SOURCE_ARP = 1
+SOURCE_LOOPER = 2
+SOURCE_CHORD = 3
+NUM_NOTE_SOURCES = 4
+
+class NoteArbiter:
+    """
+    Reference counts every sounding note across the live pads, the arp, the
+    looper tracks and the chord loops. A source only releases its own hold on
+    a pitch, the real note OFF is sent when the last owner lets go, so one
+    source no longer cuts the same pitch held by another.
+
+    When a source turns on a pitch that is already sounding, the note is
+    retriggered (OFF then ON) so the new attack is heard, and the source is
+    added as another owner. A note OFF from a source that does not own the
+    pitch is ignored.
+
+    Holds are counted per note number, not per channel and note. Every source
+    sends on the one output channel, so a pitch sounds on one channel at a
+    time: the channel it went out on is remembered, and turning the pitch on
+    again after the output channel changed retriggers it on the new channel.
+    A pitch takes at most 255 holds over all sources, more are ignored.
+
+    Attributes:
+        owners (bytearray): Holds per source and note number, source * 128 + note.
+        totals (bytearray): Holds per note number over all sources.
+        channels (bytearray): MIDI channel each sounding note went out on.
+        retriggers (int): Notes retriggered because another owner already held them.
+
+    Methods:
+        note_on(source, note, velocity): Adds a hold on a note, sending it if needed.
+        note_off(source, note, velocity=1): Drops a hold, sending the OFF when it was the last one.
+        release_source(source): Drops every hold of a source.
+        get_source_notes(source): Returns the notes a source holds.
+        clear(): Forgets every hold without sending anything.
+    """
+
+    def __init__(self):
+        self.owners = bytearray(NUM_NOTE_SOURCES * 128)
+        self.totals = bytearray(128)
+        self.channels = bytearray(128)
+        self.retriggers = 0
+
+    def note_on(self, source, note, velocity):
+        """
+        Adds a hold on a note for a source and sends the note ON.
+
+        Args:
+            source (int): One of the SOURCE_ values.
+            note (int): MIDI note value (0-127).
+            velocity (int): MIDI velocity value (0-127).
+        """
+        note &= 0x7F
+        owner_idx = source * 128 + note
+        if self.totals[note] == 255:
+            return
+        channel = s.midi_channel_out & 0x0F
+        if self.totals[note]:
+            # Turned on again in the same iteration, both sources share one attack
+            if midi_out_batch.queued_on[note] and self.channels[note] == channel:
+                self.owners[owner_idx] += 1
+                self.totals[note] += 1
+                return
+            midi_out_batch.queue_bytes(NOTE_OFF_STATUS | self.channels[note], note, 1, PRIORITY_NOTE_OFF)
+            self.retriggers += 1
+        self.owners[owner_idx] += 1
+        self.totals[note] += 1
+        self.channels[note] = channel
+        midi_out_batch.add_note_on(note, velocity)
+
+    def note_off(self, source, note, velocity=1):
+        """
+        Drops the hold of a source on a note. The note OFF is sent once no source holds it.
+
+        Args:
+            source (int): One of the SOURCE_ values.
+            note (int): MIDI note value (0-127).
+            velocity (int, optional): MIDI release velocity. Default is 1.
+        """
+        note &= 0x7F
+        owner_idx = source * 128 + note
+        if not self.owners[owner_idx]:
+            return
+        self.owners[owner_idx] -= 1
+        self.totals[note] -= 1
+        if not self.totals[note]:
+            midi_out_batch.add_note_off(note, velocity, self.channels[note])
+
+    def release_source(self, source):
+        """
+        Drops every hold of a source, sending the note OFFs of notes no other source holds.
+
+        Args:
+            source (int): One of the SOURCE_ values.
+        """
+        start = source * 128
+        owners = self.owners
+        for note in range(128):
+            while owners[start + note]:
+                self.note_off(source, note)
+
+    def get_source_notes(self, source):
+        """
+        Returns the notes a source holds.
+
+        Args:
+            source (int): One of the SOURCE_ values.
+
+        Returns:
+            list: MIDI note numbers, lowest first.
+        """
+        start = source * 128
+        return [note for note in range(128) if self.owners[start + note]]
+
+    def clear(self):
+        """
+        Forgets every hold without sending anything. Used after a panic.
+        """
+        for idx in range(len(self.owners)):
+            self.owners[idx] = 0
+        for note in range(128):
+            self.totals[note] = 0
+
+note_arbiter = NoteArbiter()
+
+# Kinds of messages kept by MidiInputQueue
+MIDI_IN_NOTE_ON = 1
+MIDI_IN_NOTE_OFF = 2
+
+class MidiInputQueue:
+    """
+    The MIDI notes received during one main loop iteration, in arrival order.
+    All pending input is read every iteration, so a slow iteration no longer
+    leaves a backlog that drops recorded notes. Clock and transport bytes never
+    get here, MidiInputParser handles them as soon as they are read.
+
+    Every note keeps the time it was read from the port. Loops record that time
+    instead of the time the note is processed, so a note that arrived while the
+    display was updating still lands where it was played.
+
+    Attributes:
+        capacity (int): Max messages per iteration.
+        count (int): Number of messages received this iteration.
+        kinds (bytearray): MIDI_IN_NOTE_ON or MIDI_IN_NOTE_OFF.
+        notes (bytearray): MIDI note numbers.
+        velocities (bytearray): MIDI velocities.
+        times (array): ticks_ms time each message was read.
+
+    Methods:
+        add(kind, note, velocity, timestamp): Stores a message.
+        clear(): Removes all messages.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.kinds = bytearray(capacity)
+        self.notes = bytearray(capacity)
+        self.velocities = bytearray(capacity)
+        self.times = array('l', (0 for _ in range(capacity)))
+
+    def add(self, kind, note, velocity, timestamp):
+        """
+        Stores a message. Messages past the capacity are dropped.
+
+        Args:
+            kind (int): One of the MIDI_IN_ kinds.
+            note (int): MIDI note number.
+            velocity (int): MIDI velocity.
+            timestamp (int): ticks_ms time the message was read.
+        """
+        idx = self.count
+        if idx >= self.capacity:
+            return
+        self.kinds[idx] = kind
+        self.notes[idx] = note
+        self.velocities[idx] = velocity
+        self.times[idx] = timestamp
+        self.count = idx + 1
+
+    def clear(self):
+        """
+        Removes all messages. The columns stay allocated.
+        """
+        self.count = 0
+
+# Every port can fill its budget on both reads of the same iteration
+midi_in_queue = MidiInputQueue(4 * constants.MIDI_IN_BUDGET_PER_PORT)
+
+class MidiInputParser:
+    """
+    Turns the raw bytes read from one MIDI port into note messages in midi_in_queue.
+
+    Real-time bytes (clock, start, continue, stop) can show up anywhere in the
+    stream, even inside another message. They are pulled out of every read
+    before anything else is parsed and go straight to the clock with the time
+    they were read, so clock timing holds up during SysEx dumps and note bursts.
+    Song Position Pointer goes to the clock transport, the other system common
+    messages are skipped.
+
+    Attributes:
+        read_buffer (bytearray): Raw bytes of the last read.
+        in_channel (int): MIDI channel notes are received on (0-15).
+        status (int): Running status byte, 0 for none.
+        data_needed (int): Data bytes the current status takes.
+        data_count (int): Data bytes received for the current message.
+        data1 (int): First data byte of the current message.
+        in_sysex (bool): True between a SysEx start and its end byte.
+
+    Methods:
+        read_port(port): Reads and parses everything waiting on a port, within the read budget.
+        handle_realtime(byte, timenow, timenow_us): Handles a real-time byte.
+        parse(num_bytes, timenow): Parses the non real-time bytes of the last read.
+    """
+
+    def __init__(self, in_channel):
+        self.read_buffer = bytearray(3 * constants.MIDI_IN_BUDGET_PER_PORT)
+        self.read_view = memoryview(self.read_buffer)
+        self.in_channel = in_channel
+        self.status = 0
+        self.data_needed = 0
+        self.data_count = 0
+        self.data1 = 0
+        self.in_sysex = False
+
+    def read_port(self, port):
+        """
+        Reads the bytes waiting on a port, at most one read buffer full, and parses them.
+        Bytes past the buffer stay in the port for the next main loop iteration.
+
+        Args:
+            port: usb_midi PortIn or busio.UART.
+        """
+        if port is uart:
+            num_bytes = min(uart.in_waiting, len(self.read_buffer))
+            if not num_bytes:
+                return
+            num_bytes = uart.readinto(self.read_view[:num_bytes])
+        else:
+            num_bytes = port.readinto(self.read_buffer)
+        if not num_bytes:
+            return
+        timenow = ticks.ticks_ms()
+        timenow_us = -1  # Only read when there are real-time bytes
+
+        # Real-time bytes first, then drop them so the parser never sees them
+        buf = self.read_buffer
+        kept = 0
+        for idx in range(num_bytes):
+            byte = buf[idx]
+            if byte >= 0xF8:
+                if timenow_us < 0:
+                    timenow_us = ticks.ticks_us()
+                self.handle_realtime(byte, timenow, timenow_us)
+            else:
+                buf[kept] = byte
+                kept += 1
+        if kept:
+            self.parse(kept, timenow)
+
+    def handle_realtime(self, byte, timenow, timenow_us):
+        """
+        Handles a real-time byte. Ignored unless MIDI sync is on.
+
+        Args:
+            byte (int): The real-time status byte.
+            timenow (int): ticks_ms time the byte was read.
+            timenow_us (int): ticks_us time the byte was read.
+        """
+        if not s.midi_sync:
+            return
+        if byte == TIMING_CLOCK_BYTE:
+            clock.update_clock(timenow, timenow_us)
+        elif byte == START_BYTE:
+            clock.transport.start(timenow)
+            clock.set_play_state(True)
+        elif byte == CONTINUE_BYTE:
+            clock.transport.continue_play(timenow)
+            clock.set_play_state(True)
+        elif byte == STOP_BYTE:
+            clock.transport.stop()
+            clock.set_play_state(False)
+
+    def parse(self, num_bytes, timenow):
+        """
+        Parses the first num_bytes of read_buffer, keeping running status and
+        partial messages across reads. Note ONs and OFFs on in_channel are added
+        to midi_in_queue, everything else is skipped.
+
+        Args:
+            num_bytes (int): Bytes to parse.
+            timenow (int): ticks_ms time the bytes were read.
+        """
+        buf = self.read_buffer
+        for idx in range(num_bytes):
+            byte = buf[idx]
+            if byte & 0x80:
+                self.data_count = 0
+                if byte == 0xF0:
+                    self.in_sysex = True
+                    self.status = 0
+                    continue
+                self.in_sysex = False
+                if byte == SONG_POSITION_BYTE:
+                    self.status = byte
+                    self.data_needed = 2
+                    continue
+                if byte >= 0xF0:
+                    # System common, no running status. Their data bytes are skipped.
+                    self.status = 0
+                    continue
+                self.status = byte
+                self.data_needed = 1 if 0xC0 <= byte < 0xE0 else 2
+                continue
+
+            if self.in_sysex or not self.status:
+                continue
+            if self.data_count == 0 and self.data_needed == 2:
+                self.data1 = byte
+                self.data_count = 1
+                continue
+
+            # Message complete, running status keeps the status for the next one
+            self.data_count = 0
+            status = self.status
+            if status == SONG_POSITION_BYTE:
+                self.status = 0
+                if s.midi_sync:
+                    clock.transport.set_song_position((byte << 7) | self.data1)
+                continue
+            if (status & 0x0F) != self.in_channel:
+                continue
+            status &= 0xF0
+            if status == NOTE_ON_STATUS:
+                if byte:
+                    midi_in_queue.add(MIDI_IN_NOTE_ON, self.data1, byte, timenow)
+                else:
+                    midi_in_queue.add(MIDI_IN_NOTE_OFF, self.data1, 0, timenow)
+            elif status == NOTE_OFF_STATUS:
+                midi_in_queue.add(MIDI_IN_NOTE_OFF, self.data1, byte, timenow)
+
+usb_midi_parser = MidiInputParser(s.midi_channel_in)
+uart_midi_parser = MidiInputParser(s.midi_channel_in)
+
+class MidiClockOut:
+    """
+    Internal MIDI clock master. Sends Timing Clock at 24 PPQN at the clock tempo,
+    with Start and Stop, when the device is not following an external clock.
+
+    Every tick has an absolute ticks_us() deadline counted from the start of
+    the current quarter note, so late ticks never push the ticks after them
+    and rounding never adds up. update() is called several times per
+    main loop iteration, between slow steps like display pages, and writes a
+    due tick straight to the ports instead of through the output batch. The
+    DIN queue holds back bytes that would still be on the wire when the next
+    tick is due.
+
+    Attributes:
+        is_running (bool): True between start() and stop().
+        bpm (float): Tempo the tick deadlines are computed at.
+        quarter_us (int): Microseconds per quarter note.
+        anchor_us (int): ticks_us time the current quarter note started.
+        tick_idx (int): Tick within the quarter note the next deadline is for (0-23).
+        next_tick_us (int): ticks_us deadline of the next tick.
+        realtime_buffer (bytearray): The byte written for a real-time message.
+        ticks_sent (int): Ticks sent since start().
+        late_ticks (int): Ticks sent 1 ms or more after their deadline since start().
+        max_late_us (int): Latest a tick was sent after its deadline since start().
+
+    Methods:
+        start(timenow_us): Sends Start and starts ticking from timenow_us.
+        stop(): Sends Stop.
+        set_tempo(bpm): Changes the tempo from the next tick on.
+        on_tempo_change(bpm_last, bpm): Called by the clock when the tempo changes.
+        update(timenow_us): Sends the ticks that are due.
+        write_realtime(status): Writes a real-time byte to the enabled ports right away.
+    """
+
+    TICKS_PER_QUARTER_NOTE = 24
+
+    def __init__(self):
+        self.is_running = False
+        self.bpm = 120.0
+        self.quarter_us = 500000
+        self.anchor_us = 0
+        self.tick_idx = 0
+        self.next_tick_us = 0
+        self.realtime_buffer = bytearray(1)
+        self.ticks_sent = 0
+        self.late_ticks = 0
+        self.max_late_us = 0
+        clock.add_tempo_listener(self)
+
+    def start(self, timenow_us):
+        """
+        Sends Start and starts ticking, the first tick right away.
+
+        Args:
+            timenow_us (int): ticks_us time to start at.
+        """
+        self.set_tempo(clock.bpm_current)
+        self.anchor_us = timenow_us
+        self.tick_idx = 0
+        self.next_tick_us = timenow_us
+        self.ticks_sent = 0
+        self.late_ticks = 0
+        self.max_late_us = 0
+        self.is_running = True
+        self.write_realtime(START_BYTE)
+        clock.transport.start(ticks.ticks_ms())
+        clock.set_play_state(True)
+        self.update(timenow_us)
+
+    def stop(self):
+        """
+        Sends Stop. The transport keeps its position.
+        """
+        self.is_running = False
+        self.write_realtime(STOP_BYTE)
+        clock.transport.stop()
+        clock.set_play_state(False)
 
-uart_midi = adafruit_midi.MIDI(
-    midi_in=uart,
-    midi_out=uart,
-    in_channel=s.midi_channel_out,
-    out_channel=s.midi_channel_out,
-    debug=False,)
-
-usb_midi = adafruit_midi.MIDI(
-    midi_in=usb_midi.ports[0],
-    midi_out=usb_midi.ports[1],
-    in_channel=s.midi_channel_out,
-    out_channel=s.midi_channel_out,
-    debug=False)
-
-messages = (NoteOn, 
-            NoteOff, 
-            PitchBend, 
-            ControlChange, 
-            TimingClock, 
-            Start, 
-            Stop,)
+    def set_tempo(self, bpm):
+        """
+        Changes the tempo. The next tick keeps its deadline, the ones after it
+        are spaced at the new tempo.
+
+        Args:
+            bpm (float): The new tempo.
+        """
+        # The next tick starts a new quarter note at the new tempo
+        self.anchor_us = self.next_tick_us
+        self.tick_idx = 0
+        self.bpm = bpm
+        self.quarter_us = int(60000000 / bpm + 0.5)
+
+    def on_tempo_change(self, bpm_last, bpm):
+        """
+        Called by the clock when the tempo changes. start() picks up the tempo
+        when the clock is not running.
+
+        Args:
+            bpm_last (float): The previous tempo.
+            bpm (float): The new tempo.
+        """
+        if self.is_running and bpm != self.bpm:
+            self.set_tempo(bpm)
+
+    def update(self, timenow_us):
+        """
+        Sends the ticks that are due. Ticks missed by a stalled main loop are all
+        sent, so the receiver keeps the same song position.
+
+        Args:
+            timenow_us (int): Current ticks_us time.
+        """
+        if not self.is_running:
+            return
+
+        while True:
+            late_us = ticks.ticks_us_diff(timenow_us, self.next_tick_us)
+            if late_us < 0:
+                return
+            self.write_realtime(TIMING_CLOCK_BYTE)
+            clock.transport.tick(ticks.ticks_ms())
+            self.ticks_sent += 1
+            if late_us >= 1000:
+                self.late_ticks += 1
+            if late_us > self.max_late_us:
+                self.max_late_us = late_us
+                if debug.DEBUG_MODE:
+                    debug.add_debug_line("MIDI clock out max late (us)", late_us)
+
+            idx = self.tick_idx + 1
+            if idx == self.TICKS_PER_QUARTER_NOTE:
+                self.anchor_us = ticks.ticks_us_add(self.anchor_us, self.quarter_us)
+                idx = 0
+            self.tick_idx = idx
+            self.next_tick_us = ticks.ticks_us_add(self.anchor_us, idx * self.quarter_us // self.TICKS_PER_QUARTER_NOTE)
+
+    def write_realtime(self, status):
+        """
+        Writes a real-time byte to the enabled ports right away. Real-time bytes
+        can go between the bytes of other messages, so running status on the
+        DIN port stays valid.
+
+        Args:
+            status (int): The real-time status byte.
+        """
+        buf = self.realtime_buffer
+        buf[0] = status
+        if midi_routing.usb_out:
+            midi_routing.usb_out.write(buf)
+            midi_out_batch.usb_bytes_written += 1
+        if midi_routing.aux_out:
+            midi_routing.aux_out.write(buf)
+            midi_out_batch.aux_bytes_written += 1
+            midi_out_batch.aux_credit -= 1000
+
+midi_clock_out = MidiClockOut()
 
 current_midibank_set = get_midi_banks_chromatic()
 current_scale_list = []
@@ -148,12 +1302,14 @@ def set_midi_velocity_by_idx(idx, vel):
     print_debug(f"Setting MIDI velocity: {vel}")
 
 def send_aftertouch_for_note(note, velocity):
+    """
+    Sends a MIDI channel pressure (aftertouch) message.
 
-    if should_send_midi("USB"):
-        adafruit_midi.channel_pressure.ChannelPressure(velocity,s.midi_channel_out)
-
-    if should_receive_midi("AUX"):
-        adafruit_midi.channel_pressure.ChannelPressure(velocity,s.midi_channel_out)
+    Args:
+        note (int): MIDI note the pressure is for. Channel pressure applies to every note.
+        velocity (int): Pressure value (0-127).
+    """
+    midi_out_batch.add_short_message(CHANNEL_PRESSURE_STATUS, velocity)
 
 def get_midi_note_by_idx(idx):
     """
@@ -204,12 +1360,10 @@ def should_send_midi(midi_type):
     Returns:
         bool: True if MIDI should be sent, False otherwise.
     """
-    midi_type = midi_type.upper()
-    
     if midi_type == "USB":
-        return s.midi_type.upper() in ('USB', 'ALL') and s.midi_usb_io in ('both', 'out')
+        return midi_routing.send_usb
     if midi_type == "AUX":
-        return s.midi_type.upper() in ('AUX', 'ALL') and s.midi_aux_io in ('both', 'out')
+        return midi_routing.send_aux
     
     return False
 
@@ -223,28 +1377,31 @@ def should_receive_midi(midi_type):
     Returns:
         bool: True if MIDI should be received, False otherwise.
     """
-    midi_type = midi_type.upper()
-    
     if midi_type == "USB":
-        return s.midi_type.upper() in ('USB', 'ALL') and s.midi_usb_io in ('both', 'in')
+        return midi_routing.receive_usb
     elif midi_type == "AUX":
-        return s.midi_type.upper() in ('AUX', 'ALL') and s.midi_aux_io in ('both', 'in')
+        return midi_routing.receive_aux
     
     return False
 
-def send_midi_note_on(note, velocity):
+def update_midi_routing():
+    """
+    Rebuilds the MIDI routing table. Call after midi_type, midi_usb_io or midi_aux_io change.
+    """
+    midi_routing.update()
+    debug.add_debug_line("MIDI Routing", f"out USB {midi_routing.send_usb} AUX {midi_routing.send_aux}, in USB {midi_routing.receive_usb} AUX {midi_routing.receive_aux}")
+
+def send_midi_note_on(note, velocity, source=SOURCE_LIVE):
     """
     Sends a MIDI note-on message with the given note and velocity.
+    Sent with the other messages of this main loop iteration, see MidiOutputBatch.
     
     Args:
         note (int): MIDI note value (0-127).
         velocity (int): MIDI velocity value (0-127).
+        source (int, optional): What plays the note, see NoteArbiter. Default is SOURCE_LIVE.
     """
-    if should_send_midi("USB"):
-        usb_midi.send(NoteOn(note, velocity))
-    
-    if should_send_midi("AUX"):
-        uart_midi.send(NoteOn(note, velocity))
+    note_arbiter.note_on(source, note, velocity)
 
 def send_cc_message(cc, val):
     """
@@ -254,85 +1411,125 @@ def send_cc_message(cc, val):
         cc (int): Control change number (0-127).
         val (int): Control change value (0-127).
     """
-    if should_send_midi("USB"):
-        usb_midi.send(ControlChange(cc, val))
-
-    if should_receive_midi("AUX"):
-        uart_midi.send(ControlChange(cc, val))
+    midi_out_batch.add_message(CONTROL_CHANGE_STATUS, cc, val)
 
-def send_midi_note_off(note):
+def send_midi_note_off(note, source=SOURCE_LIVE):
     """
-    Sends a MIDI note-off message for the given note.
+    Sends a MIDI note-off message for the given note, once no other source holds it.
     
     Args:
         note (int): MIDI note value (0-127).
+        source (int, optional): What played the note, see NoteArbiter. Default is SOURCE_LIVE.
     """
-    if should_send_midi("USB"):
-        usb_midi.send(NoteOff(note, 1))
-
-    if should_send_midi("AUX"):
-        uart_midi.send(NoteOff(note, 1))
+    note_arbiter.note_off(source, note)
 
-def clear_all_notes():
-    for i in range(127):
-        send_midi_note_off(i)
-        
-def process_midi_in(msg):
+def send_realtime_message(status):
     """
-    Processes a MIDI message.
-    
+    Sends a single byte MIDI real-time message, e.g. TIMING_CLOCK_BYTE or START_BYTE.
+
     Args:
-        msg (MIDI message): The MIDI message to process.
-        type (str): The type of MIDI message, either "usb" or "uart".
+        status (int): The real-time status byte.
     """
-    result = None
-    if not isinstance(msg, TimingClock):
-        print_debug(f"Processing MIDI In: {msg}")
+    midi_out_batch.add_realtime(status)
 
-    if isinstance(msg, NoteOn):
-        if not clock.get_playstate():
-            clock.set_play_state(True) # Ableton sends note before play sometimes.
-        return((msg.note, msg.velocity, 0), ())
-        
-    elif isinstance(msg, NoteOff):
-        return ((), (msg.note, msg.velocity, 0))
+def update_midi_clock():
+    """
+    Sends the internal MIDI clock ticks that are due. Cheap when the internal
+    clock is off, called several times per main loop iteration.
+    """
+    if midi_clock_out.is_running:
+        midi_clock_out.update(ticks.ticks_us())
 
-    if not s.midi_sync: # You can always record notes regardless of sync.
-        return ((),())
+def get_ms_to_midi_clock_tick():
+    """
+    Returns the time until the next internal MIDI clock tick, so slow work can
+    wait for the tick instead of holding it up.
 
-    if isinstance(msg, TimingClock):
-        clock.update_clock()
+    Returns:
+        int: ms to the next tick, NO_EVENT_MS when the internal clock is off.
+    """
+    if not midi_clock_out.is_running:
+        return NO_EVENT_MS
+    return ticks.ticks_us_diff(midi_clock_out.next_tick_us, ticks.ticks_us()) // 1000
 
-    # elif isinstance(msg, ControlChange): # Not used
-    #     result = ((), ())
+def update_midi_clock_out():
+    """
+    Starts or stops the internal MIDI clock to match the settings. It runs when
+    MIDI clock out is on and MIDI sync is off.
+    """
+    should_run = s.midi_clock_out and not s.midi_sync
+    if should_run and not midi_clock_out.is_running:
+        clock.update_all_timings(int(s.default_bpm))
+        midi_clock_out.start(ticks.ticks_us())
+    elif not should_run and midi_clock_out.is_running:
+        midi_clock_out.stop()
 
-    elif isinstance(msg, Start):
-        clock.set_play_state(True)
+def flush_midi_out():
+    """
+    Writes all MIDI messages sent during this main loop iteration to the ports.
+    """
+    midi_out_batch.flush()
 
-    elif isinstance(msg, Stop):
-        clock.set_play_state(False)
+def clear_all_notes(use_cc=False):
+    """
+    Ends every sounding note. Only notes that are sounding get a note OFF.
 
-    return result
+    Args:
+        use_cc (bool, optional): Send CC 123 (All Notes Off) instead of note OFFs. Default is False.
+    """
+    midi_out_batch.all_notes_off(use_cc)
+    note_arbiter.clear()
 
-def get_midi_messages_in():
+def report_stuck_notes():
+    """
+    Adds the notes that have been sounding for longer than constants.STUCK_NOTE_MS
+    to the debug output. Only runs in debug mode.
     """
-    Checks for MIDI messages and processes them.
+    if not debug.DEBUG_MODE:
+        return
+    stuck = active_notes.get_stuck_notes(constants.STUCK_NOTE_MS, ticks.ticks_ms())
+    if stuck:
+        debug.add_debug_line("Stuck notes (ch, note, ms)", stuck)
+    if midi_out_batch.duplicates_dropped:
+        debug.add_debug_line("Duplicate notes dropped", midi_out_batch.duplicates_dropped)
+        
+def process_midi_in():
+    """
+    Handles the notes in midi_in_queue that affect the clock.
     """
-    output = ((), ())
+    queue = midi_in_queue
+    kinds = queue.kinds
+    for idx in range(queue.count):
+        if kinds[idx] == MIDI_IN_NOTE_ON and not clock.get_playstate():
+            clock.set_play_state(True) # Ableton sends note before play sometimes.
+            return
 
+def poll_midi_in():
+    """
+    Reads the MIDI input waiting on the enabled ports. Clock and transport bytes
+    are handled right away, notes are added to midi_in_queue with the time they
+    were read. Called before slow work like a display update, so notes that
+    arrived before it keep their time.
+    """
     # Check for MIDI messages from the USB MIDI port
-    if should_receive_midi("USB"):
-        msg = usb_midi.receive()
-        if msg is not None:
-            output = process_midi_in(msg)
+    if midi_routing.receive_usb:
+        usb_midi_parser.read_port(usb_port_in)
 
     # Check for MIDI messages from the UART MIDI port
-    if should_receive_midi("AUX"):
-        msg = uart_midi.receive()
-        if msg is not None:
-            output = process_midi_in(msg)
+    if midi_routing.receive_aux:
+        uart_midi_parser.read_port(uart)
 
-    return output
+def get_midi_messages_in():
+    """
+    Reads all pending MIDI input from the enabled ports, adding to the notes
+    already read by poll_midi_in() this iteration.
+
+    Returns:
+        MidiInputQueue: midi_in_queue. Clear it once its notes are processed.
+    """
+    poll_midi_in()
+    process_midi_in()
+    return midi_in_queue
 
 # ------------------ Get / Change settings ------- #
 def change_midi_channel(up_or_down=True, in_or_out="out", set_channel=None):
@@ -348,25 +1545,21 @@ def change_midi_channel(up_or_down=True, in_or_out="out", set_channel=None):
     """
     if set_channel is not None and in_or_out == "in":
         s.midi_channel_in = set_channel
-        usb_midi.in_channel = s.midi_channel_in
-        uart_midi.in_channel = s.midi_channel_in
+        usb_midi_parser.in_channel = s.midi_channel_in
+        uart_midi_parser.in_channel = s.midi_channel_in
         debug.add_debug_line("Midi Channel In changed to ", f"Channel: {s.midi_channel_in}")
 
     elif set_channel is not None and in_or_out == "out":
         s.midi_channel_out = set_channel
-        usb_midi.out_channel = s.midi_channel_out
-        uart_midi.out_channel = s.midi_channel_out
         debug.add_debug_line("Midi Channel Out changed to ", f"Channel: {s.midi_channel_out}")
 
     elif in_or_out == "in":
         s.midi_channel_in = next_or_previous_index(s.midi_channel_in, 16, up_or_down)
-        usb_midi.in_channel = s.midi_channel_in
-        uart_midi.in_channel = s.midi_channel_in
+        usb_midi_parser.in_channel = s.midi_channel_in
+        uart_midi_parser.in_channel = s.midi_channel_in
         debug.add_debug_line("Midi Channel In changed to ", f"Channel: {s.midi_channel_in}")
     else:
         s.midi_channel_out = next_or_previous_index(s.midi_channel_out, 16, up_or_down)
-        usb_midi.out_channel = s.midi_channel_out
-        uart_midi.out_channel = s.midi_channel_out
         debug.add_debug_line("Midi Channel Out changed to ", f"Channel: {s.midi_channel_out}")
 
 def next_or_prev_scale(up_or_down=True, display_text=True):
@@ -512,6 +1705,8 @@ def chg_midi_mode(nextOrPrev=1):
         elif s.midi_type == "all":
             s.midi_type = "aux"
 
+    update_midi_routing()
+
 def setup_midi():
     """
     Sets up the MIDI configuration for the application.
@@ -0,0 +1,412 @@
+from array import array
+
+NO_EVENT_MS = 0x3FFFFFFF  # Past the end of any loop, still a small int on the RP2040
+OPEN_DURATION = -1  # Note ON recorded, note OFF not seen yet
+
+class NoteBuffer:
+    """
+    Fixed capacity note storage for loops, packed into preallocated columns.
+
+    A recorded note used to be two (note, velocity, seconds, padidx) tuples in lists,
+    roughly 56 bytes per ON or OFF once the float, tuple and list slot are counted.
+    Here a note is 16 bytes (int32 time + int32 duration + 2 int16 + 4 bytes) and the columns
+    are allocated once, so recording never allocates and never triggers a GC pause.
+
+    Each entry is a whole note: the ON time and how long it is held. The OFF is
+    always the one belonging to its ON, so removing or moving a note can never
+    leave another note hanging.
+
+    Notes are kept sorted by ON time so playback can walk them with a cursor.
+    Deleting only marks a note (velocity 0), compact() drops marked notes later
+    in a single pass.
+
+    Each note also records which overdub pass (layer) it came from, so a whole
+    pass can be hidden or dropped without touching the other notes.
+
+    Quantizing keeps the played timing: on_shifts and duration_shifts hold how
+    far the ON time and duration were moved, so quantizing can be redone from
+    the original timing with another grid or strength.
+
+    Attributes:
+        capacity (int): Max number of notes the buffer can hold.
+        count (int): Number of notes currently stored, including deleted ones.
+        deleted_count (int): Number of notes marked deleted.
+        times (array): Note ON time in ms from the loop start.
+        durations (array): Time in ms from note ON to note OFF, or OPEN_DURATION.
+        notes (bytearray): MIDI note numbers.
+        velocities (bytearray): MIDI velocities. 0 marks a deleted note.
+        pads (bytearray): Pad index that played the note.
+        layers (bytearray): Overdub pass the note was recorded in, 0 for the first take.
+        on_shifts (array): ms quantizing moved the ON time. Played time = times - on_shifts.
+        duration_shifts (array): ms quantizing moved the duration. Played duration = durations - duration_shifts.
+
+    Methods:
+        is_full(): Returns True if no more notes fit.
+        get_time(idx): Returns the note ON time, or NO_EVENT_MS past the end.
+        get_note(idx): Returns the note as a (note, velocity, time_ms, padidx, duration_ms) tuple.
+        find_index(time_ms): Returns the index of the first note at or after time_ms.
+        find_open_note(note, time_ms): Returns the index of a note still waiting for its OFF.
+        find_live_index(idx): Returns the first note that is not deleted, starting at idx.
+        insert(note, velocity, time_ms, padidx, duration_ms=OPEN_DURATION, layer=0): Inserts a note in time order.
+        remove(idx): Removes the note at idx.
+        delete(idx): Marks the note at idx as deleted.
+        delete_layers_from(layer): Marks all notes from layer and later layers as deleted.
+        merge_first_layers(): Merges layer 1 into layer 0 and moves later layers down by one.
+        compact(): Drops deleted notes.
+        set_time(idx, time_ms): Changes a note ON time. Call sort_by_time() afterwards.
+        set_duration(idx, duration_ms): Changes how long a note is held.
+        set_shifts(idx, on_shift_ms, duration_shift_ms): Records how far quantizing moved a note.
+        sort_one(idx): Moves a single note whose time changed back into time order.
+        sort_by_time(): Restores time order after times were edited.
+        clear(): Removes all notes.
+        get_bytes_used(): Returns the bytes allocated by the columns.
+    """
+
+    BYTES_PER_NOTE = 16  # One entry per note, its ON and OFF
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.deleted_count = 0
+        self.times = array('l', (0 for _ in range(capacity)))
+        self.durations = array('l', (0 for _ in range(capacity)))
+        self.notes = bytearray(capacity)
+        self.velocities = bytearray(capacity)
+        self.pads = bytearray(capacity)
+        self.layers = bytearray(capacity)
+        self.on_shifts = array('h', (0 for _ in range(capacity)))
+        self.duration_shifts = array('h', (0 for _ in range(capacity)))
+
+    def __len__(self):
+        return self.count - self.deleted_count
+
+    def is_full(self):
+        """
+        Returns True if no more notes fit in the buffer.
+        """
+        return self.count >= self.capacity
+
+    def get_time(self, idx):
+        """
+        Returns the ON time of the note at idx.
+
+        Args:
+            idx (int): Index of the note.
+
+        Returns:
+            int: Time in ms, or NO_EVENT_MS if idx is past the last note.
+        """
+        if idx < self.count:
+            return self.times[idx]
+        return NO_EVENT_MS
+
+    def get_note(self, idx):
+        """
+        Returns the note at idx.
+
+        Args:
+            idx (int): Index of the note.
+
+        Returns:
+            tuple: (note, velocity, time_ms, padidx, duration_ms)
+        """
+        return (self.notes[idx], self.velocities[idx], self.times[idx], self.pads[idx], self.durations[idx])
+
+    def find_index(self, time_ms):
+        """
+        Binary search for the first note at or after time_ms.
+
+        Args:
+            time_ms (int): Loop time in ms.
+
+        Returns:
+            int: Index of the first note with time >= time_ms.
+        """
+        times = self.times
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid] < time_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_open_note(self, note, time_ms):
+        """
+        Finds the note that was turned ON at time_ms and has no OFF yet.
+
+        Args:
+            note (int): MIDI note number.
+            time_ms (int): ON time in ms the note was stored with.
+
+        Returns:
+            int: Index of the note, or -1 if there is none.
+        """
+        idx = self.find_index(time_ms)
+        while idx < self.count and self.times[idx] == time_ms:
+            if self.notes[idx] == note and self.durations[idx] == OPEN_DURATION:
+                return idx
+            idx += 1
+        return -1
+
+    def find_live_index(self, idx):
+        """
+        Returns the first note that is not deleted, starting at idx and wrapping around.
+
+        Args:
+            idx (int): Index to start looking at.
+
+        Returns:
+            int: Index of the note, or -1 if every note is deleted.
+        """
+        if self.deleted_count >= self.count:
+            return -1
+        while self.velocities[idx] == 0:
+            idx += 1
+            if idx >= self.count:
+                idx = 0
+        return idx
+
+    def insert(self, note, velocity, time_ms, padidx, duration_ms=OPEN_DURATION, layer=0):
+        """
+        Inserts a note after any notes with the same or earlier time.
+        Recording appends at the end, so the shift only runs for overdubs.
+
+        Args:
+            note (int): MIDI note number.
+            velocity (int): MIDI velocity.
+            time_ms (int): Note ON time in ms from the loop start.
+            padidx (int): Pad index.
+            duration_ms (int, optional): Time until note OFF. Default is OPEN_DURATION.
+            layer (int, optional): Overdub pass the note belongs to. Default is 0.
+
+        Returns:
+            int: The index the note was stored at, or -1 if the buffer is full.
+        """
+        if self.count >= self.capacity:
+            return -1
+
+        times = self.times
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid] <= time_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        for i in range(self.count, lo, -1):
+            self.move(i - 1, i)
+
+        times[lo] = time_ms
+        self.durations[lo] = duration_ms
+        self.notes[lo] = note
+        self.velocities[lo] = velocity
+        self.pads[lo] = padidx
+        self.layers[lo] = layer
+        self.on_shifts[lo] = 0
+        self.duration_shifts[lo] = 0
+        self.count += 1
+        return lo
+
+    def remove(self, idx):
+        """
+        Removes the note at idx.
+
+        Args:
+            idx (int): Index of the note.
+        """
+        if not 0 <= idx < self.count:
+            raise IndexError("NoteBuffer index out of range")
+        if self.velocities[idx] == 0:
+            self.deleted_count -= 1
+        for i in range(idx, self.count - 1):
+            self.move(i + 1, i)
+        self.count -= 1
+
+    def delete(self, idx):
+        """
+        Marks the note at idx as deleted. Playback skips it until compact() drops it.
+
+        Args:
+            idx (int): Index of the note.
+
+        Returns:
+            bool: False if the note was already deleted.
+        """
+        if not 0 <= idx < self.count:
+            raise IndexError("NoteBuffer index out of range")
+        if self.velocities[idx] == 0:
+            return False
+        self.velocities[idx] = 0
+        self.deleted_count += 1
+        return True
+
+    def delete_layers_from(self, layer):
+        """
+        Marks all notes recorded in layer or a later layer as deleted.
+
+        Args:
+            layer (int): First layer to delete.
+
+        Returns:
+            int: Number of notes deleted.
+        """
+        deleted = 0
+        layers = self.layers
+        velocities = self.velocities
+        for idx in range(self.count):
+            if layers[idx] >= layer and velocities[idx]:
+                velocities[idx] = 0
+                deleted += 1
+        self.deleted_count += deleted
+        return deleted
+
+    def merge_first_layers(self):
+        """
+        Merges layer 1 into layer 0 and moves every later layer down by one,
+        freeing the highest layer number for a new pass.
+        """
+        layers = self.layers
+        for idx in range(self.count):
+            if layers[idx]:
+                layers[idx] -= 1
+
+    def compact(self):
+        """
+        Drops all deleted notes in a single pass. Indexes of the remaining notes change.
+        """
+        if not self.deleted_count:
+            return
+        dest = 0
+        for src in range(self.count):
+            if self.velocities[src] == 0:
+                continue
+            if src != dest:
+                self.move(src, dest)
+            dest += 1
+        self.count = dest
+        self.deleted_count = 0
+
+    def move(self, src, dest):
+        """
+        Copies the note at src over the note at dest.
+        """
+        self.times[dest] = self.times[src]
+        self.durations[dest] = self.durations[src]
+        self.notes[dest] = self.notes[src]
+        self.velocities[dest] = self.velocities[src]
+        self.pads[dest] = self.pads[src]
+        self.layers[dest] = self.layers[src]
+        self.on_shifts[dest] = self.on_shifts[src]
+        self.duration_shifts[dest] = self.duration_shifts[src]
+
+    def set_time(self, idx, time_ms):
+        """
+        Changes the ON time of the note at idx. Call sort_by_time() when done editing.
+
+        Args:
+            idx (int): Index of the note.
+            time_ms (int): New time in ms.
+        """
+        self.times[idx] = time_ms
+
+    def set_duration(self, idx, duration_ms):
+        """
+        Changes how long the note at idx is held.
+
+        Args:
+            idx (int): Index of the note.
+            duration_ms (int): Time in ms from note ON to note OFF.
+        """
+        self.durations[idx] = duration_ms
+
+    def set_shifts(self, idx, on_shift_ms, duration_shift_ms):
+        """
+        Records how far quantizing moved the note at idx from the played timing.
+
+        Args:
+            idx (int): Index of the note.
+            on_shift_ms (int): Quantized ON time minus played ON time.
+            duration_shift_ms (int): Quantized duration minus played duration.
+        """
+        self.on_shifts[idx] = on_shift_ms
+        self.duration_shifts[idx] = duration_shift_ms
+
+    def sort_one(self, idx):
+        """
+        Moves the note at idx to its place in time order after its time changed.
+        Only the notes between the old and new place are shifted.
+
+        Args:
+            idx (int): Index of the note.
+
+        Returns:
+            int: The new index of the note.
+        """
+        times = self.times
+        time_ms = times[idx]
+        note, velocity, pad = self.notes[idx], self.velocities[idx], self.pads[idx]
+        duration_ms, layer = self.durations[idx], self.layers[idx]
+        on_shift, duration_shift = self.on_shifts[idx], self.duration_shifts[idx]
+        j = idx
+        while j > 0 and times[j - 1] > time_ms:
+            self.move(j - 1, j)
+            j -= 1
+        while j < self.count - 1 and times[j + 1] <= time_ms:
+            self.move(j + 1, j)
+            j += 1
+        if j == idx:
+            return idx
+        times[j] = time_ms
+        self.durations[j] = duration_ms
+        self.notes[j] = note
+        self.velocities[j] = velocity
+        self.pads[j] = pad
+        self.layers[j] = layer
+        self.on_shifts[j] = on_shift
+        self.duration_shifts[j] = duration_shift
+        return j
+
+    def sort_by_time(self):
+        """
+        Insertion sort on the time column. Edits like quantizing keep the
+        notes almost sorted, so this is close to a single pass.
+        """
+        times = self.times
+        for i in range(1, self.count):
+            time_ms = times[i]
+            if times[i - 1] <= time_ms:
+                continue
+            note, velocity, pad = self.notes[i], self.velocities[i], self.pads[i]
+            duration_ms, layer = self.durations[i], self.layers[i]
+            on_shift, duration_shift = self.on_shifts[i], self.duration_shifts[i]
+            j = i
+            while j > 0 and times[j - 1] > time_ms:
+                self.move(j - 1, j)
+                j -= 1
+            times[j] = time_ms
+            self.durations[j] = duration_ms
+            self.notes[j] = note
+            self.velocities[j] = velocity
+            self.pads[j] = pad
+            self.layers[j] = layer
+            self.on_shifts[j] = on_shift
+            self.duration_shifts[j] = duration_shift
+
+    def clear(self):
+        """
+        Removes all notes. The columns stay allocated.
+        """
+        self.count = 0
+        self.deleted_count = 0
+
+    def get_bytes_used(self):
+        """
+        Returns the number of bytes allocated by the columns.
+
+        Returns:
+            int: Bytes used.
+        """
+        return self.capacity * self.BYTES_PER_NOTE
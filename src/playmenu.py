@@ -234,6 +234,7 @@ def fn_button_held_and_encoder_turned_function(encoder_delta):
     
     if get_play_mode() == "chord":
         set_next_or_prev_quantization(encoder_delta)
+        chord_manager.requantize_chords()
         val = str(get_quantization_display_value())
         display_text_bottom(val, True, 30, 30)
 
@@ -257,6 +258,7 @@ def encoder_button_press_and_turn_function(encoder_delta):
 
     if get_play_mode() == "chord":
         set_quantization_percent(encoder_delta)
+        chord_manager.requantize_chords()
         display_text = f"{get_quantization_percent(True)}%"
         display_text_bottom(display_text, True, 91, 25)
     
@@ -20,6 +20,7 @@ class Settings:
         SCALE_IDX (int): The default scale bank index.
         PLAYMODE (str): The starting play mode.
         MIDI_SYNC (bool): Flag indicating the MIDI sync status.
+        midi_clock_out (bool): Flag indicating the internal MIDI clock is sent when not synced.
         midi_settings_page_indices (list): The MIDI settings page indices.
 
         LOOPER:
@@ -61,7 +62,8 @@ class Settings:
         self.scale_idx = 0
         self.playmode = 'chord'
         self.midi_sync = False
-        self.midi_settings_page_indices = [0, 0, 0, 0, 0, 0, 0]
+        self.midi_clock_out = False
+        self.midi_settings_page_indices = [0, 0, 0, 0, 0, 0, 0, 0, 0]
         self.settings_menu_option_indices = [0,0,0,0,0,0,0,0,0,0,0]
 
         # LOOPER / CHORDMODE / Arp
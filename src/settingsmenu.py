@@ -3,7 +3,7 @@ from utils import next_or_previous_index
 from settings import settings as s
 from arp import arpeggiator
 from clock import clock
-from midi import set_all_midi_velocities, change_midi_channel
+from midi import set_all_midi_velocities, change_midi_channel, update_midi_routing, update_midi_clock_out
 
 # Initialize settings menu index
 settings_menu_idx = 0
@@ -47,6 +47,7 @@ midi_settings_pages = [
     ("Def Vel", [int(i) for i in range(1, 127)]),
     ("midi usb i/o", ["both", "in", "out"]),
     ("midi DIN i/o", ["both", "in", "out"]),
+    ("MIDI Clk Out", [False, True]),
 ]
 
 midi_settings_mapping = {
@@ -58,6 +59,7 @@ midi_settings_mapping = {
     5: ("default_velocity", int),
     6: ("midi_usb_io", str),
     7: ("midi_aux_io", str),
+    8: ("midi_clock_out", bool),
 }
 
 def validate_indices(settings_pages, settings_mapping, indices, settings_object, special_cases=None):
@@ -71,6 +73,10 @@ def validate_indices(settings_pages, settings_mapping, indices, settings_object,
         settings_object (object): The settings object to validate against.
         special_cases (dict, optional): Special cases for attribute conversion.
     """
+    # Presets saved before a page was added have fewer indices
+    while len(indices) < len(settings_pages):
+        indices.append(0)
+
     for idx, (title, options) in enumerate(settings_pages):
         attr_name, attr_type = settings_mapping[idx]
         current_value = getattr(settings_object, attr_name)
@@ -371,10 +377,18 @@ def midi_settings_menu_encoder_change_function(up_or_down=True):
     if midi_settings_page_index == 1:
         s.default_bpm = selected_option
         if not s.midi_sync:
-            clock.update_all_timings(60 / int(s.default_bpm))
+            clock.update_all_timings(int(s.default_bpm))
 
     if midi_settings_page_index == 3:
         change_midi_channel(int(selected_option), "out", selected_option-1)
     
     if midi_settings_page_index == 4:
         change_midi_channel(int(selected_option), "in", selected_option-1)
+
+    # 2, 6, 7 - midi type, usb i/o, DIN i/o
+    if midi_settings_page_index in (2, 6, 7):
+        update_midi_routing()
+
+    # 0, 8 - midi sync, midi clock out
+    if midi_settings_page_index in (0, 8):
+        update_midi_clock_out()
@@ -0,0 +1,49 @@
+import time
+from adafruit_ticks import ticks_ms, ticks_diff, ticks_add
+
+# Microsecond ticks wrap like ticks_ms so they stay small ints on the RP2040.
+# Differences are valid up to half the period, about 268 seconds.
+TICKS_US_PERIOD = 1 << 29
+TICKS_US_MAX = TICKS_US_PERIOD - 1
+TICKS_US_HALFPERIOD = TICKS_US_PERIOD // 2
+
+def ticks_us():
+    """
+    Returns the current time in microseconds, wrapping at TICKS_US_PERIOD.
+    The RP2040 counts in 1/32768 s steps, so the resolution is about 30 us.
+
+    Use ticks_us_diff() and ticks_us_add() on the result, never plain - and +.
+    Use ticks_ms() for anything that does not need sub-ms timing: reading
+    monotonic_ns() creates a long int on every call, ticks_ms() does not.
+
+    Returns:
+        int: Time in microseconds.
+    """
+    return (time.monotonic_ns() // 1000) & TICKS_US_MAX
+
+def ticks_us_diff(ticks1, ticks2):
+    """
+    Returns the signed time from ticks2 to ticks1, handling wraparound.
+
+    Args:
+        ticks1 (int): Later ticks_us() time.
+        ticks2 (int): Earlier ticks_us() time.
+
+    Returns:
+        int: ticks1 - ticks2 in microseconds, negative when ticks1 is earlier.
+    """
+    diff = (ticks1 - ticks2) & TICKS_US_MAX
+    return ((diff + TICKS_US_HALFPERIOD) & TICKS_US_MAX) - TICKS_US_HALFPERIOD
+
+def ticks_us_add(ticks, delta):
+    """
+    Returns a ticks_us() time moved by delta microseconds, handling wraparound.
+
+    Args:
+        ticks (int): ticks_us() time.
+        delta (int): Microseconds to add, can be negative.
+
+    Returns:
+        int: The new ticks_us() time.
+    """
+    return (ticks + delta) & TICKS_US_MAX
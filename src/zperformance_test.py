@@ -165,4 +165,732 @@ def create_and_update_tuple_with_floats(size, num_updates):
     spi = busio.SPI(board.GP14, board.GP15)
     pixels_neopixel_spi = neopixel_spi.NeoPixel_SPI(spi, 18, brightness=100)
     time_neopixel_spi = measure_update_time(pixels_neopixel_spi, test_color)
-    print(f"neopixel_spi library update time: {time_neopixel_spi:.6f} seconds")
\ No newline at end of file
+    print(f"neopixel_spi library update time: {time_neopixel_spi:.6f} seconds")
+
+# ------------- Timing helpers -------------
+# Shared by the benchmarks below. The garbage collector is off while timing, so
+# the heap used by the calls is what they allocated.
+
+def measure_calls(fn, calls=1):
+    """
+    Calls fn calls times and returns how long it took and the heap it allocated.
+    """
+    import gc
+    import time
+
+    gc.collect()
+    free_before = gc.mem_free()
+    gc.disable()
+    start_ns = time.monotonic_ns()
+    for _ in range(calls):
+        fn()
+    elapsed_ns = time.monotonic_ns() - start_ns
+    allocated = free_before - gc.mem_free()
+    gc.enable()
+    return elapsed_ns, allocated
+
+def print_call_costs(named_fns, calls):
+    """
+    Times each (name, fn) pair and prints its time per call and heap allocated.
+    Returns the us per call by name.
+    """
+    results = {}
+    for name, fn in named_fns:
+        elapsed_ns, allocated = measure_calls(fn, calls)
+        results[name] = elapsed_ns / calls / 1000
+        print(f"{name:30} {results[name]:.2f} us per call, {allocated} bytes allocated")
+    return results
+
+# ------------- Loop note storage memory report -------------
+# Run from the REPL: import zperformance_test; zperformance_test.loop_memory_report()
+# Old storage: (note, velocity, float_seconds, padidx) tuples in two lists, copied
+# into two queues on every loop reset. New storage: notebuffer.NoteBuffer columns,
+# one entry per note with its duration.
+
+def loop_memory_report(num_notes=200):
+    import gc
+    from notebuffer import NoteBuffer
+
+    def measure(build):
+        gc.collect()
+        free_before = gc.mem_free()
+        result = build()
+        gc.collect()
+        used = free_before - gc.mem_free()
+        del result
+        return used
+
+    def build_tuples():
+        notes_on_list = []
+        notes_off_list = []
+        for i in range(num_notes):
+            notes_on_list.append((36 + i % 16, 100, i * 0.125, i % 16))
+            notes_off_list.append((36 + i % 16, 1, i * 0.125 + 0.06, i % 16))
+        return notes_on_list, notes_off_list, notes_on_list[:], notes_off_list[:]
+
+    def build_buffers():
+        notes = NoteBuffer(num_notes)
+        for i in range(num_notes):
+            notes.insert(36 + i % 16, 100, i * 125, i % 16, 60)
+        return notes
+
+    tuple_bytes = measure(build_tuples)
+    buffer_bytes = measure(build_buffers)
+    num_events = 2 * num_notes
+    print(f"Events: {num_events}")
+    print(f"Tuple lists:  {tuple_bytes} bytes, {tuple_bytes / num_events:.1f} bytes per event")
+    print(f"NoteBuffer:   {buffer_bytes} bytes, {buffer_bytes / num_events:.1f} bytes per event")
+
+
+# ------------- Loop timeline drift report -------------
+# Plays a recorded loop for many cycles against a simulated ms clock and checks
+# that every note fires at the same offset inside every lap. Runs on the device
+# REPL or on a host with the CircuitPython libs importable.
+
+class FakeTicks:
+    """
+    Stand-in for adafruit_ticks so the looper can be driven by a simulated clock.
+    """
+    def __init__(self, start_ms=1000):
+        self.now = start_ms
+
+    def ticks_ms(self):
+        return self.now
+
+    def ticks_diff(self, ticks1, ticks2):
+        return ticks1 - ticks2
+
+    def ticks_add(self, ticks, delta):
+        return ticks + delta
+
+    def ticks_us(self):
+        return int(self.now * 1000)
+
+    def ticks_us_diff(self, ticks1, ticks2):
+        return ticks1 - ticks2
+
+    def ticks_us_add(self, ticks, delta):
+        return ticks + delta
+
+REPORT_LOOP_PATTERN = ((0, 60, 120), (250, 62, 130), (500, 64, 490))  # (on ms, note, duration ms)
+
+def build_report_loop(looper, loop_length_ms=1000):
+    loop = looper.MidiLoop(loop_type="chordloop")
+    loop.allocate_note_buffers()
+    for offset_ms, note, duration_ms in REPORT_LOOP_PATTERN:
+        loop.notes.insert(note, 100, offset_ms, 0, duration_ms)
+    loop.layer_count = 1
+    loop.visible_layers = 1
+    loop.loop_length_ms = loop_length_ms
+    loop.reset_loop()
+    loop.loop_is_playing = True
+    return loop
+
+def loop_drift_report(cycles=10000, step_ms=1):
+    import looper
+
+    real_ticks = looper.ticks
+    fake_ticks = FakeTicks()
+    looper.ticks = fake_ticks
+    try:
+        loop = build_report_loop(looper)
+
+        first_lap_offsets = None
+        lap_offsets = []
+        max_offset_error = 0
+        laps = 0
+        lap_start = loop.start_timestamp
+        while laps < cycles:
+            fake_ticks.now += step_ms
+            new_notes = loop.get_new_notes()
+            if loop.start_timestamp != lap_start:
+                if first_lap_offsets is None:
+                    first_lap_offsets = lap_offsets
+                else:
+                    for expected, actual in zip(first_lap_offsets, lap_offsets):
+                        max_offset_error = max(max_offset_error, abs(actual - expected))
+                lap_offsets = []
+                lap_start = loop.start_timestamp
+                laps += 1
+            if new_notes:
+                offset = fake_ticks.ticks_diff(fake_ticks.now, loop.start_timestamp)
+                for _ in range(len(new_notes[0]) + len(new_notes[1])):
+                    lap_offsets.append(offset)
+        note_times = [loop.notes.times[i] for i in range(loop.notes.count)]
+    finally:
+        looper.ticks = real_ticks
+
+    print(f"Laps played: {laps}")
+    print(f"Note offsets per lap: {first_lap_offsets}")
+    print(f"Max in-lap offset drift: {max_offset_error} ms")
+    print(f"Stored note on times after playback: {note_times}")
+    return max_offset_error
+
+
+# ------------- Loop restart jitter / drift report -------------
+# Simulates a main loop that takes a random 1..max_step_ms per iteration and
+# records, for every lap, how late the wrap was noticed (jitter) and how far the
+# lap start has moved from start + laps * loop length (accumulated drift).
+# On the device the same per-lap error shows up as the debug line
+# "Loop lap start error (ms)".
+
+def loop_restart_report(cycles=1000, max_step_ms=8, loop_length_ms=1000):
+    import random
+    import looper
+
+    real_ticks = looper.ticks
+    fake_ticks = FakeTicks()
+    looper.ticks = fake_ticks
+    try:
+        loop = build_report_loop(looper, loop_length_ms)
+        first_start = loop.start_timestamp
+        lap_start = first_start
+        lap_errors = []
+        while len(lap_errors) < cycles:
+            fake_ticks.now += random.randint(1, max_step_ms)
+            loop.get_new_notes()
+            if loop.start_timestamp != lap_start:
+                lap_start = loop.start_timestamp
+                lap_errors.append(loop.lap_start_error_ms)
+        expected_start = first_start + cycles * loop_length_ms
+        drift_ms = fake_ticks.ticks_diff(loop.start_timestamp, expected_start)
+    finally:
+        looper.ticks = real_ticks
+
+    print(f"Laps: {cycles}, main loop step 1-{max_step_ms} ms")
+    print(f"Lap start error: max {max(lap_errors)} ms, mean {sum(lap_errors) / len(lap_errors):.2f} ms")
+    print(f"Accumulated drift after {cycles} laps: {drift_ms} ms")
+    return lap_errors
+
+
+# ------------- Loop tempo ramp report -------------
+# Plays a loop recorded at 120 BPM while the clock tempo keeps changing, and
+# compares the loop position with the beats a DAW would have played over the
+# same time. Loops only store positions at their recording tempo, so the error
+# stays under a ms no matter how many tempo changes there were.
+
+def loop_tempo_ramp_report(duration_ms=200000, change_every_ms=37, bpms=(60, 90, 120.5, 150, 179.99)):
+    import random
+    import looper
+    from clock import clock
+
+    real_ticks = looper.ticks
+    fake_ticks = FakeTicks()
+    looper.ticks = fake_ticks
+    start_bpm = clock.bpm_current
+    clock.update_all_timings(120)
+    try:
+        loop = build_report_loop(looper, loop_length_ms=2000)
+        clock.add_tempo_listener(loop)
+        beats = 0.0
+        bpm = 120
+        tempo_changes = 0
+        for ms in range(duration_ms):
+            if ms % change_every_ms == 0:
+                bpm = random.choice(bpms)
+                clock.update_all_timings(bpm)
+                tempo_changes += 1
+            loop.get_new_notes()
+            fake_ticks.now += 1
+            beats += bpm / 60000
+        position_ms = loop.get_loop_time_ms(fake_ticks.now)
+    finally:
+        clock.remove_tempo_listener(loop)
+        looper.ticks = real_ticks
+        clock.update_all_timings(start_bpm)
+
+    expected_ms = (beats * 500) % loop.loop_length_ms  # 500 ms per beat at 120 BPM
+    print(f"Tempo changes: {tempo_changes}")
+    print(f"Loop position: {position_ms} ms, expected {expected_ms:.2f} ms")
+    return position_ms - expected_ms
+
+
+# ------------- MIDI output path benchmark -------------
+# Sends the same chords (note ons, then note offs a main loop iteration later)
+# through adafruit_midi message objects, one write per message, and through the
+# raw byte batch in midi.py, one write per port per iteration. The ports drop the
+# bytes. Reports time per message, heap allocated and port writes for each path.
+
+class NullMidiPort:
+    """
+    Stand-in for a USB MIDI port or the UART that only counts writes and bytes.
+    """
+    def __init__(self):
+        self.writes = 0
+        self.bytes_written = 0
+
+    def write(self, buf, num_bytes=None):
+        self.writes += 1
+        self.bytes_written += len(buf) if num_bytes is None else num_bytes
+        return self.bytes_written
+
+def midi_output_benchmark(num_chords=250, chord_size=4):
+    import adafruit_midi
+    from adafruit_midi.note_on import NoteOn
+    from adafruit_midi.note_off import NoteOff
+    import timebase as ticks
+    import midi
+
+    usb_port = NullMidiPort()
+    uart_port = NullMidiPort()
+
+    def run(send_note_on, send_note_off, end_iteration):
+        usb_port.writes = uart_port.writes = 0
+
+        def play_chords():
+            for i in range(num_chords):
+                root = 36 + (i & 31)
+                for offset in range(chord_size):
+                    send_note_on(root + offset * 4, 100)
+                end_iteration()
+                for offset in range(chord_size):
+                    send_note_off(root + offset * 4)
+                end_iteration()
+
+        elapsed_ns, allocated = measure_calls(play_chords)
+        return elapsed_ns, allocated, usb_port.writes + uart_port.writes
+
+    usb_object_midi = adafruit_midi.MIDI(midi_out=usb_port, out_channel=0)
+    uart_object_midi = adafruit_midi.MIDI(midi_out=uart_port, out_channel=0)
+
+    def object_note_on(note, velocity):
+        usb_object_midi.send(NoteOn(note, velocity))
+        uart_object_midi.send(NoteOn(note, velocity))
+
+    def object_note_off(note):
+        usb_object_midi.send(NoteOff(note, 1))
+        uart_object_midi.send(NoteOff(note, 1))
+
+    def no_flush():
+        pass
+
+    routing = midi.midi_routing
+    real_usb_out, real_aux_out = routing.usb_out, routing.aux_out
+    routing.usb_out, routing.aux_out = usb_port, uart_port
+    try:
+        object_ns, object_bytes, object_writes = run(object_note_on, object_note_off, no_flush)
+        raw_ns, raw_bytes, raw_writes = run(midi.send_midi_note_on, midi.send_midi_note_off, midi.flush_midi_out)
+        # The benchmark outruns the DIN wire rate, write what is still waiting
+        uart_depth = sum(midi.midi_out_batch.aux_queue_counts)
+        midi.midi_out_batch.drain_aux(uart_port, ticks.ticks_ms(), True)
+    finally:
+        routing.usb_out, routing.aux_out = real_usb_out, real_aux_out
+
+    num_messages = 2 * num_chords * chord_size
+    print(f"Messages: {num_messages} in chords of {chord_size}, sent to USB and UART")
+    print(f"UART bytes: {3 * num_messages} plain, {midi.midi_out_batch.aux_bytes_written} with running status")
+    print(f"UART queue: {midi.midi_out_batch.aux_max_depth} bytes max, {uart_depth} bytes left at the end, {midi.midi_out_batch.aux_max_wait_ms} ms worst wait")
+    print(f"adafruit_midi objects: {object_ns / num_messages / 1000:.1f} us per message, {object_bytes} bytes allocated, {object_writes} port writes")
+    print(f"Raw byte batch:        {raw_ns / num_messages / 1000:.1f} us per message, {raw_bytes} bytes allocated, {raw_writes} port writes")
+    return object_ns, raw_ns
+
+
+# ------------- MIDI DIN full queue check -------------
+# Sends bursts of note ONs with clock bytes between them, faster than the DIN
+# wire rate, then the matching note OFFs, so the UART priority queues fill up
+# and are written without a budget. Before the first burst the clock and note
+# OFF queues are filled to the size of one UART write, so the forced write
+# that makes room is used up by them and the full note ON queue has to be
+# written on its own. Decodes the running status stream written to the UART
+# and checks that every note ON it holds was ended, like on USB.
+
+class RecordingMidiPort(NullMidiPort):
+    """
+    NullMidiPort that also keeps every byte written.
+    """
+    def __init__(self):
+        super().__init__()
+        self.stream = bytearray()
+
+    def write(self, buf, num_bytes=None):
+        self.stream.extend(buf if num_bytes is None else buf[:num_bytes])
+        return super().write(buf, num_bytes)
+
+def get_sounding_notes(stream):
+    """
+    Decodes a MIDI byte stream with running status and returns the (channel, note) still on.
+    """
+    sounding = set()
+    status = 0
+    data = []
+    for byte in stream:
+        if byte >= 0xF8:
+            continue
+        if byte & 0x80:
+            status = byte
+            data = []
+            continue
+        data.append(byte)
+        num_data = 1 if status & 0xF0 in (0xC0, 0xD0) else 2
+        if len(data) < num_data:
+            continue
+        message_type = status & 0xF0
+        if message_type == 0x90 and data[1]:
+            sounding.add((status & 0x0F, data[0]))
+        elif message_type in (0x80, 0x90):
+            sounding.discard((status & 0x0F, data[0]))
+        data = []
+    return sounding
+
+def get_note_ons(stream, skip_channel=None):
+    """
+    Decodes a MIDI byte stream with running status and returns the (channel, note) of every note ON.
+    """
+    note_ons = []
+    status = 0
+    data = []
+    for byte in stream:
+        if byte >= 0xF8:
+            continue
+        if byte & 0x80:
+            status = byte
+            data = []
+            continue
+        data.append(byte)
+        if len(data) < (1 if status & 0xF0 in (0xC0, 0xD0) else 2):
+            continue
+        if status & 0xF0 == 0x90 and data[1] and status & 0x0F != skip_channel:
+            note_ons.append((status & 0x0F, data[0]))
+        data = []
+    return note_ons
+
+def midi_din_queue_full_check(num_bursts=40, burst_size=20):
+    import timebase as ticks
+    import midi
+
+    usb_port = RecordingMidiPort()
+    uart_port = RecordingMidiPort()
+    batch = midi.midi_out_batch
+    routing = midi.midi_routing
+    real_usb_out, real_aux_out = routing.usb_out, routing.aux_out
+    routing.usb_out, routing.aux_out = usb_port, uart_port
+    overflows_before = batch.aux_queue_overflows
+    fill_channel = 15
+    try:
+        midi.clear_all_notes()
+        while sum(batch.aux_queue_counts):
+            batch.drain_aux(uart_port, ticks.ticks_ms(), True)
+        uart_port.stream = bytearray()
+
+        # Every note on fill_channel sounding, then their OFFs and clock bytes waiting
+        for note in range(128):
+            batch.queue_bytes(midi.NOTE_ON_STATUS | fill_channel, note, 100, midi.PRIORITY_NOTE_ON)
+            if note % 32 == 31:
+                batch.flush()
+        while sum(batch.aux_queue_counts):
+            batch.drain_aux(uart_port, ticks.ticks_ms(), True)
+        fill_bytes = len(batch.aux_data)
+        clock_queue = batch.aux_queues[midi.PRIORITY_REALTIME]
+        off_queue = batch.aux_queues[midi.PRIORITY_NOTE_OFF]
+        for idx in range(fill_bytes):
+            clock_queue[idx] = midi.TIMING_CLOCK_BYTE
+        for note in range(fill_bytes // 3):
+            off_queue[note * 3] = midi.NOTE_OFF_STATUS | fill_channel
+            off_queue[note * 3 + 1] = note
+            off_queue[note * 3 + 2] = 1
+        batch.aux_queue_counts[midi.PRIORITY_REALTIME] = fill_bytes
+        batch.aux_queue_counts[midi.PRIORITY_NOTE_OFF] = fill_bytes // 3 * 3
+        batch.aux_waiting_since[midi.PRIORITY_REALTIME] = ticks.ticks_ms()
+        batch.aux_waiting_since[midi.PRIORITY_NOTE_OFF] = ticks.ticks_ms()
+        usb_port.stream = bytearray()
+
+        for note_off in (False, True):
+            for burst in range(num_bursts):
+                # A different channel or note range per burst, so no note ON is a duplicate
+                channel = burst % fill_channel
+                for idx in range(burst_size):
+                    note = 36 + (burst // fill_channel) * burst_size + idx
+                    if note_off:
+                        batch.queue_bytes(midi.NOTE_OFF_STATUS | channel, note, 1, midi.PRIORITY_NOTE_OFF)
+                    else:
+                        batch.queue_bytes(midi.NOTE_ON_STATUS | channel, note, 100, midi.PRIORITY_NOTE_ON)
+                    if idx % 4 == 0:
+                        batch.add_realtime(midi.TIMING_CLOCK_BYTE)
+                batch.flush()
+        while sum(batch.aux_queue_counts):
+            batch.drain_aux(uart_port, ticks.ticks_ms(), True)
+    finally:
+        routing.usb_out, routing.aux_out = real_usb_out, real_aux_out
+        midi.active_notes.clear_channel(fill_channel)
+
+    overflows = batch.aux_queue_overflows - overflows_before
+    usb_sounding = get_sounding_notes(usb_port.stream)
+    uart_sounding = get_sounding_notes(uart_port.stream)
+    usb_note_ons = get_note_ons(usb_port.stream)
+    uart_note_ons = get_note_ons(uart_port.stream, fill_channel)
+    print(f"Bursts: {num_bursts} of {burst_size} notes, {overflows} UART queue overflows")
+    print(f"Note ONs: {len(usb_note_ons)} on USB, {len(uart_note_ons)} on UART")
+    print(f"Notes left on: {len(usb_sounding)} on USB, {len(uart_sounding)} on UART")
+    return overflows > 0 and uart_note_ons == usb_note_ons and not usb_sounding and not uart_sounding
+
+# ------------- Note retrigger check -------------
+# The looper holds a note, a pad retriggers it, then both let go before the
+# batch is flushed. Checks that the note ends on the wire and in active_notes.
+
+def note_retrigger_check(note=60):
+    import midi
+
+    usb_port = RecordingMidiPort()
+    routing = midi.midi_routing
+    real_usb_out, real_aux_out = routing.usb_out, routing.aux_out
+    routing.usb_out, routing.aux_out = usb_port, None
+    try:
+        midi.clear_all_notes()
+        usb_port.stream = bytearray()
+        midi.send_midi_note_on(note, 100, midi.SOURCE_LOOPER)
+        midi.flush_midi_out()
+        midi.send_midi_note_on(note, 100, midi.SOURCE_LIVE)
+        midi.send_midi_note_off(note, midi.SOURCE_LOOPER)
+        midi.send_midi_note_off(note, midi.SOURCE_LIVE)
+        midi.flush_midi_out()
+    finally:
+        routing.usb_out, routing.aux_out = real_usb_out, real_aux_out
+
+    sounding = get_sounding_notes(usb_port.stream)
+    channel = midi.s.midi_channel_out & 0x0F
+    print(f"Wire: {' '.join(f'{byte:02x}' for byte in usb_port.stream)}")
+    print(f"Notes left on: {len(sounding)} on the wire, {int(midi.active_notes.is_on(channel, note))} in active_notes")
+    return not sounding and not midi.active_notes.is_on(channel, note)
+
+# ------------- Transport position check -------------
+# Moves the transport to every Song Position Pointer value in steps, checks that
+# bar, beat and tick add back up to the same position, then plays clock ticks
+# after a Continue and checks the position and the next division boundaries.
+
+def transport_position_check(step=7, num_ticks=500):
+    from clock import Transport
+
+    transport = Transport()
+    positions = range(0, 16384, step)  # SPP is 14 bits
+    errors = 0
+    for sixteenths in positions:
+        transport.set_song_position(sixteenths)
+        bar, beat, tick = transport.get_bar(), transport.get_beat(), transport.get_tick()
+        song_ticks = (bar * transport.beats_per_bar + beat) * Transport.TICKS_PER_QUARTER_NOTE + tick
+        if song_ticks // Transport.TICKS_PER_SIXTEENTH != sixteenths or tick % Transport.TICKS_PER_SIXTEENTH:
+            errors += 1
+
+    start_sixteenths = 37
+    transport.set_song_position(start_sixteenths)
+    transport.continue_play(0)
+    eighth_ticks = transport.get_division_ticks("1/8")
+    for tick in range(num_ticks):
+        transport.tick(tick * 20)
+        expected = start_sixteenths * Transport.TICKS_PER_SIXTEENTH + tick
+        boundary = transport.get_next_boundary_tick(eighth_ticks)
+        if transport.song_ticks != expected or boundary % eighth_ticks or not 0 <= boundary - expected < eighth_ticks:
+            errors += 1
+    transport.stop()
+
+    print(f"SPP round trips: {len(positions)}, clock ticks: {num_ticks}, errors: {errors}")
+    return not errors
+
+# ------------- Tempo tracker accuracy report -------------
+# Feeds synthesized MIDI clock streams through the tempo tracker: steady and
+# fractional tempos, then a ramp. Tick times are in us with up to jitter_ms of
+# random lateness, like ticks read by the main loop. Reports how many ticks it
+# takes to stay within 0.1 BPM and the worst error after lock_ticks ticks.
+
+def tempo_tracker_report(bpms=(60, 97.3, 120, 133.33, 174.65), seconds=20, jitter_ms=1, lock_ticks=None):
+    import random
+    import constants
+    from clock import TempoTracker
+
+    if lock_ticks is None:
+        lock_ticks = constants.CLOCK_LOCK_TICKS
+
+    def run(bpm_at, num_ticks, settled_tick=None):
+        tracker = TempoTracker(lock_ticks)
+        tick_time_ms = 1000.0
+        last_bad_tick = 0
+        max_error = 0.0
+        settled_error = 0.0
+        for tick in range(num_ticks):
+            bpm = bpm_at(tick)
+            tick_time_ms += 2500 / bpm
+            locked = tracker.add_tick(int((tick_time_ms + random.random() * jitter_ms) * 1000))
+            error = abs(tracker.get_bpm() - bpm) if locked else 1000.0
+            if error >= 0.1:
+                last_bad_tick = tick + 1
+            if tick >= lock_ticks and error > max_error:
+                max_error = error
+            if settled_tick is not None and tick >= settled_tick and error > settled_error:
+                settled_error = error
+        if settled_tick is not None:
+            return settled_error, max_error
+        return last_bad_tick, max_error
+
+    worst_error = 0.0
+    print(f"Lock ticks: {lock_ticks}, tick jitter 0-{jitter_ms} ms")
+    for bpm in bpms:
+        num_ticks = int(seconds * bpm * 24 / 60)
+        lock_tick, max_error = run(lambda tick: bpm, num_ticks)
+        worst_error = max(worst_error, max_error)
+        print(f"{bpm} BPM: within 0.1 BPM after {lock_tick} ticks, max error {max_error:.3f} BPM")
+
+    # 100 to 140 BPM over 30 seconds, about 1.3 BPM per second
+    ramp_ticks = 30 * 120 * 24 // 60
+    # The period change is only followed once locked, the lag settles over a few lock times
+    settled_tick = 4 * lock_ticks
+    settled_error, max_error = run(lambda tick: 100 + 40 * tick / ramp_ticks, ramp_ticks, settled_tick)
+    print(f"Ramp 100-140 BPM over 30 s: max error {max_error:.3f} BPM after the first {lock_ticks} ticks, {settled_error:.3f} BPM after {settled_tick}")
+    return worst_error
+
+
+# ------------- MIDI clock out jitter report -------------
+# Runs the internal MIDI clock through a simulated main loop: random step times
+# between the update_midi_clock() calls in code.py, a 1-3 ms slow section every
+# 20 ms, and a display flush every 100 ms. The flush is either one 3 ms page per
+# iteration, waiting like code.py when a tick is close, or the whole 25 ms screen
+# at once. Reports how far ticks went out from their ideal time and the spread
+# of the intervals between them.
+
+class MicrosecondFakeTicks(FakeTicks):
+    """
+    FakeTicks whose simulated time has fractions of a ms, read as whole ms like ticks_ms().
+    """
+    def ticks_ms(self):
+        return int(self.now)
+
+class TickTimePort:
+    """
+    Stand-in for a MIDI port that records the simulated time of every clock tick written.
+    """
+    def __init__(self, fake_ticks):
+        self.fake_ticks = fake_ticks
+        self.tick_times = []
+
+    def write(self, buf, num_bytes=None):
+        if buf[0] == 0xF8:
+            self.tick_times.append(self.fake_ticks.now)
+
+def midi_clock_jitter_report(bpm=120, seconds=30, paged_display=True):
+    import random
+    import constants
+    import midi
+
+    fake_ticks = MicrosecondFakeTicks()
+    port = TickTimePort(fake_ticks)
+    real_ticks = midi.ticks
+    routing = midi.midi_routing
+    real_usb_out, real_aux_out = routing.usb_out, routing.aux_out
+    midi.ticks = fake_ticks
+    routing.usb_out, routing.aux_out = port, None
+    start_bpm = midi.clock.bpm_current
+    midi.clock.update_all_timings(bpm)
+    try:
+        clock_out = midi.midi_clock_out
+        start_ms = fake_ticks.now
+        clock_out.start(fake_ticks.ticks_us())
+        next_slow_ms = start_ms
+        next_display_ms = start_ms
+        display_pages_left = 0
+        end_ms = start_ms + seconds * 1000
+        while fake_ticks.now < end_ms:
+            # Steps of one main loop iteration, update_midi_clock() after each.
+            # Slow steps are skipped when the next tick is close, like in code.py.
+            steps = [("fast", random.uniform(0.1, 0.4))]
+            if fake_ticks.now >= next_slow_ms:
+                steps.append(("slow", random.uniform(1.0, 3.0)))
+            steps += [("fast", random.uniform(0.2, 0.8)), ("fast", random.uniform(0.2, 0.8)), ("fast", random.uniform(0.1, 0.4))]
+            if fake_ticks.now >= next_display_ms:
+                display_pages_left = 8
+                next_display_ms += 100
+            if display_pages_left:
+                steps.append(("display", 3.0 if paged_display else 25.0))
+            for step, step_ms in steps:
+                if step != "fast" and paged_display:
+                    if midi.get_ms_to_midi_clock_tick() <= constants.MIDI_CLOCK_GUARD_MS:
+                        continue
+                if step == "slow":
+                    next_slow_ms += 20
+                elif step == "display":
+                    display_pages_left = display_pages_left - 1 if paged_display else 0
+                fake_ticks.now += step_ms
+                midi.update_midi_clock()
+        clock_out.stop()
+    finally:
+        midi.ticks = real_ticks
+        routing.usb_out, routing.aux_out = real_usb_out, real_aux_out
+        midi.clock.update_all_timings(start_bpm)
+
+    tick_ms = 2500 / bpm
+    times = port.tick_times
+    late = sorted(time_ms - (start_ms + idx * tick_ms) for idx, time_ms in enumerate(times))
+    jitter = [abs(late_ms) for late_ms in late]
+    intervals = [times[idx + 1] - times[idx] for idx in range(len(times) - 1)]
+    mean_interval = sum(intervals) / len(intervals)
+    print(f"{bpm} BPM, {'paged' if paged_display else 'full screen'} display flush: {len(times)} ticks, ideal interval {tick_ms:.3f} ms")
+    print(f"Off ideal time: min {late[0]:.2f} ms, median {late[len(late) // 2]:.2f} ms, max {late[-1]:.2f} ms")
+    print(f"Interval: mean {mean_interval:.3f} ms, min {min(intervals):.2f} ms, max {max(intervals):.2f} ms")
+    return max(jitter)
+
+
+# ------------- Time source benchmark -------------
+# Cost per call of the time sources: float time.monotonic(), time.monotonic_ns(),
+# and the timebase ticks in ms and us, with a wraparound-safe diff. Reports time
+# per call and heap allocated over all calls.
+
+def time_source_benchmark(calls=5000):
+    import time
+    import timebase
+
+    start_ms = timebase.ticks_ms()
+    start_us = timebase.ticks_us()
+
+    def monotonic_diff():
+        return time.monotonic() - 1.0
+
+    def ticks_ms_diff():
+        return timebase.ticks_diff(timebase.ticks_ms(), start_ms)
+
+    def ticks_us_diff():
+        return timebase.ticks_us_diff(timebase.ticks_us(), start_us)
+
+    sources = (
+        ("time.monotonic()", time.monotonic),
+        ("time.monotonic_ns()", time.monotonic_ns),
+        ("timebase.ticks_ms()", timebase.ticks_ms),
+        ("timebase.ticks_us()", timebase.ticks_us),
+        ("monotonic() - t", monotonic_diff),
+        ("ticks_diff(ticks_ms(), t)", ticks_ms_diff),
+        ("ticks_us_diff(ticks_us(), t)", ticks_us_diff),
+    )
+    return print_call_costs(sources, calls)
+
+
+# ------------- Note duration lookup benchmark -------------
+# Cost per call of a note length lookup: building the note type dict on every
+# call like the clock used to, against the clock duration tables that are only
+# rebuilt on tempo changes. Reports time per call and heap allocated over all calls.
+
+def note_duration_benchmark(calls=5000, note_type="1/8"):
+    from clock import clock
+
+    def dict_per_call():
+        sixteenth = clock.sixteenthnote_duration
+        note_times_seconds = {
+            "whole": clock.wholetime_duration, "1": clock.wholetime_duration,
+            "half": clock.halfnote_duration, "1/2": clock.halfnote_duration,
+            "quarter": clock.quarternote_duration, "1/4": clock.quarternote_duration,
+            "eighth": clock.eighthnote_duration, "1/8": clock.eighthnote_duration,
+            "sixteenth": sixteenth, "1/16": sixteenth,
+            "thirtysecond": sixteenth / 2, "1/32": sixteenth / 2,
+            "sixtyfourth": sixteenth / 4, "1/64": sixteenth / 4,
+        }
+        return int(note_times_seconds.get(note_type, clock.quarternote_duration) * 1000)
+
+    def table_by_name():
+        return clock.get_note_duration_ms(note_type)
+
+    division_idx = clock.get_note_division_idx(note_type)
+
+    def table_by_idx():
+        return clock.duration_ms[division_idx]
+
+    lookups = (
+        ("dict built per call", dict_per_call),
+        ("get_note_duration_ms()", table_by_name),
+        ("duration_ms[idx]", table_by_idx),
+    )
+    return print_call_costs(lookups, calls)